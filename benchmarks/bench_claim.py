@@ -0,0 +1,116 @@
+"""Benchmark of the claim throughput for a growing number of workers.
+
+Every worker process polls the same table with `query_for_work_batch` until
+no work is left. For each worker count the number of claimed processes per
+second and the number of polls that came back empty although work was still
+available (lost claims) are reported as JSON.
+
+    python benchmarks/bench_claim.py --workers 1 2 4 8
+    python benchmarks/bench_claim.py --uri postgresql://localhost/bench --strategy cas skip_locked
+"""
+import argparse
+import multiprocessing
+import time
+
+from common import create_engine, default_uris, dialect_name, drop_tables, write_results
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+
+
+CONFIG_NODE = DOANodeConfig(name='claim', version='0.0.0')
+
+
+def build_datalayer(name, claim_strategy):
+    doa_datalayer = DOADataLayer(name, claim_strategy=claim_strategy)
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(CONFIG_NODE)
+    return doa_datalayer
+
+
+def worker(uri, name, claim_strategy, batch_size, start_event, queue):
+    doa_datalayer = build_datalayer(name, claim_strategy)
+    claimed, lost = 0, 0
+    with doa_datalayer(create_engine(uri)):
+        start_event.wait()
+        while True:
+            processing_contexts = doa_datalayer.query_for_work_batch(CONFIG_NODE, batch_size)
+            if len(processing_contexts) == 0:
+                if doa_datalayer.query_for_work(CONFIG_NODE, claim=False) is None:
+                    break
+                lost += 1
+                continue
+            for processing_context in processing_contexts:
+                with doa_datalayer.process(processing_context):
+                    pass
+            claimed += len(processing_contexts)
+    queue.put((claimed, lost))
+
+
+def run(uri, claim_strategy, n_workers, n_processes, batch_size):
+    name = f'bench_claim_{claim_strategy}_{n_workers}'
+    engine = create_engine(uri)
+    doa_datalayer = build_datalayer(name, claim_strategy)
+    drop_tables(doa_datalayer, engine)
+    with doa_datalayer(engine):
+        doa_datalayer.add_processes({} for _ in range(n_processes))
+    engine.dispose()
+    start_event = multiprocessing.Event()
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker,
+                                       args=(uri, name, claim_strategy, batch_size, start_event, queue))
+               for _ in range(n_workers)]
+    for w in workers:
+        w.start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    start_event.set()
+    results = [queue.get() for _ in workers]
+    duration = time.perf_counter() - start
+    for w in workers:
+        w.join()
+    claimed = sum(r[0] for r in results)
+    engine = create_engine(uri)
+    drop_tables(doa_datalayer, engine)
+    engine.dispose()
+    return {'benchmark': 'claim',
+            'dialect': dialect_name(uri),
+            'strategy': claim_strategy,
+            'workers': n_workers,
+            'batch_size': batch_size,
+            'claimed': claimed,
+            'lost_claims': sum(r[1] for r in results),
+            'duration': duration,
+            'claims_per_second': claimed / duration}
+
+
+def benchmark(uris=None, quick=False, strategies=None, workers=None, n_processes=None, batch_size=1):
+    workers = workers or ([1, 2] if quick else [1, 2, 4, 8])
+    n_processes = n_processes or (100 if quick else 2000)
+    results = []
+    for uri in default_uris('bench_claim', uris):
+        uri_strategies = strategies
+        if uri_strategies is None:
+            uri_strategies = ['cas', 'skip_locked'] if uri.startswith('postgresql') else ['cas']
+        results.extend(run(uri, strategy, n_workers, n_processes, batch_size)
+                       for strategy in uri_strategies
+                       for n_workers in workers)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', nargs='+', default=None,
+                        help='Database uris. Defaults to SQLite and PostgreSQL if available.')
+    parser.add_argument('--strategy', nargs='+', default=None, help='Claim strategies to compare.')
+    parser.add_argument('--workers', nargs='+', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmark runs.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    write_results(benchmark(args.uri, args.quick, args.strategy, args.workers, args.processes, args.batch_size),
+                  args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark of building and sorting large DAGs.
+
+For every shape and size the time to build the DAG, to sort it into
+topological levels, to find its components and to serialize it with
+`DAG.to_dict` is reported as JSON. Shapes:
+
+    chain:   n0 >> n1 >> ... (one node per level)
+    layered: layers of `--width` nodes, each connected to 3 random nodes of the previous layer
+    forest:  independent binary trees of 1000 nodes (many components)
+
+    python benchmarks/bench_dag.py --nodes 10000 100000
+"""
+import argparse
+import random
+
+from common import timed, write_results
+
+from doa_pipeline.dag import DAG, Node
+
+
+def build(shape, n_nodes, width, seed=1337):
+    rng = random.Random(seed)
+    with DAG(f'bench_{shape}') as dag:
+        nodes = [Node(f'n{i}') for i in range(n_nodes)]
+        if shape == 'chain':
+            for start, stop in zip(nodes[:-1], nodes[1:]):
+                start >> stop
+        elif shape == 'layered':
+            for i in range(width, n_nodes):
+                layer_start = (i // width - 1) * width
+                for j in rng.sample(range(layer_start, layer_start + width), min(3, width)):
+                    nodes[j] >> nodes[i]
+        elif shape == 'forest':
+            for i in range(n_nodes):
+                if i % 1000 != 0:
+                    tree_start = i - i % 1000
+                    nodes[tree_start + (i - tree_start - 1) // 2] >> nodes[i]
+        else:
+            raise ValueError(f'Unknown shape "{shape}"')
+    return dag
+
+
+def run(shape, n_nodes, width):
+    dag, build_duration = timed(lambda: build(shape, n_nodes, width))
+    levels, levels_duration = timed(lambda: dag.levels)
+    components, components_duration = timed(lambda: dag.components)
+    _, to_dict_duration = timed(dag.to_dict)
+    return {'benchmark': 'dag',
+            'shape': shape,
+            'nodes': n_nodes,
+            'edges': len(dag.edges),
+            'levels': len(levels),
+            'max_level_width': max(len(level) for level in levels),
+            'components': len({id(c) for c in components.values()}),
+            'build_duration': build_duration,
+            'levels_duration': levels_duration,
+            'components_duration': components_duration,
+            'to_dict_duration': to_dict_duration}
+
+
+def benchmark(quick=False, shapes=('chain', 'layered', 'forest'), nodes=None, width=100):
+    nodes = nodes or ([2000] if quick else [10000, 30000, 100000])
+    return [run(shape, n_nodes, width) for shape in shapes for n_nodes in nodes]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', nargs='+', type=int, default=None)
+    parser.add_argument('--shape', nargs='+', default=['chain', 'layered', 'forest'])
+    parser.add_argument('--width', type=int, default=100, help='Nodes per layer of the "layered" shape.')
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmark runs.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    write_results(benchmark(args.quick, args.shape, args.nodes, args.width), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark of adding processes.
+
+Reports the processes added per second with `add_process` (one insert
+and commit per process) and with `add_processes` for several chunk sizes.
+
+    python benchmarks/bench_ingest.py --processes 100000
+"""
+import argparse
+
+from common import create_engine, default_uris, dialect_name, drop_tables, timed, write_results
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+
+
+CONTEXT = {'path': '/data/run_000123/file_000456.h5', 'values': [1, 2, 3]}
+
+
+def build_datalayer(name):
+    doa_datalayer = DOADataLayer(name)
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(DOANodeConfig(name='ingest', version='0.0.0'))
+    return doa_datalayer
+
+
+def run(uri, method, n_processes, chunk_size=None):
+    engine = create_engine(uri)
+    doa_datalayer = build_datalayer('bench_ingest')
+    drop_tables(doa_datalayer, engine)
+    with doa_datalayer(engine):
+        if method == 'add_process':
+            _, duration = timed(lambda: [doa_datalayer.add_process(CONTEXT) for _ in range(n_processes)])
+        else:
+            _, duration = timed(lambda: doa_datalayer.add_processes((CONTEXT for _ in range(n_processes)),
+                                                                    chunk_size=chunk_size))
+    drop_tables(doa_datalayer, engine)
+    engine.dispose()
+    return {'benchmark': 'ingest',
+            'dialect': dialect_name(uri),
+            'method': method,
+            'chunk_size': chunk_size,
+            'processes': n_processes,
+            'duration': duration,
+            'processes_per_second': n_processes / duration}
+
+
+def benchmark(uris=None, quick=False, n_processes=None):
+    n_processes = n_processes or (1000 if quick else 100000)
+    results = []
+    for uri in default_uris('bench_ingest', uris):
+        results.append(run(uri, 'add_process', min(n_processes, 200 if quick else 5000)))
+        for chunk_size in [100, 1000, 10000]:
+            results.append(run(uri, 'add_processes', n_processes, chunk_size))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', nargs='+', default=None,
+                        help='Database uris. Defaults to SQLite and PostgreSQL if available.')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmark runs.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    write_results(benchmark(args.uri, args.quick, args.processes), args.output)
+
+
+if __name__ == '__main__':
+    main()
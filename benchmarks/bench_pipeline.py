@@ -0,0 +1,118 @@
+"""End-to-end benchmark of the worker runtime.
+
+Processes of a DAG whose nodes do nothing are run by `doa_pipeline.worker`
+with a growing number of worker processes until no work is left. For each
+shape and worker count the node executions and finished processes per
+second are reported. Shapes:
+
+    chain:   a >> b >> c >> d
+    fan_out: root >> leaf_0 ... leaf_7
+    diamond: a >> (b, c) >> d
+
+    python benchmarks/bench_pipeline.py --workers 1 2 4 8 16 32
+"""
+import argparse
+import time
+
+import sqlalchemy as sa
+
+from common import create_engine, default_uris, dialect_name, drop_tables, write_results
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, ProcessStatus
+from doa_pipeline.worker import Worker
+
+
+def noop(processing_context, result_container):
+    pass
+
+
+def build_datalayer(name, shape, ready_queue):
+    doa_datalayer = DOADataLayer(name, ready_queue=ready_queue)
+    if shape == 'chain':
+        names = ['a', 'b', 'c', 'd']
+    elif shape == 'fan_out':
+        names = ['root'] + [f'leaf_{i}' for i in range(8)]
+    elif shape == 'diamond':
+        names = ['a', 'b', 'c', 'd']
+    else:
+        raise ValueError(f'Unknown shape "{shape}"')
+    node_cfgs = [DOANodeConfig(name=n, version='0.0.0') for n in names]
+    with doa_datalayer.dag:
+        nodes = [doa_datalayer.create_node(node_cfg) for node_cfg in node_cfgs]
+        if shape == 'chain':
+            for start, stop in zip(nodes[:-1], nodes[1:]):
+                start >> stop
+        elif shape == 'fan_out':
+            for leaf in nodes[1:]:
+                nodes[0] >> leaf
+        else:
+            nodes[0] >> nodes[1]
+            nodes[0] >> nodes[2]
+            nodes[1] >> nodes[3]
+            nodes[2] >> nodes[3]
+    for node_cfg in node_cfgs:
+        doa_datalayer.register(node_cfg, noop)
+    return doa_datalayer
+
+
+def run(uri, shape, n_workers, n_processes, batch_size, ready_queue):
+    engine = create_engine(uri)
+    doa_datalayer = build_datalayer(f'bench_pipeline_{shape}', shape, ready_queue)
+    drop_tables(doa_datalayer, engine)
+    with doa_datalayer(engine):
+        doa_datalayer.add_processes({} for _ in range(n_processes))
+    engine.dispose()
+    worker = Worker(doa_datalayer, engine=uri, processes=n_workers, batch_size=batch_size,
+                    poll_interval=0.05, stop_when_idle=True, start_method='fork')
+    start = time.perf_counter()
+    worker.run()
+    duration = time.perf_counter() - start
+    engine = create_engine(uri)
+    table = doa_datalayer.table
+    with engine.connect() as connection:
+        finished = connection.execute(sa.select([sa.func.count()]).select_from(table)
+                                      .where(table.c.status == ProcessStatus.SUCCESS.value)).scalar()
+    drop_tables(doa_datalayer, engine)
+    engine.dispose()
+    n_nodes = len(doa_datalayer.node_functions)
+    return {'benchmark': 'pipeline',
+            'dialect': dialect_name(uri),
+            'shape': shape,
+            'workers': n_workers,
+            'batch_size': batch_size,
+            'ready_queue': ready_queue,
+            'processes': n_processes,
+            'finished': finished,
+            'duration': duration,
+            'processes_per_second': finished / duration,
+            'nodes_per_second': finished * n_nodes / duration}
+
+
+def benchmark(uris=None, quick=False, shapes=('chain', 'fan_out', 'diamond'), workers=None,
+              n_processes=None, batch_size=10, ready_queue=False):
+    workers = workers or ([1, 2] if quick else [1, 2, 4, 8, 16, 32])
+    n_processes = n_processes or (50 if quick else 2000)
+    return [run(uri, shape, n_workers, n_processes, batch_size, ready_queue)
+            for uri in default_uris('bench_pipeline', uris)
+            for shape in shapes
+            for n_workers in workers]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', nargs='+', default=None,
+                        help='Database uris. Defaults to SQLite and PostgreSQL if available.')
+    parser.add_argument('--shape', nargs='+', default=['chain', 'fan_out', 'diamond'])
+    parser.add_argument('--workers', nargs='+', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--ready-queue', action='store_true')
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmark runs.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    write_results(benchmark(args.uri, args.quick, args.shape, args.workers, args.processes,
+                            args.batch_size, args.ready_queue), args.output)
+
+
+if __name__ == '__main__':
+    main()
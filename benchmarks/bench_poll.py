@@ -0,0 +1,109 @@
+"""Benchmark of the latency of querying for work against large tables.
+
+The table holds `--rows` processes of the chain a >> b >> c of which
+`--waiting` percent are waiting for node "a", the others are finished.
+Reported are the latency percentiles of single-node polls ([a]) and
+multi-node polls ([c, b, a]), without claiming (`claim=False`) and
+claiming one process per poll, with and without the ready queue.
+
+    python benchmarks/bench_poll.py --rows 10000 1000000
+"""
+import argparse
+import time
+
+import sqlalchemy as sa
+
+from common import create_engine, default_uris, dialect_name, drop_tables, percentiles, write_results
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, NodeStatus, ProcessStatus
+
+
+NODES = [DOANodeConfig(name=name, version='0.0.0') for name in ['a', 'b', 'c']]
+
+
+def build_datalayer(name, ready_queue):
+    doa_datalayer = DOADataLayer(name, ready_queue=ready_queue)
+    with doa_datalayer.dag:
+        a, b, c = [doa_datalayer.create_node(node_cfg) for node_cfg in NODES]
+        a >> b
+        b >> c
+    return doa_datalayer
+
+
+def populate(doa_datalayer, n_rows, waiting_every):
+    """Add `n_rows` processes and finish all but every `waiting_every`-th."""
+    ids = doa_datalayer.add_processes(({} for _ in range(n_rows)), chunk_size=10000)
+    table = doa_datalayer.table
+    finished = sa.and_(table.c.id >= ids[0], table.c.id % waiting_every != 0)
+    doa_datalayer._active_session.execute(
+        table.update()
+        .values(status=ProcessStatus.SUCCESS.value,
+                node_status=NodeStatus.SUCCESS.value * (len(NODES) + 1))
+        .where(finished))
+    if doa_datalayer.ready_queue:
+        ready_table = doa_datalayer._ready_table
+        doa_datalayer._active_session.execute(ready_table.delete().where(ready_table.c.id % waiting_every != 0))
+    doa_datalayer._active_session.commit()
+
+
+def measure(doa_datalayer, node_cfgs, n_polls, claim):
+    durations = []
+    for _ in range(n_polls):
+        start = time.perf_counter()
+        doa_datalayer.query_for_work(node_cfgs, claim=claim)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run(uri, n_rows, waiting, n_polls, ready_queue):
+    engine = create_engine(uri)
+    doa_datalayer = build_datalayer('bench_poll', ready_queue)
+    drop_tables(doa_datalayer, engine)
+    waiting_every = max(1, round(100 / waiting))
+    results = []
+    with doa_datalayer(engine):
+        populate(doa_datalayer, n_rows, waiting_every)
+        n_polls = min(n_polls, n_rows // waiting_every // 4)
+        for poll, node_cfgs in [('single', NODES[:1]), ('multi', NODES[::-1])]:
+            for claim in [False, True]:
+                durations = measure(doa_datalayer, node_cfgs, n_polls, claim)
+                results.append({'benchmark': 'poll',
+                                'dialect': dialect_name(uri),
+                                'rows': n_rows,
+                                'waiting_percent': 100 / waiting_every,
+                                'ready_queue': ready_queue,
+                                'poll': poll,
+                                'claim': claim,
+                                'polls': n_polls,
+                                'mean': sum(durations) / len(durations),
+                                **percentiles(durations)})
+    drop_tables(doa_datalayer, engine)
+    engine.dispose()
+    return results
+
+
+def benchmark(uris=None, quick=False, rows=None, waiting=1., n_polls=None):
+    rows = rows or ([2000] if quick else [10000, 1000000])
+    n_polls = n_polls or (20 if quick else 500)
+    return [result
+            for uri in default_uris('bench_poll', uris)
+            for n_rows in rows
+            for ready_queue in [False, True]
+            for result in run(uri, n_rows, waiting, n_polls, ready_queue)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', nargs='+', default=None,
+                        help='Database uris. Defaults to SQLite and PostgreSQL if available.')
+    parser.add_argument('--rows', nargs='+', type=int, default=None)
+    parser.add_argument('--waiting', type=float, default=1., help='Percentage of waiting processes.')
+    parser.add_argument('--polls', type=int, default=None, help='Polls per measurement.')
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmark runs.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    write_results(benchmark(args.uri, args.quick, args.rows, args.waiting, args.polls), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Helpers shared by the benchmarks.
+
+Every benchmark runs on a temporary SQLite file by default and
+additionally on PostgreSQL if `DOA_BENCH_POSTGRESQL` (default
+"postgresql://localhost/doa_bench") can be connected to. Results are
+written as JSON together with the environment they were measured in, so
+runs can be compared with `benchmarks/compare.py`.
+"""
+import atexit
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+DEFAULT_POSTGRESQL_URI = 'postgresql://localhost/doa_bench'
+_tmp_dir = None
+
+
+def sqlite_uri(name):
+    global _tmp_dir
+    if _tmp_dir is None:
+        _tmp_dir = tempfile.mkdtemp(prefix='doa_bench_')
+        atexit.register(shutil.rmtree, _tmp_dir, ignore_errors=True)
+    return f'sqlite:///{os.path.join(_tmp_dir, name)}.sqlite'
+
+
+def postgresql_uri():
+    """The PostgreSQL uri of `DOA_BENCH_POSTGRESQL` if it can be connected to and None otherwise."""
+    uri = os.environ.get('DOA_BENCH_POSTGRESQL', DEFAULT_POSTGRESQL_URI)
+    try:
+        engine = sa.create_engine(uri, connect_args={'connect_timeout': 2})
+        with engine.connect():
+            pass
+        engine.dispose()
+    except Exception:
+        return None
+    return uri
+
+
+def default_uris(name, uris=None):
+    """`uris` if given, else a temporary SQLite file and PostgreSQL if available."""
+    if uris:
+        return list(uris)
+    postgresql = postgresql_uri()
+    return [sqlite_uri(name)] + ([postgresql] if postgresql is not None else [])
+
+
+def create_engine(uri):
+    if uri.startswith('sqlite'):
+        return sa.create_engine(uri, connect_args={'timeout': 60})
+    return sa.create_engine(uri)
+
+
+def dialect_name(uri):
+    return sa.engine.make_url(uri).get_backend_name()
+
+
+def drop_tables(doa_datalayer, engine):
+    doa_datalayer.table
+    doa_datalayer.metadata.drop_all(engine, checkfirst=True)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def percentiles(durations, qs=(50, 90, 99)):
+    durations = sorted(durations)
+    if len(durations) == 0:
+        return {f'p{q}': None for q in qs}
+    return {f'p{q}': durations[min(len(durations) - 1, int(len(durations) * q / 100))] for q in qs}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'sqlalchemy': sa.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.time()}
+
+
+def write_results(results, output=None):
+    """Write `results` as JSON to `output` or stdout."""
+    report = {'environment': environment(), 'results': results}
+    if output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
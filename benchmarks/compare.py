@@ -0,0 +1,81 @@
+"""Compare two result files of the benchmark suite.
+
+Results are matched by all their non-measured fields (benchmark, dialect,
+shape, workers, ...). For every measured value the ratio new / baseline
+is printed and changes beyond `--threshold` are flagged. Exits with 1 if
+a flagged regression was found, so it can be used in CI.
+
+    python benchmarks/compare.py baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+# Measured values and whether higher is better.
+METRICS = {
+    'duration': False,
+    'processes_per_second': True,
+    'claims_per_second': True,
+    'nodes_per_second': True,
+    'lost_claims': False,
+    'mean': False,
+    'p50': False,
+    'p90': False,
+    'p99': False,
+    'build_duration': False,
+    'levels_duration': False,
+    'components_duration': False,
+    'to_dict_duration': False,
+}
+# Outcomes of a run that are neither parameters nor compared.
+IGNORED = {'claimed', 'finished'}
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    results = report['results'] if isinstance(report, dict) else report
+    return {key(result): result for result in results}
+
+
+def key(result):
+    return tuple(sorted((k, json.dumps(v)) for k, v in result.items() if k not in METRICS and k not in IGNORED))
+
+
+def compare(baseline, new, threshold):
+    rows = []
+    regressions = 0
+    for k, result in new.items():
+        if k not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old_value, new_value = baseline[k].get(metric), result.get(metric)
+            if not old_value or new_value is None:
+                continue
+            ratio = new_value / old_value
+            change = ratio - 1 if higher_is_better else 1 - ratio
+            flag = ''
+            if change < -threshold:
+                flag = 'REGRESSION'
+                regressions += 1
+            elif change > threshold:
+                flag = 'improvement'
+            rows.append((', '.join(f'{p}={json.loads(v)}' for p, v in k), metric, old_value, new_value, ratio, flag))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change that is flagged.')
+    args = parser.parse_args(argv)
+    rows, regressions = compare(load(args.baseline), load(args.new), args.threshold)
+    for params, metric, old_value, new_value, ratio, flag in rows:
+        print(f'{params} {metric}: {old_value:.6g} -> {new_value:.6g} ({ratio:.2f}x) {flag}'.rstrip())
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
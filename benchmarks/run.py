@@ -0,0 +1,49 @@
+"""Run the benchmark suite and write all results to one JSON file.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --quick --only ingest poll
+    python benchmarks/compare.py baseline.json results.json
+
+Database benchmarks run on a temporary SQLite file and on PostgreSQL if
+`DOA_BENCH_POSTGRESQL` (default "postgresql://localhost/doa_bench") is
+available, or on the databases passed with `--uri`.
+"""
+import argparse
+import time
+
+from common import write_results
+
+import bench_claim
+import bench_dag
+import bench_ingest
+import bench_pipeline
+import bench_poll
+
+
+BENCHMARKS = {
+    'ingest': lambda uris, quick: bench_ingest.benchmark(uris, quick),
+    'poll': lambda uris, quick: bench_poll.benchmark(uris, quick),
+    'claim': lambda uris, quick: bench_claim.benchmark(uris, quick),
+    'pipeline': lambda uris, quick: bench_pipeline.benchmark(uris, quick),
+    'dag': lambda uris, quick: bench_dag.benchmark(quick),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', nargs='+', default=None,
+                        help='Database uris. Defaults to SQLite and PostgreSQL if available.')
+    parser.add_argument('--only', nargs='+', choices=[*BENCHMARKS.keys()], default=[*BENCHMARKS.keys()])
+    parser.add_argument('--quick', action='store_true', help='Small sizes to check the benchmarks run.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args(argv)
+    results = []
+    for name in args.only:
+        start = time.perf_counter()
+        results.extend(BENCHMARKS[name](args.uri, args.quick))
+        print(f'{name}: {time.perf_counter() - start:.1f}s', flush=True)
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
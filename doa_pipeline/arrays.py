@@ -0,0 +1,81 @@
+"""NumPy array result columns.
+
+    DOANodeConfig(name='fit', version='0.0.0', result_columns=[sa.Column('weights', NumpyArray)])
+
+Arrays are stored as LargeBinary: a small header with the dtype and the
+shape followed by the raw bytes of the array in C order. Loaded arrays are
+read-only views created with `np.frombuffer` on the fetched value, so they
+are not copied. With a blob store large arrays are offloaded like other
+binary values and `DOADataLayer.resolve` returns the array as a view of the
+memory mapped blob when the column is passed:
+
+    weights = doa_datalayer.resolve(row.weights, column=config_node.col('weights'))
+
+Requires numpy.
+"""
+import json
+import struct
+
+import numpy as np
+import sqlalchemy as sa
+
+from .blob_store import parse_blob_ref
+
+
+ARRAY_MAGIC = b'\x93DOAARR'
+_HEADER_LENGTH = struct.Struct('<I')
+_ALIGNMENT = 64
+
+
+def dump_array(array) -> bytes:
+    array = np.asarray(array)
+    if array.dtype.hasobject:
+        raise ValueError('Arrays with object dtype can not be stored')
+    header = json.dumps({'descr': np.lib.format.dtype_to_descr(array.dtype),
+                         'shape': array.shape}).encode('utf-8')
+    offset = len(ARRAY_MAGIC) + _HEADER_LENGTH.size + len(header)
+    # Pad the header so the data is aligned within the value and within memory maps.
+    header += b' ' * (-offset % _ALIGNMENT)
+    return b''.join([ARRAY_MAGIC, _HEADER_LENGTH.pack(len(header)), header,
+                     np.ascontiguousarray(array).tobytes()])
+
+
+def is_array_data(data) -> bool:
+    return bytes(data[:len(ARRAY_MAGIC)]) == ARRAY_MAGIC
+
+
+def load_array(data) -> np.ndarray:
+    """Create the array stored in `data` (any bytes-like object) without copying it."""
+    if not is_array_data(data):
+        raise ValueError('Value is not a stored array')
+    start = len(ARRAY_MAGIC)
+    header_length, = _HEADER_LENGTH.unpack_from(data, start)
+    start += _HEADER_LENGTH.size
+    header = json.loads(bytes(data[start:start + header_length]))
+    dtype = np.lib.format.descr_to_dtype(header['descr'])
+    shape = tuple(header['shape'])
+    count = 1
+    for n in shape:
+        count *= n
+    array = np.frombuffer(data, dtype=dtype, count=count, offset=start + header_length)
+    return array.reshape(shape)
+
+
+class NumpyArray(sa.types.TypeDecorator):
+    impl = sa.LargeBinary
+    cache_ok = True
+    # Values are serialized before they are offloaded to a blob store.
+    blob_offloadable = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return dump_array(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or parse_blob_ref(value) is not None:
+            return value
+        return load_array(value)
+
+    def load_blob(self, data):
+        return load_array(data)
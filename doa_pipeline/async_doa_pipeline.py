@@ -0,0 +1,175 @@
+"""asyncio version of the data layer based on SQLAlchemy's async engine.
+
+`AsyncDOADataLayer` shares the node, table and DAG construction with
+`DOADataLayer`. Every database operation runs the synchronous implementation
+of `DOADataLayer` inside `AsyncSession.run_sync` on its own short lived
+session, so many processes can be queried and stored concurrently from one
+event loop:
+
+    doa_datalayer = AsyncDOADataLayer('pipeline')
+    ...
+    async with doa_datalayer('sqlite+aiosqlite:///pipeline.sqlite'):
+        processing_context = await doa_datalayer.query_for_work(node_cfg)
+        async with doa_datalayer.process(processing_context) as result_container:
+            result_container.value = await fetch(processing_context.context['url'])
+"""
+import io
+import time
+import traceback
+from contextlib import asynccontextmanager
+from typing import (
+    List,
+    Union)
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from .doa_pipeline import (
+    ACTIVE_DOA_PIPELINES,
+    DOADataLayer,
+    Paused,
+    ProcessingContext,
+    default_claim_strategy)
+
+
+class AsyncDOADataLayer(DOADataLayer):
+    def __init__(self, name, initial_columns=[], **kwargs):
+        if kwargs.get('result_buffer_size'):
+            raise ValueError('Buffered results are not supported by the AsyncDOADataLayer')
+        super().__init__(name, initial_columns=initial_columns, **kwargs)
+        self._session_maker = None
+        self._tables_created = False
+
+    def __call__(self, engine) -> "AsyncDOADataLayer":
+        if self._table is None:
+            self._table = self.build_db_table()
+        if isinstance(engine, AsyncEngine):
+            self._engine = engine
+        elif isinstance(engine, str):
+            self._engine = create_async_engine(engine)
+        else:
+            raise ValueError('Provide a direct AsyncEngine or an adress that passed to create_async_engine(...)')
+        if self.claim_strategy is None:
+            self.claim_strategy = default_claim_strategy(self._engine.dialect)
+        self._claim_plans.clear()
+        self._session_maker = sessionmaker(bind=self._engine, class_=AsyncSession, expire_on_commit=False)
+        self._tables_created = False
+        return self
+
+    def __enter__(self):
+        raise TypeError('Use "async with" for the AsyncDOADataLayer')
+
+    async def __aenter__(self) -> "AsyncDOADataLayer":
+        if self._session_maker is None:
+            raise ValueError('Use AsyncDOADataLayer(engine=) before entering the data layer')
+        if not self._tables_created:
+            async with self._engine.begin() as connection:
+                await connection.run_sync(self.metadata.create_all, checkfirst=True)
+            self._tables_created = True
+        ACTIVE_DOA_PIPELINES.append(self)
+        return self
+
+    async def __aexit__(self, _type, _value, _tb):
+        ACTIVE_DOA_PIPELINES.pop()
+
+    async def _run(self, method, *args, **kwargs):
+        """Run the synchronous `method` of `DOADataLayer` with a new session."""
+        async with self._session_maker() as session:
+            return await session.run_sync(self._run_bound, method, args, kwargs)
+
+    def _run_bound(self, session, method, args, kwargs):
+        # A plain DOADataLayer sharing the state of this data layer, so that
+        # concurrent operations do not share the active session and internal
+        # calls dispatch to the synchronous methods.
+        bound = DOADataLayer.__new__(DOADataLayer)
+        bound.__dict__.update(self.__dict__)
+        bound._active_session = session
+        return method(bound, *args, **kwargs)
+
+    async def query_for_work(self, node_cfgs, claim=True, prefer_order=False) -> Union[None, ProcessingContext]:
+        return await self._run(DOADataLayer.query_for_work, node_cfgs, claim=claim, prefer_order=prefer_order)
+
+    async def query_for_work_node(self, node_cfg, claim=True) -> Union[None, ProcessingContext]:
+        return await self._run(DOADataLayer.query_for_work_node, node_cfg, claim=claim)
+
+    async def query_for_work_batch(self, node_cfgs, n, claim=True, prefer_order=False) -> List[ProcessingContext]:
+        return await self._run(DOADataLayer.query_for_work_batch, node_cfgs, n, claim=claim, prefer_order=prefer_order)
+
+    async def store_result(self, processing_context, result_container):
+        await self._run(DOADataLayer.store_result, processing_context, result_container)
+
+    async def store_crash(self, processing_context, result_container):
+        await self._run(DOADataLayer.store_crash, processing_context, result_container)
+
+    @asynccontextmanager
+    async def process(self, processing_context):
+        result_container = self.create_result_container(processing_context)
+        self._running_processes[processing_context.id_] = result_container
+        start = time.perf_counter() if self.observers else None
+        try:
+            yield result_container
+        except Paused as interrupt:
+            await self._run(DOADataLayer._store_pause, processing_context, result_container, interrupt)
+            if start is not None:
+                self._notify('on_pause', processing_context.config.name, processing_context.id_,
+                             time.perf_counter() - start, interrupt.awaited_event)
+        except Exception as err:
+            buffer = io.StringIO()
+            traceback.print_exc(file=buffer)
+            result_container.traceback = buffer.getvalue()
+            await self.store_crash(processing_context, result_container)
+            if start is not None:
+                self._notify('on_crash', processing_context.config.name, processing_context.id_,
+                             time.perf_counter() - start)
+        else:
+            store_start = time.perf_counter() if start is not None else None
+            await self.store_result(processing_context, result_container)
+            if start is not None:
+                end = time.perf_counter()
+                self._notify('on_store', processing_context.config.name, processing_context.id_,
+                             end - start, end - store_start)
+        finally:
+            del self._running_processes[processing_context.id_]
+
+    async def add_process(self, context={}, **kwargs):
+        return await self._run(DOADataLayer.add_process, context, **kwargs)
+
+    async def add_processes(self, contexts, chunk_size=1000, use_copy=True, **kwargs) -> List[int]:
+        return await self._run(DOADataLayer.add_processes, contexts, chunk_size=chunk_size, use_copy=use_copy, **kwargs)
+
+    async def call_out_event(self, event):
+        await self._run(DOADataLayer.call_out_event, event)
+
+    async def call_out_events(self, events):
+        await self._run(DOADataLayer.call_out_events, events)
+
+    async def resume(self, id_=None, force_resume=False):
+        await self._run(DOADataLayer.resume, id_=id_, force_resume=force_resume)
+
+    async def heartbeat(self, ids=None) -> int:
+        return await self._run(DOADataLayer.heartbeat, ids)
+
+    async def reap_expired(self, now=None):
+        return await self._run(DOADataLayer.reap_expired, now)
+
+    async def get_process(self, id_):
+        return await self._run(DOADataLayer.get_process, id_)
+
+    async def archive_processes(self, older_than=None, chunk_size=10000) -> int:
+        return await self._run(DOADataLayer.archive_processes, older_than, chunk_size)
+
+    async def delete_processes(self, ids, grace=3600.):
+        await self._run(DOADataLayer.delete_processes, ids, grace=grace)
+
+    async def collect_blobs(self, grace=3600.):
+        return await self._run(DOADataLayer.collect_blobs, grace=grace)
+
+    async def create_indexes(self, engine=None):
+        engine = self._engine if engine is None else engine
+        if engine is None:
+            raise ValueError('Provide an engine or use AsyncDOADataLayer(engine=) before creating indexes.')
+        self.table
+        async with engine.begin() as connection:
+            for table in self.metadata.sorted_tables:
+                for index in table.indexes:
+                    await connection.run_sync(index.create, checkfirst=True)
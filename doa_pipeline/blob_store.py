@@ -0,0 +1,134 @@
+"""Content-addressed store for large contexts and result values.
+
+With `DOADataLayer(blob_store=FileBlobStore(directory))` contexts and
+`str`/`bytes` result values of at least `threshold` bytes are written to the
+store and the row only keeps a reference "@@blob:<sha256>" (of the same
+type as the value). Identical payloads are stored once.
+
+Blobs are not deleted together with the rows referencing them. The data
+layer collects unreferenced blobs in `collect_blobs`, which is called when
+processes are deleted.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from typing import (
+    Iterable,
+    Iterator,
+    Optional,
+    Union)
+
+
+BLOB_REF_PREFIX = '@@blob:'
+_BLOB_REF_PREFIX_BYTES = BLOB_REF_PREFIX.encode('ascii')
+
+
+def blob_ref(digest: str, like: Union[str, bytes] = '') -> Union[str, bytes]:
+    """Reference to the blob `digest` with the type of `like`."""
+    ref = BLOB_REF_PREFIX + digest
+    return ref.encode('ascii') if isinstance(like, (bytes, bytearray, memoryview)) else ref
+
+
+def parse_blob_ref(value) -> Optional[str]:
+    """Return the digest if `value` is a blob reference and None otherwise."""
+    if isinstance(value, str):
+        if value.startswith(BLOB_REF_PREFIX):
+            return value[len(BLOB_REF_PREFIX):]
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        # Some drivers (psycopg2) return binary values as memoryviews.
+        if bytes(value[:len(_BLOB_REF_PREFIX_BYTES)]) == _BLOB_REF_PREFIX_BYTES:
+            return bytes(value[len(_BLOB_REF_PREFIX_BYTES):]).decode('ascii')
+    return None
+
+
+class FileBlobStore:
+    def __init__(self, directory, threshold: int = 64 * 1024):
+        """Store blobs in `directory` at `<digest[:2]>/<digest[2:4]>/<digest>`.
+
+        Values shorter than `threshold` bytes are kept in the row.
+        """
+        self.directory = os.path.abspath(directory)
+        self.threshold = threshold
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store `data` and return its digest.
+
+        Storing an existing payload only refreshes its modification time,
+        which protects it from being collected within the grace period.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        try:
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return digest
+
+    def open(self, digest: str) -> memoryview:
+        """Memory map the blob `digest` read-only.
+
+        The map is closed once the returned view and all views derived
+        from it are garbage collected.
+        """
+        with open(self.path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'')
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def get(self, digest: str) -> bytes:
+        return bytes(self.open(digest))
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest: str):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def digests(self) -> Iterator[str]:
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.startswith('.tmp-'):
+                    yield name
+
+    def collect(self, referenced: Iterable[str], grace: float = 3600.) -> int:
+        """Delete all blobs not in `referenced` that were not written within the last `grace` seconds.
+
+        Returns the number of deleted blobs.
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - grace
+        deleted = 0
+        for digest in self.digests():
+            if digest in referenced:
+                continue
+            path = self.path(digest)
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
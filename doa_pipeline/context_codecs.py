@@ -0,0 +1,311 @@
+"""Codecs to store the context of processes.
+
+A codec is selected by its tag: a base codec optionally followed by
+compression wrappers, e.g. "msgpack", "orjson+zlib" or "pickle+lz4". Values
+written with a codec start with "@<tag>" so tables with values written by
+different codecs keep working. Values without a tag are plain JSON.
+
+Mappings with string keys are stored with every value encoded on its own:
+
+    @msgpack+zlib:{"key": "<encoded value>", ...}
+
+so `LazyContext` only decodes the values of the keys that are accessed.
+All other values are stored as a whole:
+
+    @msgpack+zlib=<encoded value>
+
+Only use the "pickle" codec for databases written by trusted parties.
+"""
+import base64
+import json
+import pickle
+import zlib
+from collections.abc import Mapping, MutableMapping
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional)
+
+
+TAG_PREFIX = '@'
+
+
+class Codec:
+    tag = None
+    # Binary codecs are base64 encoded to be stored in text columns.
+    binary = False
+
+    def dumps(self, obj):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+    def encode(self, obj) -> str:
+        data = self.dumps(obj)
+        if self.binary:
+            return base64.b64encode(data).decode('ascii')
+        return data
+
+    def decode(self, text: str):
+        if self.binary:
+            return self.loads(base64.b64decode(text))
+        return self.loads(text)
+
+
+class JSONCodec(Codec):
+    tag = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    tag = 'orjson'
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise ImportError('The "orjson" codec requires the package orjson: pip install orjson')
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj, option=self._orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    tag = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError('The "msgpack" codec requires the package msgpack: pip install msgpack')
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+
+class PickleCodec(Codec):
+    tag = 'pickle'
+    binary = True
+
+    def dumps(self, obj):
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class CompressedCodec(Codec):
+    """Base class of the wrappers compressing the output of another codec."""
+    binary = True
+
+    def __init__(self, codec: Codec):
+        self.codec = codec
+        self.tag = f'{codec.tag}+{self.compression}'
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def dumps(self, obj):
+        data = self.codec.dumps(obj)
+        if not self.codec.binary:
+            data = data.encode('utf-8')
+        return self.compress(data)
+
+    def loads(self, data):
+        data = self.decompress(data)
+        if not self.codec.binary:
+            data = data.decode('utf-8')
+        return self.codec.loads(data)
+
+
+class ZlibCodec(CompressedCodec):
+    compression = 'zlib'
+
+    def __init__(self, codec, level=6):
+        super().__init__(codec)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Codec(CompressedCodec):
+    compression = 'lz4'
+
+    def __init__(self, codec):
+        super().__init__(codec)
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError('The "lz4" compression requires the package lz4: pip install lz4')
+        self._lz4_frame = lz4.frame
+
+    def compress(self, data):
+        return self._lz4_frame.compress(data)
+
+    def decompress(self, data):
+        return self._lz4_frame.decompress(data)
+
+
+CODECS: Dict[str, Callable[[], Codec]] = {c.tag: c for c in [JSONCodec, OrjsonCodec, MsgpackCodec, PickleCodec]}
+COMPRESSIONS: Dict[str, Callable[[Codec], Codec]] = {c.compression: c for c in [ZlibCodec, LZ4Codec]}
+_codec_cache = {}
+
+
+def register_codec(codec_cls, name=None):
+    """Register a `Codec` or a `CompressedCodec` class under `name` (defaults to its tag/compression)."""
+    if issubclass(codec_cls, CompressedCodec):
+        COMPRESSIONS[name or codec_cls.compression] = codec_cls
+    else:
+        CODECS[name or codec_cls.tag] = codec_cls
+    _codec_cache.clear()
+    return codec_cls
+
+
+def get_codec(tag) -> Codec:
+    """Return the codec for a tag like "msgpack+zlib"; codec instances are passed through."""
+    if isinstance(tag, Codec):
+        return tag
+    try:
+        return _codec_cache[tag]
+    except KeyError:
+        pass
+    name, *compressions = tag.split('+')
+    try:
+        codec = CODECS[name]()
+        for compression in compressions:
+            codec = COMPRESSIONS[compression](codec)
+    except KeyError as err:
+        raise ValueError(f'Unknown codec {err} in "{tag}". Codecs: {[*CODECS.keys()]}, '
+                         f'compressions: {[*COMPRESSIONS.keys()]}')
+    _codec_cache[tag] = codec
+    return codec
+
+
+def encode_context(context, codec) -> str:
+    codec = get_codec(codec)
+    if isinstance(context, Mapping) and all(isinstance(k, str) for k in context.keys()):
+        encoded = json.dumps({k: codec.encode(v) for k, v in context.items()})
+        return f'{TAG_PREFIX}{codec.tag}:{encoded}'
+    return f'{TAG_PREFIX}{codec.tag}={codec.encode(context)}'
+
+
+def _split_tag(text):
+    for i, c in enumerate(text):
+        if c in ':=':
+            return text[1:i], c, text[i + 1:]
+    raise ValueError(f'Malformed context value: "{text[:50]}"')
+
+
+def decode_context(text, untagged_loads=json.loads):
+    """Decode a value written by `encode_context` or plain JSON."""
+    if not text.startswith(TAG_PREFIX):
+        return untagged_loads(text)
+    tag, layout, payload = _split_tag(text)
+    codec = get_codec(tag)
+    if layout == ':':
+        return {k: codec.decode(v) for k, v in json.loads(payload).items()}
+    return codec.decode(payload)
+
+
+class _Encoded:
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class LazyContext(MutableMapping):
+    """Mapping decoding a stored context on first access.
+
+    Values stored per key are only decoded when the key is accessed.
+    `resolve` is applied to the stored text before decoding, e.g. to load
+    contexts that were offloaded to a blob store.
+    """
+    __slots__ = ('_text', '_untagged_loads', '_resolve', '_codec', '_items')
+
+    def __init__(self, text: str, untagged_loads: Callable[[str], Any] = json.loads,
+                 resolve: Optional[Callable[[str], str]] = None):
+        self._text = text
+        self._untagged_loads = untagged_loads
+        self._resolve = resolve
+        self._codec = None
+        self._items = None
+
+    def _load(self):
+        items = self._items
+        if items is not None:
+            return items
+        text = self._text
+        if self._resolve is not None:
+            text = self._resolve(text)
+        if text.startswith(TAG_PREFIX):
+            tag, layout, payload = _split_tag(text)
+            self._codec = get_codec(tag)
+            if layout == ':':
+                items = {k: _Encoded(v) for k, v in json.loads(payload).items()}
+            else:
+                items = self._codec.decode(payload)
+        else:
+            items = self._untagged_loads(text) if text else {}
+        if not isinstance(items, Mapping):
+            raise TypeError(f'The stored context is a {type(items).__name__} and not a mapping')
+        self._items = dict(items)
+        self._text = None
+        return self._items
+
+    def __getitem__(self, key):
+        items = self._load()
+        value = items[key]
+        if isinstance(value, _Encoded):
+            value = self._codec.decode(value.payload)
+            items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+
+    def __delitem__(self, key):
+        del self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    @property
+    def decoded_keys(self):
+        """Keys whose values were decoded already."""
+        return [k for k, v in self._load().items() if not isinstance(v, _Encoded)]
+
+    def __repr__(self):
+        return f'LazyContext({dict(self)!r})'
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
@@ -1,7 +1,6 @@
 """
 
 """
-import dataclasses
 from typing import (
     Any,
 )
@@ -10,9 +9,13 @@ DETACHED = 'DETACHED'
 
 
 class Node:
+    __slots__ = ('name', 'payload', 'dag', '_id', '_is_detached', '_incoming_edges', '_outgoing_edges')
+
     def __init__(self, name, payload=None, dag=None):
         self.name = name
         self.payload = payload
+        # Index of the node in the DAG, assigned by `DAG.add_node`.
+        self._id = None
         if dag is None:
             try:
                 dag = ACTIVE_DAGS[-1]
@@ -56,7 +59,8 @@ class Node:
         if self == end_node:
             return ValueError('Self referencing edges not allowed')
         edge = Edge(start=self, stop=end_node, payload=payload)
-        if edge in self.outgoing_edges:
+        is_new = edge not in self.outgoing_edges
+        if not is_new:
             if replace:
                 self.outgoing_edges.remove(edge)
                 end_node.incoming_edges.remove(edge)
@@ -64,6 +68,9 @@ class Node:
                 raise ValueError(f'Edge between {self} and {end_node} already present')
         self.outgoing_edges.add(edge)
         end_node.incoming_edges.add(edge)
+        if is_new:
+            self.dag._add_adjacency(self, end_node)
+        self.dag._invalidate()
         return edge
 
 
@@ -80,7 +87,14 @@ class Node:
         return hash((self.dag, self.name))
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if self is other:
+            return True
+        if not isinstance(other, Node) or self.name != other.name:
+            return False
+        # Nodes of different DAG objects with the same name are equal, like their hashes.
+        if isinstance(self.dag, DAG) and isinstance(other.dag, DAG):
+            return self.dag is other.dag or self.dag.name == other.dag.name
+        return self.dag is other.dag
     
     def __repr__(self):
         return str(self)
@@ -93,17 +107,25 @@ class Node:
         edge = self.dag.add_edge(other, self)
         return self, edge, other
 
-@dataclasses.dataclass
+
 class Edge:
-    start: Node
-    stop: Node
-    payload: Any = None
+    __slots__ = ('start', 'stop', 'payload')
+
+    def __init__(self, start: Node, stop: Node, payload: Any = None):
+        self.start = start
+        self.stop = stop
+        self.payload = payload
+
+    def __repr__(self):
+        return f'Edge(start={self.start!r}, stop={self.stop!r}, payload={self.payload!r})'
 
     def __hash__(self):
         return hash((self.start, self.stop))
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if not isinstance(other, Edge):
+            return False
+        return self.start == other.start and self.stop == other.stop
 
 
 
@@ -111,8 +133,18 @@ class DAG:
     def __init__(self, name: str):
         self.name = name
         self.nodes = set()
+        # Nodes indexed by their id and name and the ids of their
+        # successors/predecessors indexed by id.
+        self._node_list = []
+        self._node_lookup = {}
+        self._successors = []
+        self._predecessors = []
         self._sorted_nodes = None
+        self._levels = None
         self._components = None
+        self._edges = None
+        # Incremented on every change, so derived caches can be invalidated.
+        self.version = 0
 
     def __len__(self):
         return len(self.nodes)
@@ -124,30 +156,46 @@ class DAG:
     def __exit__(self, _type, _value, _tb) -> None:
         ACTIVE_DAGS.pop()
 
+    def _invalidate(self):
+        self._components = None
+        self._sorted_nodes = None
+        self._levels = None
+        self._edges = None
+        self.version += 1
+
+    def _add_adjacency(self, start_node, end_node):
+        self._successors[start_node._id].append(end_node._id)
+        self._predecessors[end_node._id].append(start_node._id)
+
     def add_node(self, node, replace=False):
         if not node.dag or node.dag == self:
-            try:
-                if node.dag == self:
-                    old_node = self.find(node)
-                elif node.dag == False:
-                    old_node = self.find(node.name)
-                else:
-                    raise RuntimeError('Unexpected case!')
-            except ValueError:
-                old_node = None
+            old_node = self._node_lookup.get(node.name)
             if old_node is not None:
-                if replace:
+                if not replace:
+                    raise ValueError(f'Node with name: {node.name} already present in dag: {self.name}')
+                elif old_node is not node:
                     for inc_edge in old_node.incoming_edges:
                         inc_edge.stop = node
                     for out_edge in old_node.outgoing_edges:
                         out_edge.start = node
+                    node._incoming_edges = old_node._incoming_edges
+                    node._outgoing_edges = old_node._outgoing_edges
+                    node._id = old_node._id
                     self.nodes.remove(old_node)
-                else:
-                    raise ValueError(f'Node with name: {node.name} already present in dag: {self.name}')
+            else:
+                if node._is_detached:
+                    node._incoming_edges = set()
+                    node._outgoing_edges = set()
+                node._id = len(self._node_list)
+                self._node_list.append(None)
+                self._successors.append([])
+                self._predecessors.append([])
+            node._is_detached = False
+            self._node_list[node._id] = node
+            self._node_lookup[node.name] = node
             self.nodes.add(node)
             node.dag = self
-            self._components = None
-            self._sorted_nodes = None
+            self._invalidate()
         else:
             raise ValueError('node is from a different DAG')
 
@@ -156,27 +204,23 @@ class DAG:
             raise ValueError('"start_node" is a node from a different DAG')
         if end_node not in self.nodes:
             raise ValueError('"end_node" is a node from a different DAG')
-        edge = start_node.add_edge(end_node, payload=payload, replace=replace)
-        self._components = None
-        self._sorted_nodes = None
-        return edge
+        return start_node.add_edge(end_node, payload=payload, replace=replace)
 
     @property
     def edges(self):
-        edges = set()
-        for node in self.nodes:
-            edges = edges.union(node.outgoing_edges)
-        return edges
+        if self._edges is None:
+            self._edges = frozenset(e for node in self._node_list for e in node.outgoing_edges)
+        return self._edges
 
 
     def to_dict(self):
         
         d = {'name': self.name,
-             'nodes': {str(hash(v)): {'name': v.name, 'payload': v.payload} for v in self.nodes},
+             'nodes': {str(hash(v)): {'name': v.name, 'payload': v.payload} for v in self._node_list},
              'edges': [{'start': str(hash(e.start)),
                         'stop': str(hash(e.stop)),
                         'payload': e.payload} for e in self.edges],
-             'order': [str(hash(v)) for v in self.nodes]}
+             'order': [str(hash(v)) for v in self._node_list]}
         return d
 
     @classmethod
@@ -193,11 +237,22 @@ class DAG:
                 start_node.add_edge(stop_node, edge.get('payload', None))
         return dag
 
+    @property
+    def levels(self):
+        """Nodes grouped into topological levels, see `topological_levels`."""
+        if self._levels is None:
+            self._levels = topological_levels(self)
+        return self._levels
+
     @property
     def sorted_nodes(self):
+        """Nodes in topological order, see `depth_first_search`.
+
+        The order defines the layout of the tables of data layers, so it
+        must not change for an existing DAG.
+        """
         if self._sorted_nodes is None:
             self._sorted_nodes = depth_first_search(self)
-            self._components = None
         return self._sorted_nodes
 
     @property
@@ -208,11 +263,16 @@ class DAG:
 
 
     def find(self, node):
-        nodes_list = list([*self.nodes])
         if isinstance(node, Node):
-            return nodes_list[nodes_list.index(node)]
+            found = self._node_lookup.get(node.name)
+            if found is None or found != node:
+                raise ValueError(f'{node} is not in dag: {self.name}')
+            return found
         elif isinstance(node, str):
-            return nodes_list[[v.name for v in nodes_list].index(node)]
+            try:
+                return self._node_lookup[node]
+            except KeyError:
+                raise ValueError(f'No node with name: {node} in dag: {self.name}')
         else:
             raise TypeError("Sought-after node has to be of type 'Node' or 'str' (name of the node)")
 
@@ -221,54 +281,90 @@ class DAG:
 
 
 def get_components(dag):
-    sorted_nodes = dag.sorted_nodes
-    look_up = {n: set([n]) for n in sorted_nodes}
-    visited = set()
-
-    def join_components(comp_m, comp_n):
-        joinded_component = comp_m.union(comp_n)
-        for n_i in comp_m:
-            look_up[n_i] = joinded_component
-        for n_i in comp_n:
-            look_up[n_i] = joinded_component
-
-    def visit(n, prev=None):
-        component_n = look_up[n]
-        if prev is not None:
-            component_prev = look_up[prev]
-            join_components(component_n, component_prev)
-        if n not in visited:
-            for e in n.outgoing_edges:
-                visit(e.stop, n)
-        else:
-            return
+    """Map every node to the set of nodes of its weakly connected component.
 
-    for n in sorted_nodes:
-        if n not in visited:
-            visit(n, None)
-    return look_up
+    Nodes of the same component share the same set object.
+    """
+    parent = list(range(len(dag._node_list)))
+    size = [1] * len(parent)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, successors in enumerate(dag._successors):
+        for j in successors:
+            root_i, root_j = find(i), find(j)
+            if root_i == root_j:
+                continue
+            if size[root_i] < size[root_j]:
+                root_i, root_j = root_j, root_i
+            parent[root_j] = root_i
+            size[root_i] += size[root_j]
+    components = {}
+    for node in dag._node_list:
+        components.setdefault(find(node._id), set()).add(node)
+    return {node: components[find(node._id)] for node in dag._node_list}
 
 
 def depth_first_search(dag):
+    """Sort the nodes topologically in reverse postorder of a depth first search.
+
+    The search starts from the nodes sorted by name and visits the
+    successors of a node sorted by name, so the order only depends on the
+    names and edges. Iterative, so deep DAGs do not hit the recursion limit.
     """
+    nodes = dag._node_list
+    successors = [sorted(s, key=lambda j: nodes[j].name) for s in dag._successors]
+    # 0: not visited, 1: on the stack, 2: finished
+    state = [0] * len(nodes)
+    postorder = []
+    for root in sorted(range(len(nodes)), key=lambda i: nodes[i].name):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            i, remaining = stack[-1]
+            for j in remaining:
+                if state[j] == 1:
+                    raise ValueError(f'DAG is not acyclic. node={nodes[j]} visited twice.')
+                if state[j] == 0:
+                    state[j] = 1
+                    stack.append((j, iter(successors[j])))
+                    break
+            else:
+                stack.pop()
+                state[i] = 2
+                postorder.append(nodes[i])
+    return postorder[::-1]
+
+
+def topological_levels(dag):
+    """Sort the nodes into levels with Kahn's algorithm.
+
+    Every node is in the level after its last upstream node, so all nodes of
+    a level can run concurrently once the previous levels finished. Nodes
+    within a level are sorted by name.
     """
-    nodes = sorted(dag.nodes, key=lambda x: x.name)
-    sorted_nodes = []
-    temporary_mark = set()
-    permanent_mark = set()
-    def visit(n):
-        if n in permanent_mark:
-            return
-        if n in temporary_mark:
-            raise ValueError(f'DAG is acyclic. node={n} visited_twice.')
-        temporary_mark.add(n)
-        for e_i in n.outgoing_edges:
-            visit(e_i.stop)
-        temporary_mark.remove(n)
-        permanent_mark.add(n)
-        sorted_nodes.append(n)
-    
-    for n in nodes:#entry_nodes:
-        if n not in permanent_mark:
-            visit(n)
-    return sorted_nodes[::-1]
\ No newline at end of file
+    nodes = dag._node_list
+    in_degree = [len(predecessors) for predecessors in dag._predecessors]
+    level = sorted((i for i, d in enumerate(in_degree) if d == 0), key=lambda i: nodes[i].name)
+    levels = []
+    n_sorted = 0
+    while level:
+        levels.append([nodes[i] for i in level])
+        n_sorted += len(level)
+        next_level = []
+        for i in level:
+            for j in dag._successors[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    next_level.append(j)
+        level = sorted(next_level, key=lambda i: nodes[i].name)
+    if n_sorted != len(nodes):
+        cyclic = sorted(nodes[i].name for i, d in enumerate(in_degree) if d > 0)
+        raise ValueError(f'DAG is not acyclic. Nodes on or behind a cycle: {cyclic}')
+    return levels
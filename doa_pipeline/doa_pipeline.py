@@ -5,7 +5,6 @@ import dataclasses
 import datetime
 import copy
 import json
-import fnmatch
 from typing import (
     Any,
     Callable,
@@ -22,17 +21,37 @@ import enum
 from contextlib import contextmanager
 import traceback
 import io
+import csv
+import decimal
+import itertools
+import operator
+import os
+import time
+import uuid
 from collections.abc import Iterable
 
 import sqlalchemy as sa
 from sqlalchemy.sql.expression import func as sql_func
 
+from .blob_store import BLOB_REF_PREFIX, blob_ref, parse_blob_ref
+from .context_codecs import LazyContext, encode_context, get_codec
 from .dag import DAG, Node
 from .db_utils import ArrayOfEnum, create_engine_context
 
 
 ACTIVE_DOA_PIPELINES = []
 DEFAULT_COLUMN_NAME_FUNC = lambda _, node_name, col: f'{node_name}_{col.name}'
+# Types of bound values written as CSV by `DOADataLayer.add_processes` with COPY.
+COPY_TYPES = (str, int, float, decimal.Decimal, datetime.date, datetime.time, type(None))
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
 
 
 class NodeStatus(enum.Enum):
@@ -87,15 +106,248 @@ class DOANodeConfig:
             raise AttributeError(f"'DOANodeConfig' has no ttribute '{name}'")
 
 
+class CompareAndSwapClaim:
+    """Optimistic claiming of processes.
+
+    The candidates are selected without locking them and each claim is guarded
+    by the expected `node_status` and `status` in the WHERE clause of the claim.
+    If a different worker claimed the process first the claim is dropped.
+    This works on every dialect but leads to many lost claims when a lot of
+    workers are polling the same table.
+    """
+    name = 'cas'
+
+    def prepare_candidates_query(self, query):
+        return query
+
+    def claim(self, datalayer, candidates) -> Dict[int, str]:
+        if datalayer._supports_update_returning():
+            return datalayer._claim_processes_returning(candidates)
+        else:
+            return datalayer._claim_processes_chunked(candidates)
+
+
+class SkipLockedClaim(CompareAndSwapClaim):
+    """Pessimistic claiming of processes with `SELECT ... FOR UPDATE SKIP LOCKED`.
+
+    The candidates are locked when they are selected and rows locked by other
+    workers are skipped, so concurrent workers are handed out disjoint sets of
+    processes instead of racing for the most recently updated one. The locks
+    are held until the claim is committed. Requires PostgreSQL (or another
+    dialect supporting SKIP LOCKED).
+    """
+    name = 'skip_locked'
+
+    def prepare_candidates_query(self, query):
+        return query.with_for_update(skip_locked=True)
+
+
+CLAIM_STRATEGIES = {s.name: s for s in [CompareAndSwapClaim, SkipLockedClaim]}
+
+
+class LIFOScheduling:
+    """Most recently updated processes first (the default)."""
+    name = 'lifo'
+
+    def order_by(self, table, ready_table=None):
+        if ready_table is not None:
+            return [ready_table.c.enqueued.desc()]
+        return [table.c.updated_time.desc()]
+
+    def index_columns(self, table):
+        """Leading columns of an extra index of waiting processes serving `order_by`.
+
+        None if the index of waiting processes on `updated_time` serves it.
+        """
+        return None
+
+    def prepare_candidates_query(self, query, table):
+        return query
+
+    def select(self, datalayer, query, n):
+        return datalayer._active_session.execute(query, {'limit': n}).fetchall()
+
+
+class FIFOScheduling(LIFOScheduling):
+    """Least recently updated processes first."""
+    name = 'fifo'
+
+    def order_by(self, table, ready_table=None):
+        if ready_table is not None:
+            return [ready_table.c.enqueued.asc()]
+        return [table.c.updated_time.asc()]
+
+
+class PriorityScheduling(LIFOScheduling):
+    """Processes with the highest `priority` first, first in first out within a priority."""
+    name = 'priority'
+
+    def order_by(self, table, ready_table=None):
+        return [table.c.priority.desc(), table.c.updated_time.asc()]
+
+    def index_columns(self, table):
+        return [table.c.priority.desc(), table.c.updated_time]
+
+
+class OldestStartedScheduling(LIFOScheduling):
+    """Processes that were added first are finished first."""
+    name = 'oldest_started'
+
+    def order_by(self, table, ready_table=None):
+        return [table.c.started.asc(), table.c.id.asc()]
+
+    def index_columns(self, table):
+        return [table.c.started, table.c.id]
+
+
+class WeightedFairScheduling(FIFOScheduling):
+    """Share the work between the values of the initial column `column`, e.g. tenants.
+
+    Every value is served in proportion to its weight in `weights`
+    (`default_weight` for values not listed): the values with the least
+    work handed out relative to their weight are queried first, each with
+    an indexed FIFO query. The values with waiting processes are looked
+    up every `refresh_interval` seconds. The shares are tracked per data
+    layer instance, i.e. per worker process.
+    """
+    name = 'weighted_fair'
+
+    def __init__(self, column, weights=None, default_weight=1., refresh_interval=10.):
+        self.column = column
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.refresh_interval = refresh_interval
+        self._virtual_time = {}
+        self._keys = None
+        self._keys_refreshed = None
+
+    def order_by(self, table, ready_table=None):
+        return [table.c.updated_time.asc()]
+
+    def index_columns(self, table):
+        return [table.c[self.column], table.c.updated_time]
+
+    def prepare_candidates_query(self, query, table):
+        return query.where(table.c[self.column] == sa.bindparam('fair_key'))
+
+    def _waiting_keys(self, datalayer):
+        now = time.monotonic()
+        if self._keys is None or now - self._keys_refreshed >= self.refresh_interval:
+            table = datalayer._table
+            q = sa.select([table.c[self.column]]).distinct() \
+                .where(table.c.status == ProcessStatus.WAITING.value)
+            self._keys = [key for key, in datalayer._active_session.execute(q)]
+            self._keys_refreshed = now
+            start = min(self._virtual_time.values(), default=0.)
+            for key in self._keys:
+                self._virtual_time.setdefault(key, start)
+        return self._keys
+
+    def select(self, datalayer, query, n):
+        keys = sorted(self._waiting_keys(datalayer), key=self._virtual_time.__getitem__)
+        total_weight = sum(self.weights.get(k, self.default_weight) for k in keys)
+        rows = []
+        selected = {}
+        exhausted = set()
+        # First every value gets its share of the batch, then the batch is filled up.
+        for fill in [False, True]:
+            for key in keys:
+                if len(rows) >= n:
+                    break
+                if key in exhausted:
+                    continue
+                weight = self.weights.get(key, self.default_weight)
+                limit = n - len(rows) if fill else max(1, round(n * weight / total_weight))
+                limit = min(limit, n - len(rows))
+                # Selected rows are only claimed afterwards, so they are skipped in the fill up.
+                offset = selected.get(key, 0)
+                key_rows = datalayer._active_session.execute(
+                    query, {'limit': offset + limit, 'fair_key': key}).fetchall()[offset:]
+                if len(key_rows) < limit:
+                    exhausted.add(key)
+                selected[key] = offset + len(key_rows)
+                self._virtual_time[key] += len(key_rows) / weight
+                rows.extend(key_rows)
+        return rows
+
+
+SCHEDULING_POLICIES = {s.name: s for s in [LIFOScheduling, FIFOScheduling, PriorityScheduling, OldestStartedScheduling]}
+
+
+def default_claim_strategy(dialect):
+    if dialect.name == 'postgresql':
+        return SkipLockedClaim()
+    else:
+        return CompareAndSwapClaim()
+
+
 @dataclasses.dataclass
 class ProcessingContext:
     config: DOANodeConfig
     id_: int
-    context: Dict
+    context: Mapping
     update_enum: 'DataLayer'
     process_status: str
     previous_process_status: str
     claimed: bool
+    # Context of the downstream node claimed when the result was stored (see `fuse_nodes`).
+    fused_next: Optional['ProcessingContext'] = None
+    claimed_time: Optional[datetime.datetime] = None
+    # Identifies the claim if the data layer has a `lease_duration`.
+    lease_token: Optional[str] = None
+    # The context as stored in the table, fused nodes decode it again.
+    stored_context: Optional[str] = None
+
+
+class ResultContainer:
+    """Base class of the result containers of the nodes.
+
+    `DOADataLayer.create_result_container` creates one subclass per node
+    with a slot for every result column of the node.
+    """
+    __slots__ = ('traceback', )
+    _fields: Tuple[str, ...] = ()
+    _column_names: Tuple[str, ...] = ()
+
+    def __init__(self, **values):
+        self.traceback = None
+        for name in self._fields:
+            setattr(self, name, None)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    @staticmethod
+    def _get_values(result_container) -> Tuple:
+        return ()
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in ('traceback', *self._fields))
+        return f'{type(self).__name__}({values})'
+
+
+def _values_getter(fields):
+    if len(fields) == 0:
+        return staticmethod(lambda result_container: ())
+    elif len(fields) == 1:
+        field = fields[0]
+        return staticmethod(lambda result_container: (getattr(result_container, field), ))
+    return staticmethod(operator.attrgetter(*fields))
+
+
+@dataclasses.dataclass
+class ClaimPlan:
+    """Precompiled candidates queries for a tuple of nodes.
+
+    The queries take the maximum number of candidates as the bound
+    parameter `limit` and return the id, node status and context of the
+    processes together with the position of the node in `node_names` the
+    process is ready for.
+    """
+    node_names: Tuple[str, ...]
+    node_enums: List[enum.Enum]
+    prefer_order: bool
+    candidates_query: Any
+    claim_query: Any
 
 
 class DOADataLayer:
@@ -103,16 +355,95 @@ class DOADataLayer:
     context_dump = json.dumps
     context_load = json.loads
 
-    def __init__(self, name, initial_columns=[]):
+    def __init__(self, name, initial_columns=[], claim_chunk_size=100, claim_strategy=None,
+                 result_buffer_size=None, result_buffer_interval=None, ready_queue=False, notifier=None,
+                 context_codec=None, blob_store=None, fuse_nodes=False, scheduling_policy='lifo',
+                 observers=(), node_timing=False, lease_duration=None, max_attempts=3, archive=False):
+        """Data layer of a DAG of nodes backed by a single table.
+
+        With a `result_buffer_size` outcomes of nodes are buffered and written
+        together (see `flush_results`), also after `result_buffer_interval`
+        seconds. With `ready_queue` the processes ready for a node are kept
+        in the companion table `<name>_ready`, so querying for work is an
+        indexed lookup; run `sync_ready_queue` once when enabling it for an
+        existing table. A `notifier` (see `doa_pipeline.notify`) lets idle
+        workers block in `wait_for_work` instead of polling.
+
+        `context_codec` selects the codec new contexts are written with (see
+        `doa_pipeline.context_codecs`), by default plain JSON. With a
+        `blob_store` (see `doa_pipeline.blob_store`) large contexts and
+        result values are offloaded to the store. With `fuse_nodes`, a list
+        of node configs or True for all registered nodes without a
+        concurrency limit, storing a result directly claims the next ready
+        fused node (see `store_result`).
+
+        `scheduling_policy` is "lifo" (default), "fifo", "priority",
+        "oldest_started" or a policy instance like
+        `WeightedFairScheduling('tenant')`. `observers` (see
+        `doa_pipeline.metrics`) are called on polls, claims and outcomes.
+        With `node_timing` the claim and finish time of every node is
+        recorded for `doa_pipeline.timing`.
+
+        With a `lease_duration` in seconds claims expire unless extended
+        with `heartbeat`, expired claims are returned by `reap_expired` and
+        failed after `max_attempts`. With `archive` finished processes can
+        be moved to `<name>_archive` with `archive_processes`.
+        """
         self.name = name
+        self.claim_chunk_size = claim_chunk_size
+        self.result_buffer_size = result_buffer_size
+        self.result_buffer_interval = result_buffer_interval
+        self._pending_updates = {}
+        self._pending_ready_updates = {}
+        self._last_flush = time.monotonic()
+        self.ready_queue = ready_queue
+        self._ready_table = None
+        self._events_table = None
+        self._pending_subscriptions = []
+        self.notifier = notifier
+        self.context_codec = None if context_codec is None else get_codec(context_codec)
+        self.blob_store = blob_store
+        self.fuse_nodes = fuse_nodes
+        self._notifier_subscription = None
+        self._pending_topics = set()
+        if isinstance(claim_strategy, str):
+            try:
+                claim_strategy = CLAIM_STRATEGIES[claim_strategy]()
+            except KeyError:
+                raise ValueError(f'Unknown claim strategy "{claim_strategy}". Options: {[*CLAIM_STRATEGIES.keys()]}')
+        self.claim_strategy = claim_strategy
+        if isinstance(scheduling_policy, str):
+            try:
+                scheduling_policy = SCHEDULING_POLICIES[scheduling_policy]()
+            except KeyError:
+                raise ValueError(f'Unknown scheduling policy "{scheduling_policy}". Options: {[*SCHEDULING_POLICIES.keys()]}')
+        self.scheduling_policy = scheduling_policy
+        self.observers = list(observers)
+        self.node_timing = node_timing
+        self._node_times_table = None
+        self._pending_node_times = []
+        self.lease_duration = lease_duration
+        self.max_attempts = max_attempts
+        # Lease tokens of the claimed processes whose outcome was not stored yet by id.
+        self._claimed_leases = {}
+        self._pending_lease_tokens = {}
+        self.archive = archive
+        self._archive_table = None
+        self._archive_partitions = set()
+        self._claim_lease = {}
         self.dag = DAG(name)
         self.columns = {}
         self.metadata = sa.MetaData()
         self.initial_columns = initial_columns
         self._table = None
+        self._compiled_dag_version = None
+        self._claim_plans = {}
+        self._claim_updates = {}
+        self._result_container_classes = {}
         self._engine = None
         self._active_session = None
         self._running_processes = {}
+        self.node_functions = {}
         
     def create_node(self, doa_node_cfg):
         name = doa_node_cfg.name
@@ -128,9 +459,35 @@ class DOADataLayer:
                     dag=self.dag)
         self.columns[node] = node_columns
         doa_node_cfg._dag_columns[self.name] = node_columns
+        self._result_container_classes.pop(name, None)
         return node
 
+    def register(self, node_cfg, func=None, concurrency=None):
+        """Register the function executing the node `node_cfg`.
+
+        Can be used as a decorator. The function is called by the workers of
+        `doa_pipeline.worker` with the processing context and the result
+        container of every claimed process. `concurrency` limits the number
+        of processes running the node at the same time across all workers.
+        Nodes listed in `fuse_nodes` can not be limited, because fused nodes
+        are run without acquiring a slot.
+        """
+        if self.name not in node_cfg._dag_columns.keys():
+            raise ValueError('node_cfg not used for this DAG')
+        if concurrency is not None and node_cfg.name in self._listed_fused_nodes():
+            raise ValueError(f'The fused node "{node_cfg.name}" can not be registered with a concurrency limit')
+
+        def decorator(func):
+            self.node_functions[node_cfg.name] = (node_cfg, func, concurrency)
+            return func
+
+        if func is None:
+            return decorator
+        return decorator(func)
+
     def build_db_table(self) -> sa.Table:
+        self._mandatory_kw = [c.name for c in self.initial_columns if c.default is None]
+        self._optional_kw = [c.name for c in self.initial_columns if c.default is not None]
         sorted_nodes = self.dag.sorted_nodes
         self.node_order = {n.name.upper(): i for i, n in  enumerate(sorted_nodes)}
         self.node_order['CONTEXT'] = -1
@@ -174,7 +531,21 @@ class DOADataLayer:
                       server_default=''),
             sa.Column('awaited_events',
                       sa.Text,
-                      server_default=''),]
+                      server_default=''),
+            sa.Column('priority',
+                      sa.Integer,
+                      server_default='0',
+                      nullable=False),
+            sa.Column('lease_expires',
+                      sa.DateTime,
+                      nullable=True),
+            sa.Column('lease_token',
+                      sa.String,
+                      nullable=True),
+            sa.Column('attempts',
+                      sa.Integer,
+                      server_default='0',
+                      nullable=False),]
         for node in sorted_nodes:
             table_cols.extend([*self.columns.get(node, {}).values()])
         used_names = set([c.name for c in table_cols])
@@ -183,7 +554,152 @@ class DOADataLayer:
                 raise ValueError(f'Name "{col.name}" is already used and can not be used for an intial column')
             else:
                 table_cols.append(col)
-        return sa.Table(f'{self.name}', self.metadata, *table_cols, extend_existing=True)
+        # Without AUTOINCREMENT SQLite reuses the ids of the archived processes.
+        table = sa.Table(f'{self.name}', self.metadata, *table_cols, sqlite_autoincrement=self.archive,
+                         extend_existing=True)
+        self._add_indexes(table)
+        if self.ready_queue:
+            self._ready_table = sa.Table(
+                f'{self.name}_ready', self.metadata,
+                sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+                sa.Column('node', sa.Integer, primary_key=True, autoincrement=False),
+                sa.Column('enqueued', sa.DateTime, server_default=sa.sql.func.now()),
+                sa.Index(f'ix_{self.name}_ready_node_enqueued', 'node', 'enqueued'),
+                extend_existing=True)
+        self._events_table = sa.Table(
+            f'{self.name}_events', self.metadata,
+            sa.Column('event', sa.String, primary_key=True),
+            sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+            sa.Index(f'ix_{self.name}_events_id', 'id'),
+            extend_existing=True)
+        if self.node_timing:
+            self._node_times_table = sa.Table(
+                f'{self.name}_node_times', self.metadata,
+                sa.Column('id', sa.Integer, nullable=False),
+                sa.Column('node', sa.Integer, nullable=False),
+                sa.Column('status', sa.String, nullable=False),
+                sa.Column('claimed', sa.DateTime, nullable=False),
+                sa.Column('finished', sa.DateTime, nullable=False),
+                sa.Index(f'ix_{self.name}_node_times_id', 'id'),
+                sa.Index(f'ix_{self.name}_node_times_finished', 'finished'),
+                extend_existing=True)
+        if self.archive:
+            self._archive_table = self._build_archive_table(table)
+        self._compile_dag(table)
+        return table
+
+    def _build_archive_table(self, table):
+        columns = []
+        for c in table.columns:
+            if c.name == 'id':
+                columns.append(sa.Column('id', sa.Integer, primary_key=True, autoincrement=False))
+            elif c.name == 'finished':
+                # PostgreSQL requires the partition key to be part of the primary key.
+                columns.append(sa.Column('finished', sa.DateTime, primary_key=True))
+            else:
+                columns.append(sa.Column(c.name, c.type, nullable=True))
+        return sa.Table(
+            f'{self.name}_archive', self.metadata, *columns,
+            postgresql_partition_by='RANGE (finished)',
+            extend_existing=True)
+
+    def _compile_dag(self, table):
+        """Precompute the node lookups and statements used to claim and store processes.
+
+        Called whenever the table is built and before claiming work if the
+        DAG changed since. Cached claim plans are dropped.
+        """
+        sorted_nodes = self.dag.sorted_nodes
+        missing = [n.name for n in sorted_nodes if n.name.upper() not in self.node_order]
+        if missing:
+            raise ValueError(f'Nodes {missing} were added to the DAG after the table "{self.name}" was built')
+        node_idx = {n: self.node_order[n.name.upper()] for n in sorted_nodes}
+        self._node_enums = {n.name: self.update_enum(i) for n, i in node_idx.items()}
+        self._root_nodes = [node_idx[n] for n in sorted_nodes if len(n.incoming_edges) == 0]
+        self._upstream_nodes = {
+            node_idx[n]: tuple(sorted(node_idx[e.start] for e in n.incoming_edges))
+            for n in sorted_nodes}
+        self._downstream_nodes = {
+            node_idx[n]: sorted((node_idx[e.stop], self._upstream_nodes[node_idx[e.stop]]) for e in n.outgoing_edges)
+            for n in sorted_nodes}
+        self._claim_statement = sa.update(table) \
+            .values(status=ProcessStatus.RUNNING.value,
+                    node_status=sa.bindparam('b_new_node_status'),
+                    updated_node=sa.bindparam('b_updated_node'),
+                    updated_previous_status=sa.bindparam('b_previous_status'),
+                    **self._lease_values(table)) \
+            .where(sa.and_(table.c.node_status == sa.bindparam('b_node_status'),
+                           table.c.id == sa.bindparam('b_id'),
+                           table.c.status == ProcessStatus.WAITING.value))
+        self._claim_plans.clear()
+        self._claim_updates.clear()
+        self._compiled_dag_version = self.dag.version
+
+    def _lease_values(self, table):
+        if self.lease_duration is None:
+            return {}
+        return {'lease_expires': sa.bindparam('b_lease_expires'),
+                'lease_token': sa.bindparam('b_lease_token'),
+                'attempts': table.c.attempts + 1}
+
+    def _lease_expiry(self):
+        return datetime.datetime.now() + datetime.timedelta(seconds=self.lease_duration)
+
+    def _new_lease(self):
+        """Parameters of the lease of the processes claimed together.
+
+        The token identifies the claim, so outcomes of expired claims can be told apart.
+        """
+        if self.lease_duration is None:
+            return {}
+        return {'b_lease_expires': self._lease_expiry(), 'b_lease_token': uuid.uuid4().hex}
+
+    def _add_indexes(self, table):
+        """Add the indexes used by the scheduling queries to `table`.
+
+        The partial indexes are restricted to waiting and paused processes
+        on PostgreSQL and SQLite, so their size is proportional to the work
+        in flight instead of all processes ever added. Other dialects create
+        them as full indexes.
+        """
+        waiting = table.c.status == ProcessStatus.WAITING.value
+        paused = table.c.status == ProcessStatus.PAUSED.value
+        sa.Index(f'ix_{self.name}_status_updated_time',
+                 table.c.status, table.c.updated_time)
+        sa.Index(f'ix_{self.name}_waiting',
+                 table.c.updated_time, table.c.node_status,
+                 postgresql_where=waiting,
+                 sqlite_where=waiting)
+        sa.Index(f'ix_{self.name}_paused',
+                 table.c.awaited_events,
+                 postgresql_where=paused,
+                 sqlite_where=paused)
+        if self.lease_duration is not None:
+            running = table.c.status == ProcessStatus.RUNNING.value
+            sa.Index(f'ix_{self.name}_lease',
+                     table.c.lease_expires,
+                     postgresql_where=running,
+                     sqlite_where=running)
+        index_columns = self.scheduling_policy.index_columns(table)
+        if index_columns is not None:
+            sa.Index(f'ix_{self.name}_waiting_{self.scheduling_policy.name}',
+                     *index_columns, table.c.node_status,
+                     postgresql_where=waiting,
+                     sqlite_where=waiting)
+
+    def create_indexes(self, engine=None):
+        """Create missing indexes of the table.
+
+        Indexes are only created with the table. This has to be called once
+        explicitly to add them to an already existing table.
+        """
+        engine = self._engine if engine is None else engine
+        if engine is None:
+            raise ValueError('Provide an engine or use DOADataLayer(engine=) before creating indexes.')
+        self.table
+        for table in self.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
 
     def __call__(self, engine) -> "DOADataLayer":
         if self._table is None:
@@ -194,6 +710,9 @@ class DOADataLayer:
             self._engine = sa.create_engine(engine)
         else:
             raise ValueError('Provide a direct Engine or an adress that passed to sa.create_engine(...)')
+        if self.claim_strategy is None:
+            self.claim_strategy = default_claim_strategy(self._engine.dialect)
+        self._claim_plans.clear()
         self.metadata.create_all(self._engine, checkfirst=True)
         self.session_scope = create_engine_context(self._engine)
         return self
@@ -212,144 +731,407 @@ class DOADataLayer:
 
     def __exit__(self, _type, _value, _tb):
         ACTIVE_DOA_PIPELINES.pop()
-        self._active_session_scope.__exit__(_type, _value, _tb)
+        try:
+            self.flush_results()
+        finally:
+            self._active_session_scope.__exit__(_type, _value, _tb)
+            if self._notifier_subscription is not None and self._notifier_subscription[0] == os.getpid():
+                self._notifier_subscription[1].close()
+            self._notifier_subscription = None
         self._active_session = None
         self._active_session_scope = None
 
-    def query_for_work(self, node_cfgs, claim=True) -> Union[None, Tuple[DOANodeConfig, ProcessingContext]]:
+    def query_for_work(self, node_cfgs, claim=True, prefer_order=False) -> Union[None, ProcessingContext]:
         if isinstance(node_cfgs, DOANodeConfig):
             return self.query_for_work_node(node_cfgs, claim=claim)
-        elif isinstance(node_cfgs, Iterable):
-            if not all(isinstance(c, DOANodeConfig) for c in node_cfgs):
-                raise TypeError('"node_cfgs" has to be either a single DOANodeConfig or a list[DOANodeConfig]')
-        else:
-            raise TypeError('"node_cfgs" has to be either a single DOANodeConfig or a list[DOANodeConfig]')
-        table = self._table
-        nodes = [self.dag.find(c.name) for c in node_cfgs]
-        like_strs = [self._get_like_str(n) for n in nodes]
-        like_str = [set(i) for i in zip(*like_strs)]
-        like_str = ''.join([s.pop() if len(s) == 1 else '_' for s in like_str])
-        sq = self._active_session.query(table.c.id, table.c.node_status, table.c.context, table.c.updated_node) \
-            .filter(sa.and_(table.c.node_status.like(like_str),
-                            table.c.status == ProcessStatus.WAITING.value)) \
-            .order_by(table.c.updated_time.desc()).limit(1)
-        res = self._active_session.execute(sq).fetchone()
-        if res is None:
+        processing_contexts = self.query_for_work_batch(node_cfgs, 1, claim=claim, prefer_order=prefer_order)
+        if len(processing_contexts) == 0:
             return None
-        id_, node_status, context, updated_node = res
-        node = None
-        for (node_candidate, node_cfg) in zip(nodes, node_cfgs):
-            like_str = self._get_like_str(node_candidate, '?')
-            if fnmatch.fnmatch(node_status, like_str):
-                node = node_candidate
-                break
-        if node is None:
-            raise RuntimeError('Could not match result to any possible node! This error should not appear!')
-        node_enum = self._node_enum(node)
-        if claim:
-            new_status = self._claim_process(id_, node_status, node_enum)
-            if new_status is None:
-                return None
-        else:
-            new_status = node_status
-        processing_context = ProcessingContext(
-            config=node_cfg,
-            id_=id_,
-            process_status=new_status,
-            previous_process_status=node_status,
-            update_enum=node_enum,
-            context=DOADataLayer.context_load(context),
-            claimed=claim)
-        return processing_context
-
-    def _get_like_str(self, node, wildcard='_'):
-        if isinstance(node, DOANodeConfig):
-            node = self.dag.find(node.name)
-        elif isinstance(node, Node):
-            pass
-        else:
-            raise TypeError('"node" has to be of type: DOANodeConfig or dag.Node')
-        upstream_nodes = [getattr(self.update_enum, e.start.name.upper()).value
-                          for e in node.incoming_edges]
-        like_str = 'S'
-        node_enum = self._node_enum(node)
-        for i in range(len(self.dag)):
-            if i == node_enum.value:
-                like_str += 'W'
-            elif i in upstream_nodes:
-                like_str += 'S'
-            else:
-                like_str += wildcard
-        return like_str
+        return processing_contexts[0]
 
-    def _node_enum(self, node):
-        return getattr(self.update_enum, node.name.upper())
+    def _like_str(self, node_idx, wildcard='_'):
+        upstream_nodes = self._upstream_nodes[node_idx]
+        return 'S' + ''.join('W' if i == node_idx else 'S' if i in upstream_nodes else wildcard
+                             for i in range(len(self._upstream_nodes)))
 
-    def _claim_process(self, id_, node_status, node_enum):
+    def _claim_process(self, id_, node_status, node_enum, commit=True):
         new_status = list(node_status)
         prev_status = new_status[node_enum.value + 1]
         new_status[node_enum.value + 1] = NodeStatus.RUNNING.value
         new_status = ''.join(new_status)
-        q = sa.update(self._table) \
-            .values(status=ProcessStatus.RUNNING.value,
-                    node_status=new_status,
-                    updated_node=node_enum.name,
-                    updated_previous_status=prev_status) \
-            .where(sa.and_(self._table.c.node_status == node_status,
-                           self._table.c.id == id_,
-                           self._table.c.status == ProcessStatus.WAITING.value))
-        res = self._active_session.execute(q)
-        self._active_session.commit()
+        res = self._active_session.execute(self._claim_statement,
+                                           {'b_id': id_,
+                                            'b_node_status': node_status,
+                                            'b_new_node_status': new_status,
+                                            'b_updated_node': node_enum.name,
+                                            'b_previous_status': prev_status,
+                                            **self._claim_lease})
+        if commit:
+            self._active_session.commit()
         if res.rowcount == 0:
             return None
         else:
             return new_status
-    
+
     def query_for_work_node(self, node_cfg, claim=True) -> Union[None, ProcessingContext]:
-        table = self._table
+        processing_contexts = self.query_for_work_batch(node_cfg, 1, claim=claim)
+        if len(processing_contexts) == 0:
+            return None
+        return processing_contexts[0]
+
+    def query_for_work_batch(self, node_cfgs, n, claim=True, prefer_order=False) -> List[ProcessingContext]:
+        """Query up to `n` processes ready for one of the nodes in `node_cfgs`.
+
+        The readiness of every node is checked in the database and each
+        process is assigned to the first node in `node_cfgs` it is ready for.
+        By default the most recently updated processes are returned first.
+        With `prefer_order` processes ready for earlier nodes in `node_cfgs`
+        are returned before processes ready for later ones.
+
+        The selected processes are claimed using the `claim_strategy` of the
+        data layer. Dialects supporting `UPDATE ... RETURNING` claim the
+        processes of each node with a single statement and commit all claims
+        in one transaction. All other dialects claim the processes one by one
+        and commit the claims in chunks of `claim_chunk_size` processes, each
+        chunk in its own transaction.
+        Processes claimed by a different worker in the meantime are dropped, so
+        the returned list can be shorter than `n` even if more work is available.
+        """
         if self._active_session is None:
             raise ValueError('Use or with DOADataLayer(engine=) before querying the database')
-        like_str = self._get_like_str(node_cfg)
-        node_enum = self._node_enum(node_cfg)
-        sq = self._active_session.query(table.c.id, table.c.node_status, table.c.context) \
-            .filter(sa.and_(table.c.node_status.like(like_str),
-                            table.c.status == ProcessStatus.WAITING.value)) \
-            .order_by(table.c.updated_time.desc()).limit(1)
-        res = self._active_session.execute(sq).fetchone()
-        if res is None:
-            return None
-        id_, node_status, context = res
-        if claim:
-            new_status = self._claim_process(id_, node_status, node_enum)
-            if new_status is None:
-                return None
+        start = time.perf_counter() if self.observers else None
+        if self._pending_updates:
+            self._flush_due()
+        node_cfgs = self._as_node_cfg_list(node_cfgs)
+        plan = self.claim_plan(node_cfgs, prefer_order=prefer_order)
+        candidates = self._select_candidates(plan, node_cfgs, n, claim=claim)
+        if claim and len(candidates) > 0:
+            self._claim_lease = self._new_lease()
+            new_status = self.claim_strategy.claim(self, candidates)
         else:
-            new_status = node_status
-        processing_context = ProcessingContext(
-            config=node_cfg,
-            id_=id_,
-            process_status=new_status,
-            previous_process_status=node_status,
-            update_enum=node_enum,
-            context=DOADataLayer.context_load(context),
-            claimed=claim)
-        return processing_context
-
-
-    def create_result_container(self, processing_context):
+            new_status = {id_: node_status for id_, node_status, *_ in candidates}
+        processing_contexts = []
+        claimed_time = datetime.datetime.now() if claim and self.node_timing else None
+        for id_, node_status, context, node_cfg, node_enum in candidates:
+            if id_ not in new_status:
+                if start is not None:
+                    self._notify('on_claim_conflict', node_cfg.name, id_)
+                continue
+            if claim and start is not None:
+                self._notify('on_claim', node_cfg.name, id_)
+            if claim and self.lease_duration is not None:
+                self._claimed_leases[id_] = self._claim_lease['b_lease_token']
+            processing_contexts.append(ProcessingContext(
+                config=node_cfg,
+                id_=id_,
+                process_status=new_status[id_],
+                previous_process_status=node_status,
+                update_enum=node_enum,
+                context=self._lazy_context(context),
+                stored_context=context,
+                claimed=claim,
+                claimed_time=claimed_time,
+                lease_token=self._claim_lease.get('b_lease_token') if claim else None))
+        if start is not None:
+            self._notify('on_poll', plan.node_names, n, len(processing_contexts), time.perf_counter() - start)
+        return processing_contexts
+
+    def _notify(self, hook, *args):
+        for observer in self.observers:
+            getattr(observer, hook)(*args)
+
+    @staticmethod
+    def _as_node_cfg_list(node_cfgs) -> List[DOANodeConfig]:
+        if isinstance(node_cfgs, DOANodeConfig):
+            return [node_cfgs]
+        elif isinstance(node_cfgs, Iterable):
+            node_cfgs = list(node_cfgs)
+            if len(node_cfgs) > 0 and all(isinstance(c, DOANodeConfig) for c in node_cfgs):
+                return node_cfgs
+        raise TypeError('"node_cfgs" has to be either a single DOANodeConfig or a list[DOANodeConfig]')
+
+    def claim_plan(self, node_cfgs, prefer_order=False) -> ClaimPlan:
+        """Return the cached claim plan for the nodes `node_cfgs`.
+
+        Plans are cached per tuple of node names and dropped when the DAG
+        changed since they were built.
+        """
+        node_names = tuple(c.name for c in self._as_node_cfg_list(node_cfgs))
+        table = self.table
+        if self._compiled_dag_version != self.dag.version:
+            self._compile_dag(table)
+        key = (node_names, prefer_order)
+        try:
+            return self._claim_plans[key]
+        except KeyError:
+            plan = self._build_claim_plan(node_names, prefer_order)
+            self._claim_plans[key] = plan
+            return plan
+
+    def _build_claim_plan(self, node_names, prefer_order):
+        table = self._table
+        try:
+            node_enums = [self._node_enums[name] for name in node_names]
+        except KeyError as err:
+            raise ValueError(f'Node {err} is not part of the DAG "{self.name}"')
+        node_positions = {}
+        for i, node_enum in enumerate(node_enums):
+            node_positions.setdefault(node_enum.value, i)
+        if self.ready_queue:
+            ready_table = self._ready_table
+            if len(node_positions) == 1:
+                position = sa.literal(0)
+            else:
+                position = sa.case(node_positions, value=ready_table.c.node)
+            candidates_query = sa.select([table.c.id, table.c.node_status, table.c.context,
+                                          position.label('node_position')]) \
+                .select_from(ready_table.join(table, ready_table.c.id == table.c.id)) \
+                .where(sa.and_(ready_table.c.node.in_([*node_positions.keys()]),
+                               table.c.status == ProcessStatus.WAITING.value))
+            order_by = self.scheduling_policy.order_by(table, ready_table)
+        else:
+            readiness = [(table.c.node_status.like(self._like_str(node_idx)), i)
+                         for node_idx, i in node_positions.items()]
+            if len(readiness) == 1:
+                position = sa.literal(0)
+            else:
+                position = sa.case(*readiness)
+            candidates_query = sa.select([table.c.id, table.c.node_status, table.c.context,
+                                          position.label('node_position')]) \
+                .where(sa.and_(sa.or_(*[ready for ready, _ in readiness]),
+                               table.c.status == ProcessStatus.WAITING.value))
+            order_by = self.scheduling_policy.order_by(table)
+        candidates_query = self.scheduling_policy.prepare_candidates_query(candidates_query, table)
+        if prefer_order and len(node_positions) > 1:
+            order_by.insert(0, position)
+        candidates_query = candidates_query.order_by(*order_by).limit(sa.bindparam('limit'))
+        claim_query = candidates_query
+        if self.claim_strategy is not None:
+            claim_query = self.claim_strategy.prepare_candidates_query(candidates_query)
+        return ClaimPlan(node_names=node_names,
+                         node_enums=node_enums,
+                         prefer_order=prefer_order,
+                         candidates_query=candidates_query,
+                         claim_query=claim_query)
+
+    def _select_candidates(self, plan, node_cfgs, n, claim=True):
+        query = plan.claim_query if claim else plan.candidates_query
+        rows = self.scheduling_policy.select(self, query, n)
+        candidates = []
+        candidate_ids = set()
+        for id_, node_status, context, i in rows:
+            node_enum = plan.node_enums[i]
+            # The ready queue can hold a process once per node and stale rows of processes
+            # that were resumed or updated in between.
+            if id_ in candidate_ids or node_status[node_enum.value + 1] != NodeStatus.WAITING.value:
+                continue
+            candidates.append((id_, node_status, context, node_cfgs[i], node_enum))
+            candidate_ids.add(id_)
+        return candidates
+
+    def _supports_update_returning(self):
+        dialect = self._engine.dialect
+        return bool(getattr(dialect, 'update_returning', getattr(dialect, 'full_returning', False)))
+
+    def _claim_update(self, node_idx):
+        try:
+            return self._claim_updates[node_idx]
+        except KeyError:
+            pass
+        table = self._table
+        idx = node_idx + 1
+        claimed_node_status = sa.func.substr(table.c.node_status, 1, idx, type_=sa.String) \
+            + NodeStatus.RUNNING.value \
+            + sa.func.substr(table.c.node_status, idx + 2, type_=sa.String)
+        q = sa.update(table) \
+            .values(status=ProcessStatus.RUNNING.value,
+                    node_status=claimed_node_status,
+                    updated_node=self.update_enum(node_idx).name,
+                    updated_previous_status=NodeStatus.WAITING.value,
+                    **self._lease_values(table)) \
+            .where(sa.and_(table.c.id.in_(sa.bindparam('ids', expanding=True)),
+                           table.c.node_status.like(self._like_str(node_idx)),
+                           table.c.status == ProcessStatus.WAITING.value)) \
+            .returning(table.c.id, table.c.node_status)
+        self._claim_updates[node_idx] = q
+        return q
+
+    def _claim_processes_returning(self, candidates):
+        ids_by_node = {}
+        for id_, *_, node_enum in candidates:
+            ids_by_node.setdefault(node_enum.value, []).append(id_)
+        new_status = {}
+        for node_idx, ids in ids_by_node.items():
+            claimed = self._active_session.execute(self._claim_update(node_idx),
+                                                   {'ids': ids, **self._claim_lease}).fetchall()
+            new_status.update(claimed)
+            self._dequeue_ready([(id_, node_idx) for id_, _ in claimed])
+        self._active_session.commit()
+        return new_status
+
+    def _claim_processes_chunked(self, candidates):
+        new_status = {}
+        for chunk in _chunked(candidates, self.claim_chunk_size):
+            claimed = []
+            for id_, node_status, _, node_cfg, node_enum in chunk:
+                claimed_status = self._claim_process(id_, node_status, node_enum, commit=False)
+                if claimed_status is not None:
+                    new_status[id_] = claimed_status
+                    claimed.append((id_, node_enum.value))
+            self._dequeue_ready(claimed)
+            self._active_session.commit()
+        return new_status
+
+    def _dequeue_ready(self, claimed):
+        if not self.ready_queue or len(claimed) == 0:
+            return
+        ready_table = self._ready_table
+        q = sa.delete(ready_table).where(sa.and_(ready_table.c.id == sa.bindparam('b_id'),
+                                                 ready_table.c.node == sa.bindparam('b_node')))
+        self._active_session.execute(q, [{'b_id': id_, 'b_node': node_idx} for id_, node_idx in claimed])
+
+    def _ready_downstream_nodes(self, node_status, node_idx):
+        return [stop for stop, upstream in self._downstream_nodes[node_idx]
+                if node_status[stop + 1] == NodeStatus.WAITING.value
+                and all(node_status[i + 1] == NodeStatus.SUCCESS.value for i in upstream)]
+
+    def _write_ready_updates(self, ready_updates):
+        """Apply `{id: (nodes_to_enqueue, clear)}` to the ready queue table.
+
+        The table holds one row per process and node ready to run. Rows are
+        added when a process is added (root nodes) or the last upstream node
+        of a node succeeded and are removed when the node is claimed.
+        """
+        ready_table = self._ready_table
+        cleared = [id_ for id_, (_, clear) in ready_updates.items() if clear]
+        if cleared:
+            self._active_session.execute(sa.delete(ready_table).where(ready_table.c.id.in_(cleared)))
+        rows = [{'id': id_, 'node': node_idx}
+                for id_, (enqueue, _) in ready_updates.items()
+                for node_idx in enqueue]
+        if rows:
+            self._active_session.execute(ready_table.insert(), rows)
+
+    def create_result_container(self, processing_context) -> ResultContainer:
         if not processing_context.claimed:
             raise ValueError('Result containers can only be created for claimed processing_contexts.')
-        result_attributes = [('traceback', Union[str, None], dataclasses.field(default=None))]
-        for name, c in processing_context.config._dag_columns.get(self.name, {}).items():
-            try:
-                python_type = c.type.python_type
-            except NotImplementedError:
-                python_type = Any
-            result_attributes.append((name, python_type, dataclasses.field(default=None)))
-        return dataclasses.make_dataclass('ResultContainer', result_attributes)
-    
+        return self.result_container_class(processing_context.config)()
+
+    def result_container_class(self, node_cfg):
+        """Return the `ResultContainer` subclass of `node_cfg`, which is created once per node."""
+        try:
+            return self._result_container_classes[node_cfg.name]
+        except KeyError:
+            pass
+        node_columns = node_cfg._dag_columns.get(self.name, {})
+        fields = tuple(node_columns.keys())
+        cls = type('ResultContainer', (ResultContainer, ), {
+            '__slots__': fields,
+            '__qualname__': f'ResultContainer[{node_cfg.name}]',
+            '_fields': fields,
+            '_column_names': tuple(c.name for c in node_columns.values()),
+            '_get_values': _values_getter(fields)})
+        self._result_container_classes[node_cfg.name] = cls
+        return cls
 
     def store_result(self, processing_context, result_container):
+        """Write the result of a node.
+
+        With `fuse_nodes` the first downstream node that became ready is
+        claimed in the same transaction, if it is a fused node. Its
+        processing context is set as `fused_next` and should be processed
+        right away by the same worker:
+
+            while processing_context is not None:
+                with doa_datalayer.process(processing_context) as result_container:
+                    ...
+                processing_context = processing_context.fused_next
+        """
+        values = self._result_values(processing_context, result_container)
+        node_time = self._node_time(processing_context, NodeStatus.SUCCESS, values['finished'])
+        enqueue = self._ready_after_result(processing_context, values)
+        topic = 'store' if values['status'] == ProcessStatus.WAITING.value else None
+        fused_next = None
+        if self.fuse_nodes and values['status'] == ProcessStatus.WAITING.value:
+            fused_next = self._fuse_next(processing_context, values)
+            if fused_next is not None:
+                enqueue = [i for i in enqueue if i != fused_next.update_enum.value]
+                topic = None
+        written = self._update_process(processing_context.id_, values, enqueue=enqueue, topic=topic,
+                                       node_time=node_time, lease_token=processing_context.lease_token,
+                                       check_lease=fused_next is not None)
+        # The fused node is not claimed if the outcome of an expired claim was dropped.
+        processing_context.fused_next = fused_next = fused_next if written else None
+        if fused_next is not None:
+            if self.observers:
+                self._notify('on_claim', fused_next.config.name, fused_next.id_)
+            if self.lease_duration is not None:
+                # Buffered, the lease of the stored claim is extended until the fused claim is flushed.
+                self._claimed_leases[fused_next.id_] = self._pending_lease_tokens.get(fused_next.id_,
+                                                                                      fused_next.lease_token)
+
+    def _node_time(self, processing_context, status, finished):
+        if not self.node_timing or processing_context.claimed_time is None:
+            return None
+        return {'id': processing_context.id_,
+                'node': processing_context.update_enum.value,
+                'status': status.value,
+                'claimed': processing_context.claimed_time,
+                'finished': finished}
+
+    def _lazy_context(self, text):
+        return LazyContext(text, DOADataLayer.context_load, resolve=None if self.blob_store is None else self.resolve)
+
+    def _listed_fused_nodes(self):
+        """Names of the nodes explicitly listed in `fuse_nodes`."""
+        if not self.fuse_nodes or self.fuse_nodes is True:
+            return set()
+        return {c.name for c in self._as_node_cfg_list(self.fuse_nodes)}
+
+    def _fused_node_cfgs(self):
+        if self.fuse_nodes is True:
+            node_cfgs = [node_cfg for node_cfg, _, concurrency in self.node_functions.values() if concurrency is None]
+        else:
+            node_cfgs = self._as_node_cfg_list(self.fuse_nodes)
+        return {self._node_enums[c.name].value: c for c in node_cfgs}
+
+    def _fuse_next(self, processing_context, values):
+        """Claim the next fused node within `values` and return its processing context."""
+        node_status = values['node_status']
+        fused_node_cfgs = self._fused_node_cfgs()
+        for node_idx in self._ready_downstream_nodes(node_status, processing_context.update_enum.value):
+            if node_idx in fused_node_cfgs:
+                break
+        else:
+            return None
+        new_status = node_status[:node_idx + 1] + NodeStatus.RUNNING.value + node_status[node_idx + 2:]
+        node_enum = self.update_enum(node_idx)
+        values.update({'status': ProcessStatus.RUNNING.value,
+                       'node_status': new_status,
+                       'updated_node': node_enum.name,
+                       'updated_previous_status': NodeStatus.WAITING.value})
+        lease_token = None
+        if self.lease_duration is not None:
+            lease_token = uuid.uuid4().hex
+            values.update({'lease_expires': self._lease_expiry(), 'lease_token': lease_token, 'attempts': 1})
+        return ProcessingContext(config=fused_node_cfgs[node_idx],
+                                 id_=processing_context.id_,
+                                 # Changes of the upstream node to its context are not stored.
+                                 context=self._lazy_context(processing_context.stored_context),
+                                 stored_context=processing_context.stored_context,
+                                 update_enum=node_enum,
+                                 process_status=new_status,
+                                 previous_process_status=node_status,
+                                 claimed=True,
+                                 claimed_time=values['finished'] if self.node_timing else None,
+                                 lease_token=lease_token)
+
+    def _ready_after_result(self, processing_context, values):
+        if not self.ready_queue:
+            return ()
+        return self._ready_downstream_nodes(values['node_status'], processing_context.update_enum.value)
+
+    def _result_values(self, processing_context, result_container):
         new_status = list(processing_context.process_status)
         new_status[processing_context.update_enum.value + 1] = NodeStatus.SUCCESS.value
         new_status = ''.join(new_status)
@@ -364,91 +1146,443 @@ class DOADataLayer:
             'status': status,
             'updated_node': processing_context.update_enum.name,
         }
-        for name, c in processing_context.config._dag_columns.get(self.name, {}).items():
-            values[c.name] = getattr(result_container, name)
-        q = sa.update(self._table) \
-                .values(**values) \
-                .where(self._table.c.id == processing_context.id_)
-        res = self._active_session.execute(q)
-        self._active_session.commit()
+        if self.lease_duration is not None:
+            values.update({'lease_expires': None, 'lease_token': None, 'attempts': 0})
+        if isinstance(result_container, ResultContainer):
+            result_values = zip(result_container._column_names, result_container._get_values(result_container))
+        else:
+            result_values = [(c.name, getattr(result_container, name))
+                             for name, c in processing_context.config._dag_columns.get(self.name, {}).items()]
+        if self.blob_store is None:
+            values.update(result_values)
+        else:
+            for name, value in result_values:
+                column_type = self._table.c[name].type
+                if value is not None and getattr(column_type, 'blob_offloadable', False):
+                    value = column_type.process_bind_param(value, self._engine.dialect)
+                values[name] = self._offload(value)
+        return values
 
     def store_crash(self, processing_context, result_container):
         new_status = list(processing_context.process_status)
         new_status[processing_context.update_enum.value + 1] = NodeStatus.FAILED.value
         new_status = ''.join(new_status)
-        q = sa.update(self._table) \
-                .values(error_traceback=result_container.traceback,
-                        finished=datetime.datetime.now(),
-                        node_status=new_status,
-                        updated_node=processing_context.update_enum.name,
-                        updated_previous_status=processing_context.process_status,
-                        status=ProcessStatus.FAILED.value) \
-                .where(self._table.c.id == processing_context.id_)
-        res = self._active_session.execute(q)
-        self._active_session.commit()
+        values = {
+            'error_traceback': result_container.traceback,
+            'finished': datetime.datetime.now(),
+            'node_status': new_status,
+            'updated_node': processing_context.update_enum.name,
+            'updated_previous_status': processing_context.process_status,
+            'status': ProcessStatus.FAILED.value,
+        }
+        if self.lease_duration is not None:
+            values.update({'lease_expires': None, 'lease_token': None})
+        node_time = self._node_time(processing_context, NodeStatus.FAILED, values['finished'])
+        self._update_process(processing_context.id_, values, clear_ready=True, node_time=node_time,
+                             lease_token=processing_context.lease_token)
+
+    def _store_pause(self, processing_context, result_container, interrupt):
+        values = {'status': ProcessStatus.PAUSED.value,
+                  'updated_node': processing_context.update_enum}
+        if not interrupt.retry:
+            values = {**self._result_values(processing_context, result_container), **values}
+            enqueue = self._ready_after_result(processing_context, values)
+        else:
+            enqueue = [processing_context.update_enum.value] if self.ready_queue else ()
+            new_status = list(processing_context.previous_process_status)
+            node_idx = processing_context.update_enum.value + 1
+            new_status[node_idx] = NodeStatus.WAITING.value
+            new_status = ''.join(new_status)
+            values['node_status'] = new_status
+            if self.lease_duration is not None:
+                values.update({'lease_expires': None, 'lease_token': None, 'attempts': 0})
+        subscribe = ()
+        if interrupt.awaited_event is not None:
+            values['awaited_events'] = self._table.c.awaited_events + f'<{interrupt.awaited_event}>'
+            subscribe = (interrupt.awaited_event, )
+        node_time = self._node_time(processing_context, ProcessStatus.PAUSED, datetime.datetime.now())
+        self._update_process(processing_context.id_, values, enqueue=enqueue, subscribe=subscribe, node_time=node_time,
+                             lease_token=processing_context.lease_token)
+
+    def _update_process(self, id_, values, enqueue=(), clear_ready=False, topic=None, subscribe=(), node_time=None,
+                        lease_token=None, check_lease=False) -> bool:
+        """Write the outcome of a node.
 
-    def pause_process(self, processing_context, awaited_event=None):
-        pass
+        With leases the update is guarded by the `lease_token` of the claim,
+        so the outcome of an expired claim that was reaped is dropped.
+        Returns False if it was dropped. Buffered outcomes are only checked
+        against the lease right away with `check_lease`, otherwise when
+        they are flushed.
+        """
+        # Buffered, the claim holds the lease token that was written first.
+        if lease_token is not None and \
+                self._claimed_leases.get(id_) == self._pending_lease_tokens.get(id_, lease_token):
+            del self._claimed_leases[id_]
+        if self.lease_duration is None:
+            lease_token = None
+        if not self.result_buffer_size:
+            q = sa.update(self._table) \
+                .values(**values) \
+                .where(self._table.c.id == id_)
+            if lease_token is not None:
+                q = q.where(self._table.c.lease_token == lease_token)
+            res = self._active_session.execute(q)
+            if lease_token is not None and res.rowcount == 0:
+                self._active_session.rollback()
+                return False
+            if self.ready_queue and (enqueue or clear_ready):
+                self._write_ready_updates({id_: (enqueue, clear_ready)})
+            if subscribe:
+                self._write_subscriptions([(id_, event) for event in subscribe])
+            if node_time is not None:
+                self._active_session.execute(self._node_times_table.insert(), [node_time])
+            self._commit(topic)
+            return True
+        if lease_token is not None and check_lease and \
+                self._lost_leases({id_: self._pending_lease_tokens.get(id_, lease_token)}):
+            return False
+        self._pending_updates.setdefault(id_, {}).update(values)
+        if lease_token is not None:
+            # The first buffered update of a process has to match the database.
+            self._pending_lease_tokens.setdefault(id_, lease_token)
+        self._pending_subscriptions.extend((id_, event) for event in subscribe)
+        if node_time is not None:
+            self._pending_node_times.append(node_time)
+        if topic is not None:
+            self._pending_topics.add(topic)
+        if self.ready_queue and (enqueue or clear_ready):
+            pending_enqueue, pending_clear = self._pending_ready_updates.get(id_, ((), False))
+            self._pending_ready_updates[id_] = ([*pending_enqueue, *enqueue], pending_clear or clear_ready)
+        self._flush_due()
+        return True
+
+    def _flush_due(self):
+        if len(self._pending_updates) >= self.result_buffer_size:
+            self.flush_results()
+        elif self.result_buffer_interval is not None and \
+                time.monotonic() - self._last_flush >= self.result_buffer_interval:
+            self.flush_results()
+
+    def flush_results(self):
+        """Write all buffered results with one transaction.
+
+        Updates with the same set of columns are written with a single
+        executemany UPDATE. Only used if the data layer was created with a
+        `result_buffer_size`. Buffered results are written once
+        `result_buffer_size` processes are pending, `result_buffer_interval`
+        seconds passed since the last write (checked whenever a result is
+        stored or work is queried), by `call_out_event`/`resume` or when the
+        `with` block of the data layer is left. Until then the processes
+        remain RUNNING in the database, so buffered results of a worker that
+        dies are lost and the processes have to be recovered.
+        """
+        pending_updates, self._pending_updates = self._pending_updates, {}
+        pending_ready_updates, self._pending_ready_updates = self._pending_ready_updates, {}
+        pending_topics, self._pending_topics = self._pending_topics, set()
+        pending_subscriptions, self._pending_subscriptions = self._pending_subscriptions, []
+        pending_node_times, self._pending_node_times = self._pending_node_times, []
+        pending_lease_tokens, self._pending_lease_tokens = self._pending_lease_tokens, {}
+        self._last_flush = time.monotonic()
+        if len(pending_updates) == 0:
+            return
+        table = self._table
+        if pending_lease_tokens:
+            lost = self._lost_leases(pending_lease_tokens)
+            if lost:
+                pending_updates = {k: v for k, v in pending_updates.items() if k not in lost}
+                pending_ready_updates = {k: v for k, v in pending_ready_updates.items() if k not in lost}
+                pending_subscriptions = [s for s in pending_subscriptions if s[0] not in lost]
+                pending_node_times = [t for t in pending_node_times if t['id'] not in lost]
+                for id_ in lost:
+                    if self._claimed_leases.get(id_) == pending_lease_tokens[id_]:
+                        del self._claimed_leases[id_]
+        updates_by_keys = {}
+        for id_, values in pending_updates.items():
+            lease_token = pending_lease_tokens.get(id_)
+            if any(isinstance(v, sa.sql.ClauseElement) for v in values.values()):
+                q = sa.update(table).values(**values).where(table.c.id == id_)
+                if lease_token is not None:
+                    q = q.where(table.c.lease_token == lease_token)
+                self._active_session.execute(q)
+            else:
+                keys = tuple(sorted(values.keys()))
+                params = {'b_id': id_, **{f'b_{k}': v for k, v in values.items()}}
+                if lease_token is not None:
+                    params['b_expected_lease_token'] = lease_token
+                updates_by_keys.setdefault((keys, lease_token is not None), []).append(params)
+        for (keys, guarded), params in updates_by_keys.items():
+            q = sa.update(table) \
+                .values({k: sa.bindparam(f'b_{k}') for k in keys}) \
+                .where(table.c.id == sa.bindparam('b_id'))
+            if guarded:
+                q = q.where(table.c.lease_token == sa.bindparam('b_expected_lease_token'))
+            self._active_session.execute(q, params)
+        if pending_ready_updates:
+            self._write_ready_updates(pending_ready_updates)
+        if pending_subscriptions:
+            self._write_subscriptions(pending_subscriptions)
+        if pending_node_times:
+            self._active_session.execute(self._node_times_table.insert(), pending_node_times)
+        self._commit(*pending_topics)
+        for id_, values in pending_updates.items():
+            # Fused claims hold their own lease once they are written, released ones none.
+            if 'lease_token' not in values:
+                continue
+            if values['lease_token'] is None:
+                self._claimed_leases.pop(id_, None)
+            elif id_ in self._claimed_leases:
+                self._claimed_leases[id_] = values['lease_token']
+
+    def _lost_leases(self, lease_tokens):
+        """Ids of `{id: lease_token}` that were reaped and possibly claimed again."""
+        table = self._table
+        lost = set()
+        for chunk in _chunked(lease_tokens.keys(), 1000):
+            q = sa.select([table.c.id, table.c.lease_token]).where(table.c.id.in_(chunk))
+            lost.update(id_ for id_, lease_token in self._active_session.execute(q) if lease_token != lease_tokens[id_])
+        return lost
+
+    def _commit(self, *topics):
+        topics = [t for t in topics if t is not None]
+        notifier = self.notifier
+        if notifier is None or len(topics) == 0:
+            self._active_session.commit()
+        elif notifier.transactional:
+            notifier.publish(topics, self._active_session)
+            self._active_session.commit()
+        else:
+            self._active_session.commit()
+            notifier.publish(topics)
+
+    def _subscription(self):
+        if self._notifier_subscription is None or self._notifier_subscription[0] != os.getpid():
+            self._notifier_subscription = (os.getpid(), self.notifier.subscribe())
+        return self._notifier_subscription[1]
+
+    def wait_for_work(self, node_cfgs, timeout=None, n=1, prefer_order=False) -> List[ProcessingContext]:
+        """Claim up to `n` processes and block until work is available if there is none.
+
+        Waits for notifications of the `notifier` of the data layer for at
+        most `timeout` seconds (forever for None) and returns an empty list
+        if no work could be claimed in time.
+        """
+        if self.notifier is None:
+            raise ValueError('Waiting for work requires a DOADataLayer(notifier=)')
+        subscription = self._subscription()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            processing_contexts = self.query_for_work_batch(node_cfgs, n, prefer_order=prefer_order)
+            if len(processing_contexts) > 0:
+                return processing_contexts
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            if not subscription.wait(remaining):
+                return []
 
     @contextmanager
     def process(self, processing_context):
         result_container = self.create_result_container(processing_context)
         self._running_processes[processing_context.id_] = result_container
+        start = time.perf_counter() if self.observers else None
         try:
             yield result_container
         except Paused as interrupt:
-            values = {'status': ProcessStatus.PAUSED.value,
-                      'updated_node': processing_context.update_enum}
-            if not interrupt.retry:
-                self.store_result(processing_context, result_container)
-            else:
-                new_status = list(processing_context.previous_process_status)
-                node_idx = processing_context.update_enum.value + 1
-                new_status[node_idx] = NodeStatus.WAITING.value
-                new_status = ''.join(new_status)
-                values['node_status'] = new_status
-            if interrupt.awaited_event is not None:
-                values['awaited_events'] = self._table.c.awaited_events + f'<{interrupt.awaited_event}>'
-            q = sa.update(self._table) \
-                .values(**values) \
-                .where(self._table.c.id == processing_context.id_)
-            res = self._active_session.execute(q)
-            self._active_session.commit()
-
+            self._store_pause(processing_context, result_container, interrupt)
+            if start is not None:
+                self._notify('on_pause', processing_context.config.name, processing_context.id_,
+                             time.perf_counter() - start, interrupt.awaited_event)
         except Exception as err:
             buffer = io.StringIO()
             traceback.print_exc(file=buffer)
             result_container.traceback = buffer.getvalue()
             self.store_crash(processing_context, result_container)
+            if start is not None:
+                self._notify('on_crash', processing_context.config.name, processing_context.id_,
+                             time.perf_counter() - start)
         else:
+            store_start = time.perf_counter() if start is not None else None
             self.store_result(processing_context, result_container)
+            if start is not None:
+                end = time.perf_counter()
+                self._notify('on_store', processing_context.config.name, processing_context.id_,
+                             end - start, end - store_start)
         finally:
             del self._running_processes[processing_context.id_]
 
-    def add_process(self, context={}, **kwargs):
-        if self._active_session is None:
-            raise ValueError('Use or with DOADataLayer(engine=) before adding a process to the database.')
-        mandatory_kw = [c.name for c in self.initial_columns if c.default is None]
-        optional_kw = [c.name for c in self.initial_columns if c.default is not None]
-        values = {'context': DOADataLayer.context_dump(context)}
-        for kw in mandatory_kw:
+    def _initial_column_values(self, kwargs, check_mandatory=True):
+        values = {}
+        for kw in self._mandatory_kw:
             try:
                 value = kwargs.pop(kw)
             except KeyError:
-                raise ValueError(f'A kwarg "{kw}" has to be provided, because an initial column "{kw}" with no default is used')
+                if check_mandatory:
+                    raise ValueError(f'A kwarg "{kw}" has to be provided, because an initial column "{kw}" with no default is used')
             else:
                 values[kw] = value
-        for kw in optional_kw:
+        for kw in self._optional_kw:
             try:
                 value = kwargs.pop(kw)
             except KeyError:
                 pass
             else:
                 values[kw] = value
+        if 'priority' in kwargs:
+            values['priority'] = kwargs.pop('priority')
+        return values
+
+    def _dump_context(self, context):
+        if self.context_codec is None:
+            return self._offload(DOADataLayer.context_dump(context))
+        return self._offload(encode_context(context, self.context_codec))
+
+    def _offload(self, value):
+        blob_store = self.blob_store
+        if blob_store is None or not isinstance(value, (str, bytes)) or len(value) < blob_store.threshold:
+            return value
+        data = value.encode('utf-8') if isinstance(value, str) else value
+        return blob_ref(blob_store.put(data), like=value)
+
+    def resolve(self, value, column=None):
+        """Load `value` from the blob store if it is a blob reference.
+
+        If the type of `column` defines `load_blob`, it creates the value
+        from the memory mapped blob.
+        """
+        digest = parse_blob_ref(value)
+        if digest is None:
+            return value
+        if self.blob_store is None:
+            raise ValueError(f'{value!r} references a blob, but the data layer has no blob_store')
+        data = self.blob_store.open(digest)
+        load_blob = getattr(getattr(column, 'type', None), 'load_blob', None)
+        if load_blob is not None:
+            return load_blob(data)
+        return str(data, 'utf-8') if isinstance(value, str) else bytes(data)
+
+    def add_process(self, context={}, **kwargs):
+        if self._active_session is None:
+            raise ValueError('Use or with DOADataLayer(engine=) before adding a process to the database.')
+        values = self._initial_column_values(kwargs)
+        values['context'] = self._dump_context(context)
+        if self.node_timing:
+            values['started'] = datetime.datetime.now()
         q = self.table.insert().values(**values)
-        res = self._active_session.execute(q)
-        self._active_session.commit()
-        return res.lastrowid
+        id_ = self._active_session.execute(q).inserted_primary_key[0]
+        if self.ready_queue:
+            self._write_ready_updates({id_: (self._root_nodes, False)})
+        self._commit('add')
+        return id_
+
+    def add_processes(self, contexts, chunk_size=1000, use_copy=True, **kwargs) -> List[int]:
+        """Add many processes with one INSERT (or COPY) and one commit per chunk.
+
+        `contexts` can be any iterable, e.g. a generator, and is consumed in
+        chunks of `chunk_size`. An item is either the context of a process or a
+        tuple `(context, kwargs)` with values for the initial columns of this
+        process, which take precedence over the `kwargs` shared by all processes.
+        The shared `kwargs` are validated once. On PostgreSQL the rows are
+        streamed with COPY if `use_copy` is set and the driver supports it.
+
+        Returns the ids of the new processes in the order of `contexts`.
+        """
+        if self._active_session is None:
+            raise ValueError('Use or with DOADataLayer(engine=) before adding a process to the database.')
+        shared_values = self._initial_column_values(kwargs, check_mandatory=False)
+        initial_kw = set(self._mandatory_kw + self._optional_kw + ['priority'])
+        missing_kw = set(self._mandatory_kw) - set(shared_values.keys())
+        ids = []
+        for chunk in _chunked(contexts, chunk_size):
+            rows = []
+            started = datetime.datetime.now() if self.node_timing else None
+            for item in chunk:
+                if isinstance(item, tuple):
+                    context, row_kwargs = item
+                    values = {**shared_values, **{k: v for k, v in row_kwargs.items() if k in initial_kw}}
+                    if not missing_kw.issubset(values.keys()):
+                        kw = sorted(missing_kw - set(values.keys()))[0]
+                        raise ValueError(f'A kwarg "{kw}" has to be provided, because an initial column "{kw}" with no default is used')
+                elif missing_kw:
+                    kw = sorted(missing_kw)[0]
+                    raise ValueError(f'A kwarg "{kw}" has to be provided, because an initial column "{kw}" with no default is used')
+                else:
+                    context = item
+                    values = dict(shared_values)
+                values['context'] = self._dump_context(context)
+                if started is not None:
+                    values['started'] = started
+                rows.append(values)
+            chunk_ids = self._insert_processes(rows, use_copy=use_copy)
+            if self.ready_queue:
+                self._write_ready_updates({id_: (self._root_nodes, False) for id_ in chunk_ids})
+            self._commit('add')
+            ids.extend(chunk_ids)
+        return ids
+
+    def _insert_processes(self, rows, use_copy=True):
+        session = self._active_session
+        table = self.table
+        dialect = self._engine.dialect
+        if dialect.name == 'postgresql':
+            sequence = sa.func.pg_get_serial_sequence(dialect.identifier_preparer.format_table(table), 'id')
+            q = sa.select([sa.func.nextval(sequence)]).select_from(sa.func.generate_series(1, len(rows)))
+            ids = [id_ for id_, in session.execute(q)]
+        elif dialect.name == 'sqlite':
+            # The first insert acquires the write lock of the database. Until the
+            # commit no other connection can insert rows, so the following ids are free.
+            first_id = session.execute(table.insert().values(**rows[0])).lastrowid
+            ids = list(range(first_id, first_id + len(rows)))
+            rows, ids_to_insert = rows[1:], ids[1:]
+            for row, id_ in zip(rows, ids_to_insert):
+                row['id'] = id_
+            if len(rows) > 0:
+                self._executemany_insert(rows)
+            return ids
+        else:
+            # Without RETURNING for executemany or a sequence to reserve ids, the ids of the
+            # processes are only known if they are inserted one by one.
+            return [session.execute(table.insert().values(**row)).inserted_primary_key[0] for row in rows]
+        for row, id_ in zip(rows, ids):
+            row['id'] = id_
+        if use_copy and self._copy_processes(rows):
+            return ids
+        self._executemany_insert(rows)
+        return ids
+
+    def _executemany_insert(self, rows):
+        rows_by_keys = {}
+        for row in rows:
+            rows_by_keys.setdefault(tuple(sorted(row.keys())), []).append(row)
+        for rows_i in rows_by_keys.values():
+            self._active_session.execute(self.table.insert(), rows_i)
+
+    def _copy_processes(self, rows):
+        """Insert `rows` with COPY and return False if they can not be copied."""
+        columns = sorted(rows[0].keys())
+        # COPY writes NULL for missing fields instead of applying the default of the column.
+        if any(len(row) != len(columns) or any(c not in row for c in columns) for row in rows):
+            return False
+        if any(c.default is not None and c.name not in columns for c in self.initial_columns):
+            return False
+        dbapi_connection = self._active_session.connection().connection
+        cursor = dbapi_connection.cursor()
+        if not hasattr(cursor, 'copy_expert'):
+            return False
+        dialect = self._engine.dialect
+        processors = [self.table.c[c].type.bind_processor(dialect) for c in columns]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows:
+            values = [row[c] if processor is None else processor(row[c]) for c, processor in zip(columns, processors)]
+            # Values the driver would adapt itself, e.g. bytes of a PickleType, have no CSV representation.
+            if any(not isinstance(v, COPY_TYPES) for v in values):
+                return False
+            writer.writerow(values)
+        buffer.seek(0)
+        preparer = self._engine.dialect.identifier_preparer
+        column_list = ', '.join(preparer.quote(c) for c in columns)
+        cursor.copy_expert(f'COPY {preparer.format_table(self.table)} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+        return True
 
     def col(self, node_cfg, col, check_added=True):
         not_found_err = AttributeError(f'No column "{col}" found!')
@@ -479,17 +1613,84 @@ class DOADataLayer:
         else:
             raise TypeError('"col" has to be int, str or sa.Column')
 
+    def _write_subscriptions(self, subscriptions):
+        """Subscribe the processes to the events of the `(id, event)` pairs."""
+        events_table = self._events_table
+        params = [{'b_id': id_, 'b_event': event} for id_, event in dict.fromkeys(subscriptions)]
+        q = sa.delete(events_table).where(sa.and_(events_table.c.id == sa.bindparam('b_id'),
+                                                  events_table.c.event == sa.bindparam('b_event')))
+        self._active_session.execute(q, params)
+        self._active_session.execute(events_table.insert(),
+                                     [{'id': p['b_id'], 'event': p['b_event']} for p in params])
+
     def call_out_event(self, event):
-        event = f'<{event}>'
-        q = sa.update(self._table) \
-                .values(updated_node='CONTEXT',
-                        status=ProcessStatus.WAITING.value,
-                        awaited_events=sql_func.replace(self._table.c.awaited_events, event, '')) \
-                .where(self._table.c.awaited_events.like(f'%{event}%'))
-        res = self._active_session.execute(q)
+        self.call_out_events([event])
+
+    def call_out_events(self, events):
+        """Wake up the processes paused for any of the `events` within one transaction.
+
+        The subscribed processes are looked up by event in the
+        `<name>_events` table. The `awaited_events` column is kept up to
+        date for compatibility.
+        """
+        self.flush_results()
+        events = list(dict.fromkeys(events))
+        if len(events) == 0:
+            return
+        table, events_table = self._table, self._events_table
+        subscribed = sa.select([events_table.c.id]).where(events_table.c.event == sa.bindparam('b_event'))
+        q = sa.update(table) \
+            .values(updated_node='CONTEXT',
+                    status=ProcessStatus.WAITING.value,
+                    awaited_events=sql_func.replace(table.c.awaited_events, sa.bindparam('b_tag', type_=sa.Text), '')) \
+            .where(sa.and_(table.c.id.in_(subscribed),
+                           table.c.status == ProcessStatus.PAUSED.value))
+        rowcount = 0
+        for chunk in _chunked(events, 1000):
+            res = self._active_session.execute(q, [{'b_event': e, 'b_tag': f'<{e}>'} for e in chunk])
+            rowcount += max(res.rowcount, 0)
+            self._active_session.execute(sa.delete(events_table).where(events_table.c.event.in_(chunk)))
+        self._commit('event' if rowcount else None)
+        if self.observers:
+            self._notify('on_event_callout', events, rowcount)
+
+    def sync_event_subscriptions(self):
+        """Subscribe paused processes to the events in their `awaited_events` column.
+
+        Only needed once for tables created before the `<name>_events` table existed.
+        """
+        self.flush_results()
+        table = self._table
+        q = sa.select([table.c.id, table.c.awaited_events]) \
+            .where(sa.and_(table.c.status == ProcessStatus.PAUSED.value,
+                           table.c.awaited_events != ''))
+        subscriptions = [(id_, event)
+                         for id_, awaited_events in self._active_session.execute(q).fetchall()
+                         for event in awaited_events.strip('<>').split('><')]
+        if subscriptions:
+            self._write_subscriptions(subscriptions)
+        self._active_session.commit()
+
+    def sync_ready_queue(self):
+        """Rebuild the `<name>_ready` table from the `node_status` of the processes.
+
+        Has to be run once when `ready_queue` is enabled for an existing
+        table, because processes added before are not in the queue.
+        """
+        if not self.ready_queue:
+            raise ValueError('Syncing the ready queue requires a DOADataLayer(ready_queue=True)')
+        self.flush_results()
+        table, ready_table = self._table, self._ready_table
+        self._active_session.execute(sa.delete(ready_table))
+        pending = table.c.status.in_([ProcessStatus.WAITING.value, ProcessStatus.PAUSED.value])
+        for node_idx in self._upstream_nodes.keys():
+            ready = sa.select([table.c.id, sa.literal(node_idx)]) \
+                .where(sa.and_(pending, table.c.node_status.like(self._like_str(node_idx))))
+            self._active_session.execute(ready_table.insert().from_select(['id', 'node'], ready))
         self._active_session.commit()
 
     def resume(self, id_=None, force_resume=False):
+        self.flush_results()
         values = {'updated_node': 'CONTEXT',
                   'status': ProcessStatus.WAITING.value,
                   'awaited_events': ''}
@@ -503,5 +1704,237 @@ class DOADataLayer:
             where_conditions = [sa.and_(*where_conditions)]
         q = q.where(*where_conditions)
         res = self._active_session.execute(q)
+        if force_resume and res.rowcount:
+            table, events_table = self._table, self._events_table
+            resumed = events_table.c.id == id_ if id_ else ~sa.exists().where(
+                sa.and_(table.c.id == events_table.c.id, table.c.status == ProcessStatus.PAUSED.value))
+            self._active_session.execute(sa.delete(events_table).where(resumed))
+        self._commit('resume' if res.rowcount else None)
+            
+
+    def heartbeat(self, ids=None, connection=None) -> int:
+        """Extend the leases of the running processes `ids`.
+
+        Defaults to all processes claimed by this data layer whose outcome
+        was not stored yet. Only leases of claims of this data layer are
+        extended, not those of processes that were reaped and claimed by a
+        different worker. `connection` is used instead of the active
+        session, e.g. by a heartbeat thread, and has to be committed by the
+        caller. Returns the number of extended leases.
+        """
+        if self.lease_duration is None:
+            raise ValueError(f'The data layer "{self.name}" has no lease_duration')
+        # Copying the dict is atomic, so it can be called from a different thread.
+        claimed_leases = self._claimed_leases.copy()
+        if ids is not None:
+            claimed_leases = {id_: claimed_leases[id_] for id_ in ids if id_ in claimed_leases}
+        ids_by_token = {}
+        for id_, lease_token in claimed_leases.items():
+            ids_by_token.setdefault(lease_token, []).append(id_)
+        table = self.table
+        lease_expires = self._lease_expiry()
+        execute = self._active_session.execute if connection is None else connection.execute
+        extended = 0
+        for lease_token, token_ids in ids_by_token.items():
+            q = sa.update(table) \
+                .values(lease_expires=lease_expires,
+                        updated_time=table.c.updated_time) \
+                .where(sa.and_(table.c.id.in_(token_ids),
+                               table.c.lease_token == lease_token,
+                               table.c.status == ProcessStatus.RUNNING.value))
+            extended += execute(q).rowcount
+        if connection is None and ids_by_token:
+            self._active_session.commit()
+        return extended
+
+    def reap_expired(self, now=None) -> Tuple[int, int]:
+        """Return the running processes whose lease expired before `now` to WAITING.
+
+        Processes whose node was claimed `max_attempts` times without an
+        outcome are marked as FAILED instead. Outcomes stored later for the
+        expired claims are dropped. Returns the number of returned and
+        failed processes.
+        """
+        if self.lease_duration is None:
+            raise ValueError(f'The data layer "{self.name}" has no lease_duration')
+        self.flush_results()
+        now = datetime.datetime.now() if now is None else now
+        table = self._table
+        expired = sa.and_(table.c.status == ProcessStatus.RUNNING.value,
+                          table.c.lease_expires < now)
+        rows = self._active_session.execute(
+            sa.select([table.c.id, table.c.node_status, table.c.attempts]).where(expired)).fetchall()
+        retry = [(id_, node_status) for id_, node_status, attempts in rows
+                 if self.max_attempts is None or attempts < self.max_attempts]
+        failed = [(id_, node_status) for id_, node_status, attempts in rows
+                  if self.max_attempts is not None and attempts >= self.max_attempts]
+        running = NodeStatus.RUNNING.value
+        retried_count, failed_count = 0, 0
+        for chunk in _chunked(retry, 1000):
+            q = sa.update(table) \
+                .values(status=ProcessStatus.WAITING.value,
+                        node_status=sql_func.replace(table.c.node_status, running, NodeStatus.WAITING.value),
+                        updated_previous_status=running,
+                        lease_expires=None,
+                        lease_token=None) \
+                .where(sa.and_(table.c.id.in_([id_ for id_, _ in chunk]), expired))
+            retried_count += self._active_session.execute(q).rowcount
+            if self.ready_queue:
+                # Only one node of a process runs at a time. Rows of claims that were extended
+                # in the meantime are skipped when querying for work.
+                ready_table = self._ready_table
+                rows = [{'b_id': id_, 'b_node': node_status.index(running) - 1} for id_, node_status in chunk]
+                self._active_session.execute(
+                    sa.delete(ready_table).where(sa.and_(ready_table.c.id == sa.bindparam('b_id'),
+                                                         ready_table.c.node == sa.bindparam('b_node'))), rows)
+                self._active_session.execute(ready_table.insert(),
+                                             [{'id': r['b_id'], 'node': r['b_node']} for r in rows])
+        for chunk in _chunked(failed, 1000):
+            q = sa.update(table) \
+                .values(status=ProcessStatus.FAILED.value,
+                        node_status=sql_func.replace(table.c.node_status, running, NodeStatus.FAILED.value),
+                        updated_previous_status=running,
+                        error_traceback=f'The lease of the claim expired {self.max_attempts} times',
+                        finished=now,
+                        lease_expires=None,
+                        lease_token=None) \
+                .where(sa.and_(table.c.id.in_([id_ for id_, _ in chunk]), expired))
+            failed_count += self._active_session.execute(q).rowcount
+            if self.ready_queue:
+                self._write_ready_updates({id_: ((), True) for id_, _ in chunk})
+        self._commit('resume' if retried_count else None)
+        return retried_count, failed_count
+
+    def processes(self) -> sa.sql.FromClause:
+        """All processes including the archived ones to select from, e.g.
+
+            processes = doa_datalayer.processes()
+            sa.select([processes.c.id]).where(processes.c.status == 'F')
+        """
+        table = self.table
+        if self._archive_table is None:
+            return table
+        archive_table = self._archive_table
+        return sa.union_all(
+            sa.select([table.c[c.name] for c in archive_table.columns]),
+            sa.select([*archive_table.columns])).subquery(f'{self.name}_processes')
+
+    def get_process(self, id_):
+        """The row of the process `id_` from the table or the archive, None if it does not exist."""
+        for table in [self.table, self._archive_table]:
+            if table is None:
+                continue
+            row = self._active_session.execute(sa.select([table]).where(table.c.id == id_)).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def archive_processes(self, older_than=None, chunk_size=10000) -> int:
+        """Move the succeeded and failed processes last updated before `older_than` to the archive.
+
+        The processes are moved with one INSERT ... SELECT and one DELETE
+        per chunk of `chunk_size` processes, each chunk in its own
+        transaction. Returns the number of archived processes. The archive
+        has the same columns as the table and is partitioned by month of
+        `finished` on PostgreSQL. `processes`, `get_process`,
+        `delete_processes`, `collect_blobs` and `doa_pipeline.timing`
+        include the archived processes.
+        """
+        if self._archive_table is None:
+            raise ValueError(f'The data layer "{self.name}" has no archive')
+        self.flush_results()
+        table, archive_table = self._table, self._archive_table
+        finished = table.c.status.in_([ProcessStatus.SUCCESS.value, ProcessStatus.FAILED.value])
+        if older_than is not None:
+            finished = sa.and_(finished, table.c.updated_time < older_than)
+        columns = [c.name for c in archive_table.columns]
+        archived = 0
+        while True:
+            ids = [id_ for id_, in self._active_session.execute(
+                sa.select([table.c.id]).where(finished).order_by(table.c.id).limit(chunk_size))]
+            if len(ids) == 0:
+                break
+            chunk = table.c.id.in_(ids)
+            self._ensure_archive_partitions(chunk)
+            select = sa.select([sa.func.coalesce(table.c.finished, table.c.updated_time) if c == 'finished' else table.c[c]
+                                for c in columns]).where(chunk)
+            self._active_session.execute(archive_table.insert().from_select(columns, select))
+            if self.ready_queue:
+                self._active_session.execute(sa.delete(self._ready_table).where(self._ready_table.c.id.in_(ids)))
+            self._active_session.execute(sa.delete(self._events_table).where(self._events_table.c.id.in_(ids)))
+            self._active_session.execute(sa.delete(table).where(chunk))
+            self._active_session.commit()
+            archived += len(ids)
+            if len(ids) < chunk_size:
+                break
+        return archived
+
+    def _ensure_archive_partitions(self, condition):
+        """Create the monthly partitions of the archive for the processes matching `condition` on PostgreSQL."""
+        if self._engine.dialect.name != 'postgresql':
+            return
+        table = self._table
+        month = sa.func.date_trunc('month', sa.func.coalesce(table.c.finished, table.c.updated_time))
+        preparer = self._engine.dialect.identifier_preparer
+        for start, in self._active_session.execute(sa.select([month]).distinct().where(condition)):
+            partition = f'{self.name}_archive_{start:%Y_%m}'
+            if partition in self._archive_partitions:
+                continue
+            stop = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            self._active_session.execute(sa.text(
+                f'CREATE TABLE IF NOT EXISTS {preparer.quote(partition)} '
+                f'PARTITION OF {preparer.format_table(self._archive_table)} '
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{stop:%Y-%m-%d}')"))
+            self._archive_partitions.add(partition)
+
+    def delete_processes(self, ids, grace=3600.):
+        """Delete the processes `ids` and collect the blobs no longer referenced (see `collect_blobs`)."""
+        self.flush_results()
+        ids = list(ids)
+        for chunk in _chunked(ids, 1000):
+            if self.ready_queue:
+                self._active_session.execute(sa.delete(self._ready_table).where(self._ready_table.c.id.in_(chunk)))
+            self._active_session.execute(sa.delete(self._events_table).where(self._events_table.c.id.in_(chunk)))
+            if self.node_timing:
+                self._active_session.execute(
+                    sa.delete(self._node_times_table).where(self._node_times_table.c.id.in_(chunk)))
+            self._active_session.execute(sa.delete(self._table).where(self._table.c.id.in_(chunk)))
+            if self._archive_table is not None:
+                self._active_session.execute(
+                    sa.delete(self._archive_table).where(self._archive_table.c.id.in_(chunk)))
         self._active_session.commit()
-            
\ No newline at end of file
+        if self.blob_store is not None:
+            self.collect_blobs(grace=grace)
+
+    def _blob_columns(self):
+        names = ['context']
+        for node_columns in self.columns.values():
+            for c in node_columns.values():
+                try:
+                    python_type = c.type.python_type
+                except NotImplementedError:
+                    continue
+                if python_type in (str, bytes):
+                    names.append(c.name)
+        tables = [self._table] + ([self._archive_table] if self._archive_table is not None else [])
+        return [table.c[name] for table in tables for name in names]
+
+    def collect_blobs(self, grace=3600.):
+        """Delete the blobs not referenced by any process.
+
+        Blobs written within the last `grace` seconds are kept, because
+        the rows referencing them might not be committed yet.
+        Returns the number of deleted blobs.
+        """
+        if self.blob_store is None:
+            raise ValueError('The data layer has no blob_store')
+        referenced = set()
+        for column in self._blob_columns():
+            prefix = BLOB_REF_PREFIX
+            if column.type.python_type is bytes:
+                prefix = prefix.encode('ascii')
+            # LIKE does not match binary values on SQLite.
+            q = sa.select([column]).where(sa.func.substr(column, 1, len(prefix)) == prefix)
+            for value, in self._active_session.execute(q):
+                referenced.add(parse_blob_ref(value))
+        return self.blob_store.collect(referenced, grace=grace)
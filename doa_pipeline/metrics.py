@@ -0,0 +1,231 @@
+"""Observers of the data layer and a metrics collector.
+
+Observers are passed to the data layer and are called on the hot path
+of querying for work and storing results:
+
+    metrics = MetricsCollector()
+    doa_datalayer = DOADataLayer('pipeline', observers=[metrics])
+    ...
+    print(metrics.to_prometheus())
+
+Without observers the data layer skips the hooks (and taking the
+timings) completely. Every worker process has its own observers, so
+the metrics of the workers of `doa_pipeline.worker` have to be exported
+and aggregated per process.
+"""
+import bisect
+import json
+import math
+import threading
+import time
+from typing import (
+    Dict,
+    Iterable,
+    Optional,
+    Sequence,
+    Tuple)
+
+
+class Observer:
+    """No-op base class of the observers of a data layer.
+
+    Durations are in seconds. `node_names` of a poll are the names of all
+    nodes queried at once.
+    """
+
+    def on_poll(self, node_names: Tuple[str, ...], n: int, returned: int, duration: float):
+        pass
+
+    def on_claim(self, node_name: str, id_: int):
+        pass
+
+    def on_claim_conflict(self, node_name: str, id_: int):
+        """A selected process was claimed by a different worker first."""
+
+    def on_store(self, node_name: str, id_: int, duration: float, store_duration: float):
+        """`duration` is the time spent in `DOADataLayer.process`, `store_duration` the part storing the result."""
+
+    def on_crash(self, node_name: str, id_: int, duration: float):
+        pass
+
+    def on_pause(self, node_name: str, id_: int, duration: float, awaited_event: Optional[str]):
+        pass
+
+    def on_event_callout(self, events: Sequence[str], resumed: int):
+        pass
+
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 300., math.inf)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing the `q` quantile."""
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {'buckets': {_format_bound(b): c for b, c in zip(self.buckets, self.counts)},
+                'sum': self.sum,
+                'count': self.count}
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == math.inf else repr(bound)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsCollector(Observer):
+    COUNTERS = {
+        'polls_total': 'Queries for work.',
+        'claims_total': 'Processes claimed.',
+        'claim_conflicts_total': 'Selected processes claimed by a different worker first.',
+        'stored_total': 'Results stored.',
+        'crashes_total': 'Crashed processes.',
+        'pauses_total': 'Paused processes.',
+        'events_total': 'Events called out.',
+        'resumed_total': 'Processes resumed by called out events.',
+    }
+    HISTOGRAMS = {
+        'poll_duration_seconds': 'Duration of the queries for work.',
+        'node_duration_seconds': 'Time spent processing a node, including storing its result.',
+        'store_duration_seconds': 'Time spent storing results.',
+    }
+
+    def __init__(self, namespace: str = 'doa', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Keeps counters and histograms of the data layer per node.
+
+        Metrics are labeled with the `node` (the comma separated nodes of a
+        poll) and the `outcome` (success, crash, pause) of processing a node.
+        """
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf, )
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Tuple, float]] = {name: {} for name in self.COUNTERS}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {name: {} for name in self.HISTOGRAMS}
+
+    def _inc(self, name, labels, value=1):
+        counter = self.counters[name]
+        counter[labels] = counter.get(labels, 0) + value
+
+    def _observe(self, name, labels, value):
+        histograms = self.histograms[name]
+        try:
+            histogram = histograms[labels]
+        except KeyError:
+            histogram = histograms[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def on_poll(self, node_names, n, returned, duration):
+        labels = (('node', ','.join(node_names)), )
+        with self._lock:
+            self._inc('polls_total', labels)
+            self._observe('poll_duration_seconds', labels, duration)
+
+    def on_claim(self, node_name, id_):
+        with self._lock:
+            self._inc('claims_total', (('node', node_name), ))
+
+    def on_claim_conflict(self, node_name, id_):
+        with self._lock:
+            self._inc('claim_conflicts_total', (('node', node_name), ))
+
+    def on_store(self, node_name, id_, duration, store_duration):
+        labels = (('node', node_name), )
+        with self._lock:
+            self._inc('stored_total', labels)
+            self._observe('node_duration_seconds', labels + (('outcome', 'success'), ), duration)
+            self._observe('store_duration_seconds', labels, store_duration)
+
+    def on_crash(self, node_name, id_, duration):
+        labels = (('node', node_name), )
+        with self._lock:
+            self._inc('crashes_total', labels)
+            self._observe('node_duration_seconds', labels + (('outcome', 'crash'), ), duration)
+
+    def on_pause(self, node_name, id_, duration, awaited_event):
+        labels = (('node', node_name), )
+        with self._lock:
+            self._inc('pauses_total', labels)
+            self._observe('node_duration_seconds', labels + (('outcome', 'pause'), ), duration)
+
+    def on_event_callout(self, events, resumed):
+        with self._lock:
+            self._inc('events_total', (), len(events))
+            self._inc('resumed_total', (), resumed)
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            for metrics in [*self.counters.values(), *self.histograms.values()]:
+                metrics.clear()
+
+    def snapshot(self) -> dict:
+        """JSON serializable snapshot of all metrics."""
+        with self._lock:
+            return {
+                'started': self.started,
+                'time': time.time(),
+                'counters': {name: [{'labels': dict(labels), 'value': value} for labels, value in values.items()]
+                             for name, values in self.counters.items()},
+                'histograms': {name: [{'labels': dict(labels), **histogram.to_dict()}
+                                      for labels, histogram in values.items()]
+                               for name, values in self.histograms.items()},
+            }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, values in self.counters.items():
+                metric = f'{self.namespace}_{name}'
+                lines.append(f'# HELP {metric} {self.COUNTERS[name]}')
+                lines.append(f'# TYPE {metric} counter')
+                for labels, value in sorted(values.items()):
+                    lines.append(f'{metric}{_format_labels(labels)} {value}')
+            for name, values in self.histograms.items():
+                metric = f'{self.namespace}_{name}'
+                lines.append(f'# HELP {metric} {self.HISTOGRAMS[name]}')
+                lines.append(f'# TYPE {metric} histogram')
+                for labels, histogram in sorted(values.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{_format_labels(labels + (("le", _format_bound(bound)), ))} {cumulative}')
+                    lines.append(f'{metric}_sum{_format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{metric}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f'{{{labels}}}' if labels else ''
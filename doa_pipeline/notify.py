@@ -0,0 +1,231 @@
+"""Notification channels to wake up idle workers instead of polling the database.
+
+The data layer publishes to its `notifier` whenever work might have become
+available: new processes, stored results, called out events and resumed
+processes. Idle workers block in `DOADataLayer.wait_for_work` until a
+notification arrives or the timeout passes.
+
+Every waiter uses its own subscription. A subscription is created before the
+database is polled, so notifications published between the poll and the wait
+are not lost.
+"""
+import itertools
+import os
+import select
+import socket
+import threading
+import time
+from typing import (
+    Iterable,
+    Optional)
+
+import sqlalchemy as sa
+
+
+class NotificationChannel:
+    # Transactional channels publish within the transaction of the change,
+    # all others after it was committed.
+    transactional = False
+
+    def publish(self, topics: Iterable[str], session=None):
+        raise NotImplementedError
+
+    def subscribe(self) -> 'Subscription':
+        raise NotImplementedError
+
+
+class Subscription:
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until a notification arrived since the last call.
+
+        Returns False if the timeout passed without a notification.
+        """
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Let the pending and all later calls of `wait` return False right away.
+
+        Can be called from a different thread, e.g. to stop a worker.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ConditionChannel(NotificationChannel):
+    """Channel for workers in different threads of the same process."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    def publish(self, topics, session=None):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def subscribe(self):
+        return ConditionSubscription(self)
+
+
+class ConditionSubscription(Subscription):
+    def __init__(self, channel):
+        self.channel = channel
+        self._seen = channel._generation
+        self._interrupted = False
+
+    def wait(self, timeout=None):
+        with self.channel._condition:
+            notified = self.channel._condition.wait_for(
+                lambda: self._interrupted or self.channel._generation != self._seen, timeout)
+            self._seen = self.channel._generation
+        return notified and not self._interrupted
+
+    def interrupt(self):
+        with self.channel._condition:
+            self._interrupted = True
+            self.channel._condition.notify_all()
+
+
+class LocalSocketChannel(NotificationChannel):
+    """Channel for worker processes on the same host.
+
+    Every subscription binds a unix datagram socket in `directory` and
+    publishing sends a datagram to all sockets in the directory. Sockets of
+    subscriptions that vanished without closing are removed on publish.
+    """
+    _counter = itertools.count()
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._socket = None
+
+    def publish(self, topics, session=None):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+        payload = ','.join(topics).encode()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.sock'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                self._socket.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # The buffer of the subscriber is full, so it will wake up anyway.
+                pass
+
+    def subscribe(self):
+        path = os.path.join(self.directory, f'{os.getpid()}-{next(self._counter)}.sock')
+        return LocalSocketSubscription(path)
+
+
+class LocalSocketSubscription(Subscription):
+    def __init__(self, path):
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        self._socket.setblocking(False)
+        self._interrupted = False
+
+    def wait(self, timeout=None):
+        if self._interrupted:
+            return False
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while True:
+                self._socket.recv(4096)
+        except BlockingIOError:
+            pass
+        return not self._interrupted
+
+    def interrupt(self):
+        self._interrupted = True
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.sendto(b'', self.path)
+            except OSError:
+                # The subscription was closed or its buffer is full, so it wakes up anyway.
+                pass
+
+    def close(self):
+        self._socket.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PostgresChannel(NotificationChannel):
+    """Channel using PostgreSQL's LISTEN/NOTIFY.
+
+    Notifications are sent within the transaction of the change and are
+    delivered once it is committed. Each subscription holds a dedicated
+    connection of `engine` listening on `channel`. Requires psycopg2.
+    """
+    transactional = True
+
+    def __init__(self, engine, channel='doa_pipeline'):
+        if isinstance(engine, str):
+            engine = sa.create_engine(engine)
+        self.engine = engine
+        self.channel = channel
+
+    def publish(self, topics, session=None):
+        q = sa.select([sa.func.pg_notify(self.channel, ','.join(topics))])
+        if session is None:
+            with self.engine.begin() as connection:
+                connection.execute(q)
+        else:
+            session.execute(q)
+
+    def subscribe(self):
+        return PostgresSubscription(self)
+
+
+class PostgresSubscription(Subscription):
+    def __init__(self, channel):
+        self._connection = channel.engine.raw_connection()
+        dbapi_connection = self._connection.connection
+        dbapi_connection.autocommit = True
+        quoted_channel = channel.engine.dialect.identifier_preparer.quote(channel.channel)
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {quoted_channel}')
+        self._dbapi_connection = dbapi_connection
+        self._interrupted = False
+        # Written to by `interrupt` to wake up a pending `wait`.
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def wait(self, timeout=None):
+        connection = self._dbapi_connection
+        deadline = None if timeout is None else time.monotonic() + timeout
+        connection.poll()
+        while not connection.notifies:
+            if self._interrupted:
+                return False
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([connection, self._wakeup_read], [], [], remaining)
+            if not readable:
+                return False
+            connection.poll()
+        connection.notifies.clear()
+        return not self._interrupted
+
+    def interrupt(self):
+        self._interrupted = True
+        os.write(self._wakeup_write, b'\0')
+
+    def close(self):
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+        # The connection was switched to autocommit, so it must not go back to the pool.
+        self._connection.invalidate()
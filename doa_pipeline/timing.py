@@ -0,0 +1,141 @@
+"""Analysis of the node timings recorded with `DOADataLayer(node_timing=True)`.
+
+    with doa_datalayer(engine):
+        stats = node_time_stats(doa_datalayer, since=datetime.datetime.now() - datetime.timedelta(hours=1))
+        stats['fit']['duration']['p90']
+        path = critical_path(doa_datalayer, since=...)
+
+For every execution of a node the time it was claimed and finished is
+recorded. A node is ready when the last of its upstream nodes finished,
+root nodes when the process was added (`started`). The queue wait of a
+node is the time from ready until claimed, its duration the time from
+claimed until finished. With `node_timing` all three are taken from the
+local clock of the workers and of the process adding the processes
+instead of the clock of the database (UTC on SQLite).
+"""
+from typing import (
+    Dict,
+    Optional,
+    Sequence)
+
+import sqlalchemy as sa
+
+from .doa_pipeline import NodeStatus
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def _summary(values, percentiles):
+    if len(values) == 0:
+        return {'mean': None, **{f'p{q}': None for q in percentiles}}
+    return {'mean': sum(values) / len(values), **{f'p{q}': _percentile(values, q) for q in percentiles}}
+
+
+def node_times(doa_datalayer, ids=None, since=None, until=None) -> Dict[int, Dict[str, dict]]:
+    """Timings of the processes `ids` or of all processes with a node finished between `since` and `until`.
+
+    Returns for every process the timings of its nodes by node name:
+    `{'claimed', 'finished', 'status', 'ready', 'queue_wait', 'duration'}`
+    in seconds. Of nodes executed more than once (paused and retried) the
+    last execution is used, its queue wait spans all executions.
+    """
+    if doa_datalayer._node_times_table is None:
+        raise ValueError(f'The data layer "{doa_datalayer.name}" does not record node timings')
+    table, node_times_table = doa_datalayer.processes(), doa_datalayer._node_times_table
+    if ids is None:
+        conditions = [sa.true()]
+        if since is not None:
+            conditions.append(node_times_table.c.finished >= since)
+        if until is not None:
+            conditions.append(node_times_table.c.finished < until)
+        ids = sa.select([node_times_table.c.id]).where(sa.and_(*conditions))
+    q = sa.select([node_times_table.c.id, node_times_table.c.node, node_times_table.c.status,
+                   node_times_table.c.claimed, node_times_table.c.finished, table.c.started]) \
+        .select_from(node_times_table.join(table, node_times_table.c.id == table.c.id)) \
+        .where(node_times_table.c.id.in_(ids)) \
+        .order_by(node_times_table.c.id, node_times_table.c.claimed)
+    node_names = {node_enum.value: name for name, node_enum in doa_datalayer._node_enums.items()}
+    executions = {}
+    started = {}
+    for id_, node, status, claimed, finished, process_started in doa_datalayer._active_session.execute(q):
+        started[id_] = process_started
+        process_executions = executions.setdefault(id_, {})
+        first = process_executions.get(node, {}).get('first_claimed', claimed)
+        process_executions[node] = {'first_claimed': first, 'claimed': claimed, 'finished': finished, 'status': status}
+    timings = {}
+    for id_, process_executions in executions.items():
+        process_timings = timings[id_] = {}
+        for node in sorted(process_executions.keys()):
+            execution = process_executions[node]
+            upstream = [process_executions[u]['finished'] for u in doa_datalayer._upstream_nodes[node]
+                        if u in process_executions]
+            ready = max(upstream) if upstream else started[id_]
+            process_timings[node_names[node]] = {
+                'status': execution['status'],
+                'ready': ready,
+                'claimed': execution['claimed'],
+                'finished': execution['finished'],
+                'queue_wait': max(0., (execution['first_claimed'] - ready).total_seconds()) if ready else None,
+                'duration': (execution['finished'] - execution['claimed']).total_seconds(),
+            }
+    return timings
+
+
+def node_time_stats(doa_datalayer, since=None, until=None,
+                    percentiles: Sequence[float] = (50, 90, 99)) -> Dict[str, dict]:
+    """Percentiles of the duration and the queue wait of every node in seconds.
+
+    Only successful executions of processes with a node finished between
+    `since` and `until` are taken into account.
+    """
+    timings = node_times(doa_datalayer, since=since, until=until)
+    durations, queue_waits = {}, {}
+    for process_timings in timings.values():
+        for name, timing in process_timings.items():
+            if timing['status'] != NodeStatus.SUCCESS.value:
+                continue
+            durations.setdefault(name, []).append(timing['duration'])
+            if timing['queue_wait'] is not None:
+                queue_waits.setdefault(name, []).append(timing['queue_wait'])
+    return {node.name: {'count': len(durations.get(node.name, [])),
+                        'duration': _summary(durations.get(node.name, []), percentiles),
+                        'queue_wait': _summary(queue_waits.get(node.name, []), percentiles)}
+            for node in doa_datalayer.dag.sorted_nodes}
+
+
+def _longest_path(doa_datalayer, weights):
+    """Path through `dag.sorted_nodes` with the largest sum of `weights` by node name."""
+    best = {}
+    for node in doa_datalayer.dag.sorted_nodes:
+        if node.name not in weights:
+            continue
+        upstream = [best[e.start.name] for e in node.incoming_edges if e.start.name in best]
+        length, path = max(upstream, key=lambda b: b[0], default=(0., []))
+        best[node.name] = (length + weights[node.name], path + [node.name])
+    return max(best.values(), key=lambda b: b[0], default=(0., []))
+
+
+def critical_path(doa_datalayer, id_: Optional[int] = None, since=None, until=None) -> dict:
+    """Critical path of the process `id_` or aggregated over the processes finished between `since` and `until`.
+
+    The critical path is the chain of nodes with the largest sum of queue
+    wait and duration (the mean of them when aggregated). Returns
+    `{'nodes': [...], 'length': seconds, 'steps': [{'node', 'queue_wait', 'duration'}, ...]}`.
+    """
+    if id_ is not None:
+        timings = node_times(doa_datalayer, ids=[id_])
+        if id_ not in timings:
+            raise ValueError(f'No node timings recorded for the process {id_}')
+        steps = {name: (timing['queue_wait'] or 0., timing['duration'])
+                 for name, timing in timings[id_].items()}
+    else:
+        stats = node_time_stats(doa_datalayer, since=since, until=until)
+        steps = {name: (s['queue_wait']['mean'] or 0., s['duration']['mean'])
+                 for name, s in stats.items() if s['count'] > 0}
+    length, path = _longest_path(doa_datalayer, {name: sum(step) for name, step in steps.items()})
+    return {'nodes': path,
+            'length': length,
+            'steps': [{'node': name, 'queue_wait': steps[name][0], 'duration': steps[name][1]} for name in path]}
@@ -0,0 +1,289 @@
+"""Multi-process worker runtime executing the registered node functions.
+
+The node functions are registered on the data layer with
+`DOADataLayer.register`. Each worker process creates its own engine and
+session and polls for work of all registered nodes:
+
+    python -m doa_pipeline.worker my_module:doa_datalayer --uri sqlite:///pipeline.sqlite --processes 4
+
+SIGINT/SIGTERM stop the workers gracefully: processes that are already
+claimed are finished and their results are stored before the workers exit.
+A second signal terminates the workers immediately.
+
+If the data layer has a `lease_duration` every worker extends the leases
+of its claimed processes from a background thread and returns processes
+with expired leases (of workers that died) to the queue once per
+`lease_duration`.
+"""
+import argparse
+import collections
+import importlib
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from typing import (
+    Optional,
+    Union)
+
+import sqlalchemy as sa
+
+from .doa_pipeline import DOADataLayer
+
+
+def resolve_target(target: str):
+    """Import `module:attribute` and return the attribute."""
+    module_name, _, attribute = target.partition(':')
+    if not module_name or not attribute:
+        raise ValueError(f'Target "{target}" has to be of the form "module:attribute"')
+    obj = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def engine_url(engine) -> str:
+    url = engine.url
+    if hasattr(url, 'render_as_string'):
+        return url.render_as_string(hide_password=False)
+    return str(url)
+
+
+class Worker:
+    def __init__(self,
+                 doa_datalayer: Union[DOADataLayer, str],
+                 engine=None,
+                 processes: Optional[int] = None,
+                 batch_size: int = 1,
+                 poll_interval: float = 1.,
+                 stop_when_idle: bool = False,
+                 start_method: Optional[str] = None,
+                 engine_kwargs: Optional[dict] = None,
+                 heartbeat_interval: Optional[float] = None,
+                 idle_timeout: float = 60.):
+        """Runs the node functions registered on `doa_datalayer` in `processes` worker processes.
+
+        `doa_datalayer` is either the data layer or a `module:attribute`
+        string pointing to it, which is required for the "spawn" start
+        method, because the data layer is re-imported in every worker.
+        `engine` is an Engine or a database uri; defaults to the engine the
+        data layer is bound to. Idle workers poll every `poll_interval`
+        seconds or, if the data layer has a notifier, block on it and query
+        again after a notification or at the latest after `idle_timeout`
+        seconds (`poll_interval` with `stop_when_idle`). With
+        `stop_when_idle` a worker exits as soon as no work is left for its
+        nodes. `engine_kwargs` are passed to
+        `sa.create_engine` in every worker. The leases of claimed processes
+        are extended every `heartbeat_interval` seconds, by default a third
+        of the `lease_duration` of the data layer.
+        """
+        if isinstance(doa_datalayer, str):
+            self.target = doa_datalayer
+            doa_datalayer = resolve_target(doa_datalayer)
+        else:
+            self.target = None
+        if not isinstance(doa_datalayer, DOADataLayer):
+            raise TypeError('"doa_datalayer" has to be a DOADataLayer or a "module:attribute" pointing to one')
+        self.doa_datalayer = doa_datalayer
+        unregistered = sorted(doa_datalayer._listed_fused_nodes() - set(doa_datalayer.node_functions.keys()))
+        if unregistered:
+            raise ValueError(f'The fused nodes {unregistered} have no registered function')
+        if engine is None:
+            engine = doa_datalayer._engine
+        if engine is None:
+            raise ValueError('Provide an engine or bind the data layer with DOADataLayer(engine=) first')
+        self.engine_url = engine if isinstance(engine, str) else engine_url(engine)
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stop_when_idle = stop_when_idle
+        self.idle_timeout = idle_timeout
+        self.engine_kwargs = engine_kwargs or {}
+        if heartbeat_interval is None and doa_datalayer.lease_duration is not None:
+            heartbeat_interval = doa_datalayer.lease_duration / 3
+        self.heartbeat_interval = heartbeat_interval
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        if start_method != 'fork' and self.target is None:
+            raise ValueError(f'The start method "{start_method}" requires the data layer as "module:attribute"')
+        self._mp_context = multiprocessing.get_context(start_method)
+        self._stop_event = self._mp_context.Event()
+        self._workers = []
+
+    def run(self):
+        """Start the worker processes and block until all of them exited."""
+        if len(self.doa_datalayer.node_functions) == 0:
+            raise ValueError(f'No node functions registered for the data layer "{self.doa_datalayer.name}"')
+        semaphores = {name: self._mp_context.BoundedSemaphore(concurrency)
+                      for name, (_, _, concurrency) in self.doa_datalayer.node_functions.items()
+                      if concurrency is not None}
+        doa_datalayer = self.doa_datalayer if self.target is None else None
+        self._workers = [
+            self._mp_context.Process(target=_run_worker,
+                                     args=(doa_datalayer, self.target, self.engine_url, self.engine_kwargs,
+                                           semaphores, self._stop_event,
+                                           self.batch_size, self.poll_interval, self.stop_when_idle,
+                                           self.heartbeat_interval, self.idle_timeout),
+                                     name=f'doa-worker-{i}')
+            for i in range(self.processes)]
+        previous_handlers = {sig: signal.signal(sig, self._handle_signal) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for worker in self._workers:
+                worker.start()
+            for worker in self._workers:
+                worker.join()
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+        return [worker.exitcode for worker in self._workers]
+
+    def stop(self):
+        """Let the workers finish their claimed processes and exit."""
+        self._stop_event.set()
+
+    def _handle_signal(self, signum, frame):
+        if self._stop_event.is_set():
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.terminate()
+        else:
+            self.stop()
+
+
+def _heartbeat(doa_datalayer, engine, interval, stopped):
+    while not stopped.wait(interval):
+        try:
+            with engine.begin() as connection:
+                doa_datalayer.heartbeat(connection=connection)
+        except sa.exc.OperationalError:
+            # E.g. the database is locked, try again with the next beat.
+            continue
+
+
+def _interrupt_on_stop(subscription, stop_event):
+    stop_event.wait()
+    subscription.interrupt()
+
+
+def _run_worker(doa_datalayer, target, engine_url, engine_kwargs, semaphores, stop_event,
+                batch_size, poll_interval, stop_when_idle, heartbeat_interval, idle_timeout):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if doa_datalayer is None:
+        doa_datalayer = resolve_target(target)
+    engine = sa.create_engine(engine_url, **engine_kwargs)
+    doa_datalayer(engine)
+    node_functions = doa_datalayer.node_functions
+    heartbeat_stopped = threading.Event()
+    if doa_datalayer.lease_duration is not None and heartbeat_interval:
+        threading.Thread(target=_heartbeat, args=(doa_datalayer, engine, heartbeat_interval, heartbeat_stopped),
+                         daemon=True).start()
+    if doa_datalayer.notifier is not None:
+        threading.Thread(target=_interrupt_on_stop, args=(doa_datalayer._subscription(), stop_event),
+                         daemon=True).start()
+    if stop_when_idle:
+        idle_timeout = poll_interval
+    if doa_datalayer.lease_duration is not None:
+        # Expired leases are reaped between the waits.
+        idle_timeout = min(idle_timeout, doa_datalayer.lease_duration)
+    try:
+        _work(doa_datalayer, node_functions, semaphores, stop_event, batch_size, poll_interval, stop_when_idle,
+              idle_timeout)
+    finally:
+        heartbeat_stopped.set()
+
+
+def _work(doa_datalayer, node_functions, semaphores, stop_event, batch_size, poll_interval, stop_when_idle,
+          idle_timeout):
+    """Claim and run processes until `stop_event` is set.
+
+    A concurrency slot is acquired for every limited node before claiming
+    and released again right after claiming if no process of the node was
+    claimed, or once the claimed processes of the node finished. No slots
+    are held while waiting for work.
+    """
+    leased = doa_datalayer.lease_duration is not None
+    all_node_cfgs = [node_cfg for node_cfg, _, _ in node_functions.values()]
+    last_reap = None
+    with doa_datalayer:
+        while not stop_event.is_set():
+            if leased and (last_reap is None or time.monotonic() - last_reap >= doa_datalayer.lease_duration):
+                doa_datalayer.reap_expired()
+                last_reap = time.monotonic()
+            held = {name for name in node_functions.keys()
+                    if name in semaphores and semaphores[name].acquire(block=False)}
+            # Slots freed by other workers are not notified, so poll while some are taken.
+            all_slots = len(held) == len(semaphores)
+            try:
+                node_cfgs = [node_cfg for name, (node_cfg, _, _) in node_functions.items()
+                             if name not in semaphores or name in held]
+                if len(node_cfgs) == 0:
+                    stop_event.wait(poll_interval)
+                    continue
+                processing_contexts = doa_datalayer.query_for_work_batch(node_cfgs, batch_size)
+                remaining = collections.Counter(c.config.name for c in processing_contexts)
+                for name in held - set(remaining.keys()):
+                    semaphores[name].release()
+                    held.discard(name)
+                # Processes of limited nodes first, so their slots are released early.
+                processing_contexts.sort(key=lambda c: c.config.name not in held)
+                for processing_context in processing_contexts:
+                    name = processing_context.config.name
+                    # With fused nodes the downstream node is claimed when the result is stored.
+                    while processing_context is not None:
+                        func = node_functions[processing_context.config.name][1]
+                        with doa_datalayer.process(processing_context) as result_container:
+                            func(processing_context, result_container)
+                        if name is not None:
+                            remaining[name] -= 1
+                            if remaining[name] == 0 and name in held:
+                                semaphores[name].release()
+                                held.discard(name)
+                            name = None
+                        processing_context = processing_context.fused_next
+            finally:
+                for name in held:
+                    semaphores[name].release()
+            if len(processing_contexts) == 0:
+                if stop_when_idle and doa_datalayer.query_for_work(all_node_cfgs, claim=False) is None:
+                    break
+                if doa_datalayer.notifier is None or not all_slots:
+                    stop_event.wait(poll_interval)
+                else:
+                    # Notifications published since the last query are kept by the subscription.
+                    doa_datalayer._subscription().wait(idle_timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m doa_pipeline.worker',
+                                     description='Run the node functions registered on a DOADataLayer.')
+    parser.add_argument('target', help='Data layer as "module:attribute".')
+    parser.add_argument('--uri', default=None,
+                        help='Database uri. Defaults to the engine the data layer is bound to.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes. Defaults to the number of cores.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of processes claimed per query.')
+    parser.add_argument('--poll-interval', type=float, default=1.,
+                        help='Seconds an idle worker waits before querying again.')
+    parser.add_argument('--stop-when-idle', action='store_true',
+                        help='Exit once no work is left.')
+    parser.add_argument('--idle-timeout', type=float, default=60.,
+                        help='Seconds an idle worker waits for notifications before querying again.')
+    args = parser.parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+    worker = Worker(args.target,
+                    engine=args.uri,
+                    processes=args.processes,
+                    batch_size=args.batch_size,
+                    poll_interval=args.poll_interval,
+                    stop_when_idle=args.stop_when_idle,
+                    idle_timeout=args.idle_timeout)
+    exitcodes = worker.run()
+    return max([abs(c) for c in exitcodes if c is not None] + [0])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
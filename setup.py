@@ -33,8 +33,13 @@ setup(
     keywords='pipeline',
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
     install_requires=[
-        'sqlalchemy',
+        'sqlalchemy>=1.4',
         'psycopg2'],
+    extras_require={
+        'asyncio': ['sqlalchemy[asyncio]>=1.4', 'aiosqlite'],
+        'codecs': ['orjson', 'msgpack', 'lz4'],
+        'numpy': ['numpy'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
 )
\ No newline at end of file
@@ -0,0 +1,69 @@
+import mmap
+
+import pytest
+import sqlalchemy as sa
+
+np = pytest.importorskip('numpy')
+
+from doa_pipeline.arrays import NumpyArray, dump_array, load_array
+from doa_pipeline.blob_store import FileBlobStore, parse_blob_ref
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+
+
+ARRAYS = [
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.arange(24, dtype='>i4').reshape(2, 3, 4),
+    np.asfortranarray(np.arange(6, dtype=np.int16).reshape(2, 3)),
+    np.array([1 + 2j, 3 - 4j], dtype=np.complex128),
+    np.array([True, False]),
+    np.array(3.5),
+    np.zeros((0, 3), dtype=np.uint8),
+    np.array([(1, 2.5), (3, 4.5)], dtype=[('a', '<i8'), ('b', '<f4')]),
+    np.array(['ab', 'cde']),
+    np.arange(10)[::2],
+    np.linspace(0, 1, 1000).reshape(10, 100),
+]
+
+
+@pytest.mark.parametrize('array', ARRAYS)
+def test_dump_load(array):
+    data = dump_array(array)
+    loaded = load_array(data)
+    assert loaded.dtype == array.dtype
+    assert loaded.shape == array.shape
+    assert np.array_equal(loaded, array)
+    assert not loaded.flags.writeable
+    with pytest.raises(ValueError):
+        dump_array(np.array([object()]))
+
+
+@pytest.mark.parametrize('use_blob_store', [False, True])
+def test_array_columns(tmp_path, use_blob_store):
+    uri = f'sqlite:///{tmp_path / "arrays.sqlite"}'
+    blob_store = FileBlobStore(str(tmp_path / 'blobs'), threshold=256) if use_blob_store else None
+    doa_datalayer = DOADataLayer('TestArrays', blob_store=blob_store)
+    config_node = DOANodeConfig(name='1', version='0.0.0', result_columns=[sa.Column('array', NumpyArray)])
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        ids = doa_datalayer.add_processes([{'i': i} for i in range(len(ARRAYS) + 1)])
+        for processing_context in doa_datalayer.query_for_work_batch(config_node, len(ids)):
+            with doa_datalayer.process(processing_context) as result_container:
+                i = processing_context.context['i']
+                result_container.array = ARRAYS[i] if i < len(ARRAYS) else None
+        column = config_node.col('array', doa_datalayer)
+        q = sa.select([doa_datalayer.table.c.id, column])
+        stored = dict(doa_datalayer._active_session.execute(q).fetchall())
+    assert stored[ids[-1]] is None
+    for id_, array in zip(ids, ARRAYS):
+        value = stored[id_]
+        if use_blob_store and array.nbytes > 256:
+            assert parse_blob_ref(value) is not None
+            value = doa_datalayer.resolve(value, column=column)
+            base = value
+            while isinstance(base, np.ndarray):
+                base = base.base
+            assert isinstance(base.obj, mmap.mmap)
+        assert value.dtype == array.dtype
+        assert value.shape == array.shape
+        assert np.array_equal(value, array)
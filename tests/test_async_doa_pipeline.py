@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+pytest.importorskip('aiosqlite')
+
+from doa_pipeline.doa_pipeline import DOANodeConfig, Paused
+from doa_pipeline.async_doa_pipeline import AsyncDOADataLayer
+
+
+def build_datalayer(name):
+    doa_datalayer = AsyncDOADataLayer(name)
+    cfgs = [DOANodeConfig(name=str(i), version='0.0.0', result_columns=[sa.Column('value', sa.Integer)])
+            for i in range(1, 4)]
+    with doa_datalayer.dag:
+        node_1, node_2, node_3 = [doa_datalayer.create_node(c) for c in cfgs]
+        node_1 >> node_2
+        node_2 >> node_3
+    return doa_datalayer, cfgs
+
+
+def test_async_await_events(tmp_path):
+    uri = f'sqlite+aiosqlite:///{tmp_path / "async.sqlite"}'
+    doa_datalayer, cfgs = build_datalayer('TestAsyncPause')
+
+    async def status(id_):
+        table = doa_datalayer.table
+        async with doa_datalayer._session_maker() as session:
+            q = sa.select([table.c.status, table.c.node_status, table.c.awaited_events]).where(table.c.id == id_)
+            return tuple((await session.execute(q)).first())
+
+    async def run():
+        async with doa_datalayer(uri):
+            process_id = await doa_datalayer.add_process({'i': 3})
+            assert await status(process_id) == ('W', 'SWWW', '')
+            processing_context = await doa_datalayer.query_for_work(cfgs)
+            assert processing_context.context == {'i': 3}
+            async with doa_datalayer.process(processing_context) as result_container:
+                assert await status(process_id) == ('R', 'SRWW', '')
+                result_container.value = 1
+            assert await status(process_id) == ('W', 'SSWW', '')
+            async with doa_datalayer.process(await doa_datalayer.query_for_work(cfgs)):
+                raise Paused('event')
+            assert await status(process_id) == ('P', 'SSSW', '<event>')
+            assert await doa_datalayer.query_for_work(cfgs) is None
+            await doa_datalayer.call_out_event('event')
+            assert await status(process_id) == ('W', 'SSSW', '')
+            async with doa_datalayer.process(await doa_datalayer.query_for_work(cfgs)):
+                raise Paused('event', retry=True)
+            await doa_datalayer.resume(force_resume=True)
+            assert await status(process_id) == ('W', 'SSSW', '')
+            async with doa_datalayer.process(await doa_datalayer.query_for_work(cfgs)):
+                raise ValueError()
+            assert await status(process_id) == ('F', 'SSSF', '')
+
+    asyncio.run(run())
+
+
+def test_async_concurrent_processing(tmp_path):
+    uri = f'sqlite+aiosqlite:///{tmp_path / "async_concurrent.sqlite"}'
+    doa_datalayer, cfgs = build_datalayer('TestAsyncConcurrent')
+
+    async def work(processed):
+        while True:
+            processing_context = await doa_datalayer.query_for_work(cfgs)
+            if processing_context is None:
+                if await doa_datalayer.query_for_work(cfgs, claim=False) is None:
+                    return
+                continue
+            async with doa_datalayer.process(processing_context) as result_container:
+                await asyncio.sleep(0.001)
+                result_container.value = processing_context.context['i']
+            processed.append((processing_context.id_, processing_context.config.name))
+
+    async def run():
+        async with doa_datalayer(uri):
+            await doa_datalayer.create_indexes()
+            ids = await doa_datalayer.add_processes({'i': i} for i in range(10))
+            processed = []
+            await asyncio.gather(*[work(processed) for _ in range(8)])
+            assert sorted(processed) == sorted((id_, c.name) for id_ in ids for c in cfgs)
+            table = doa_datalayer.table
+            async with doa_datalayer._session_maker() as session:
+                q = sa.select([table.c.status, table.c['3_value']]).order_by(table.c.id)
+                rows = (await session.execute(q)).fetchall()
+            assert [tuple(r) for r in rows] == [('S', i) for i in range(10)]
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import os
+
+import sqlalchemy as sa
+
+from doa_pipeline.blob_store import FileBlobStore, parse_blob_ref
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+
+
+def test_file_blob_store(tmp_path):
+    blob_store = FileBlobStore(str(tmp_path / 'blobs'))
+    digest = blob_store.put(b'payload')
+    assert blob_store.put(b'payload') == digest
+    assert blob_store.path(digest).endswith(os.path.join(digest[:2], digest[2:4], digest))
+    assert bytes(blob_store.open(digest)) == b'payload'
+    empty = blob_store.put(b'')
+    assert blob_store.get(empty) == b''
+    assert sorted(blob_store.digests()) == sorted([digest, empty])
+    assert blob_store.collect([digest]) == 0
+    assert blob_store.collect([digest], grace=0) == 1
+    assert digest in blob_store and empty not in blob_store
+
+
+def test_offloading(tmp_path):
+    uri = f'sqlite:///{tmp_path / "blobs.sqlite"}'
+    blob_store = FileBlobStore(str(tmp_path / 'blobs'), threshold=100)
+    doa_datalayer = DOADataLayer('TestBlobs', blob_store=blob_store)
+    config_node = DOANodeConfig(name='1', version='0.0.0',
+                                result_columns=[sa.Column('text', sa.Text), sa.Column('data', sa.LargeBinary)])
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    context = {'values': list(range(100))}
+    with doa_datalayer(uri):
+        ids = doa_datalayer.add_processes([context, context, {'small': True}])
+        assert len(list(blob_store.digests())) == 1
+        for _ in ids:
+            processing_context = doa_datalayer.query_for_work(config_node)
+            assert processing_context.context == ({'small': True} if processing_context.id_ == ids[2] else context)
+            with doa_datalayer.process(processing_context) as result_container:
+                result_container.text = 'x' * 1000
+                result_container.data = bytes(range(256)) * 4
+        table = doa_datalayer.table
+        q = sa.select([table.c.context, config_node.text, config_node.data]).where(table.c.id == ids[0])
+        stored_context, text, data = doa_datalayer._active_session.execute(q).fetchone()
+        assert all(parse_blob_ref(v) is not None for v in [stored_context, text, data])
+        assert doa_datalayer.resolve(text) == 'x' * 1000
+        assert doa_datalayer.resolve(data) == bytes(range(256)) * 4
+        assert doa_datalayer.resolve('small') == 'small'
+        assert len(list(blob_store.digests())) == 3
+        doa_datalayer.delete_processes(ids[:1], grace=0)
+        assert len(list(blob_store.digests())) == 3
+        doa_datalayer.delete_processes(ids[1:], grace=0)
+        assert len(list(blob_store.digests())) == 0
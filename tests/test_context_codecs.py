@@ -0,0 +1,55 @@
+import pickle
+
+import pytest
+
+from doa_pipeline.context_codecs import LazyContext, decode_context, encode_context, get_codec
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+
+
+CONTEXT = {'name': 'run', 'values': [1.5, 2.5] * 100, 'nested': {'a': [1, 2], 'b': None}}
+
+
+@pytest.mark.parametrize('tag', ['json', 'orjson', 'msgpack', 'pickle', 'json+zlib', 'msgpack+zlib', 'pickle+lz4'])
+def test_codecs(tag):
+    if tag.startswith('orjson'):
+        pytest.importorskip('orjson')
+    if tag.startswith('msgpack'):
+        pytest.importorskip('msgpack')
+    if tag.endswith('lz4'):
+        pytest.importorskip('lz4')
+    codec = get_codec(tag)
+    assert codec is get_codec(tag)
+    assert codec.tag == tag
+    text = encode_context(CONTEXT, tag)
+    assert text.startswith(f'@{tag}:')
+    assert decode_context(text) == CONTEXT
+    assert decode_context(encode_context([1, 'a'], tag)) == [1, 'a']
+    context = LazyContext(text)
+    assert context['name'] == 'run'
+    assert context.decoded_keys == ['name']
+    assert context == CONTEXT
+    assert pickle.loads(pickle.dumps(context)) == CONTEXT
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('json+unknown')
+    with pytest.raises(ValueError):
+        DOADataLayer('TestCodec', context_codec='unknown')
+
+
+def test_mixed_codecs(uri='sqlite:///:memory:'):
+    doa_datalayer = DOADataLayer('TestCodec')
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        ids = [doa_datalayer.add_process({'i': 0, **CONTEXT})]
+        doa_datalayer.context_codec = get_codec('pickle+zlib')
+        ids.extend(doa_datalayer.add_processes([{'i': 1, **CONTEXT}, {'i': 2, **CONTEXT}]))
+        processing_contexts = doa_datalayer.query_for_work_batch(config_node, 3)
+        assert len(processing_contexts) == 3
+        for processing_context in processing_contexts:
+            assert isinstance(processing_context.context, LazyContext)
+            assert processing_context.context['i'] == ids.index(processing_context.id_)
+            assert processing_context.context == {'i': ids.index(processing_context.id_), **CONTEXT}
@@ -25,6 +25,8 @@ def test_dag_build():
     assert sorted_node_names.index('c') > sorted_node_names.index('d')
     assert sorted_node_names[0] == 'f'
     assert sorted_node_names[-1] == 'g'
+    assert sorted_node_names == ['f', 'd', 'c', 'a', 'b', 'g']
+    assert [[n.name for n in level] for level in dag.levels] == [['f'], ['a', 'd'], ['b', 'c'], ['g']]
 
 
     with DAG('TEST2') as dag_2:
@@ -46,6 +48,44 @@ def test_dag_build():
 
 
 
+def test_sorted_nodes_order():
+    # The order defines the node_status layout of existing tables and must not change.
+    with DAG('TEST') as dag:
+        Node('a') >> Node('c')
+        Node('z') >> Node('b')
+    assert [n.name for n in dag.sorted_nodes] == ['z', 'b', 'a', 'c']
+    assert [[n.name for n in level] for level in dag.levels] == [['a', 'z'], ['b', 'c']]
+    with DAG('TEST_CYCLE') as dag:
+        a, _, b = Node('a') >> Node('b')
+        b >> a
+    with pytest.raises(ValueError):
+        dag.sorted_nodes
+
+
+def test_dag_index():
+    with DAG('TEST') as dag:
+        a, e_ab, b = Node('a') >> Node('b')
+        c = Node('c')
+    assert dag.find('c') is c
+    assert dag.find(c) is c
+    assert dag.edges == {e_ab}
+    assert dag.edges is dag.edges
+    version = dag.version
+    e_bc = dag.add_edge(b, c)
+    assert dag.version > version
+    assert dag.edges == {e_ab, e_bc}
+    assert [dag._node_list[i] for i in dag._successors[b._id]] == [c]
+    assert [dag._node_list[i] for i in dag._predecessors[b._id]] == [a]
+    b_replacement = Node('b', payload='replacement', dag=False)
+    dag.add_node(b_replacement, replace=True)
+    assert dag.find('b') is b_replacement
+    assert b_replacement.incoming_edges == {e_ab} and e_ab.stop is b_replacement
+    assert dag._node_list[b._id] is b_replacement
+    assert len(dag) == 3
+    with pytest.raises(AttributeError):
+        a.color = 'red'
+
+
 def test_dag_components():
     dag = DAG('TEST')
     with dag:
@@ -64,6 +104,20 @@ def test_dag_components():
     assert len(set([tuple(c) for c in lookup.values()])) == 2
 
 
+def test_dag_deep_chain():
+    with DAG('TEST') as dag:
+        nodes = [Node(f'n{i:05d}') for i in range(5000)]
+        for start, stop in zip(nodes[:-1], nodes[1:]):
+            start >> stop
+    assert dag.sorted_nodes == nodes
+    assert len(dag.levels) == 5000
+    assert len(dag.components[nodes[0]]) == 5000
+    with dag:
+        nodes[-1] >> nodes[0]
+    with pytest.raises(ValueError):
+        dag.sorted_nodes
+
+
 def test_dag_store():
     dag = DAG('TEST')
     with dag:
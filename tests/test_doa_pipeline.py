@@ -1,6 +1,13 @@
+import datetime
+
+import pytest
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
-from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, Paused
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, Paused, CompareAndSwapClaim, SkipLockedClaim, ResultContainer
+from doa_pipeline.doa_pipeline import FIFOScheduling, WeightedFairScheduling
+from doa_pipeline.blob_store import FileBlobStore
+from doa_pipeline.timing import node_times
 
 
 def test_doa_dag_build(uri='sqlite:///:memory:'):
@@ -110,6 +117,533 @@ def test_await_events(uri='sqlite:///:memory:'):
             
 
 
+def test_call_out_events(uri='sqlite:///:memory:'):
+    doa_datalayer = DOADataLayer('TestEvents')
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+
+    def subscriptions(doa_datalayer):
+        events_table = doa_datalayer._events_table
+        q = sa.select([events_table.c.event, events_table.c.id])
+        return sorted(doa_datalayer._active_session.execute(q).fetchall())
+
+    def statuses(doa_datalayer):
+        table = doa_datalayer.table
+        q = sa.select([table.c.id, table.c.status, table.c.awaited_events]).order_by(table.c.id)
+        return [tuple(row[1:]) for row in doa_datalayer._active_session.execute(q)]
+
+    with doa_datalayer(uri) as session:
+        ids = doa_datalayer.add_processes([{'event': e} for e in 'abcd'])
+        for processing_context in doa_datalayer.query_for_work_batch(config_node, 4):
+            with doa_datalayer.process(processing_context):
+                raise Paused(processing_context.context['event'], retry=True)
+        assert subscriptions(doa_datalayer) == [('a', ids[0]), ('b', ids[1]), ('c', ids[2]), ('d', ids[3])]
+        plan = session.execute(sa.text("EXPLAIN QUERY PLAN SELECT id FROM TestEvents_events WHERE event = 'a'"))
+        assert all('SCAN' not in row[-1] for row in plan)
+        doa_datalayer.call_out_events(['a', 'b', 'x'])
+        assert statuses(doa_datalayer) == [('W', ''), ('W', ''), ('P', '<c>'), ('P', '<d>')]
+        assert subscriptions(doa_datalayer) == [('c', ids[2]), ('d', ids[3])]
+        session.execute(sa.delete(doa_datalayer._events_table))
+        doa_datalayer.sync_event_subscriptions()
+        assert subscriptions(doa_datalayer) == [('c', ids[2]), ('d', ids[3])]
+        doa_datalayer.resume(ids[2], force_resume=True)
+        assert subscriptions(doa_datalayer) == [('d', ids[3])]
+        doa_datalayer.resume(force_resume=True)
+        assert subscriptions(doa_datalayer) == []
+        assert statuses(doa_datalayer) == [('W', '')] * 4
+
+
+def test_query_for_work_batch(uri='sqlite:///:memory:'):
+    doa_datalayer = DOADataLayer('TestBatch', claim_chunk_size=3)
+
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0')
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        node_1 = doa_datalayer.create_node(config_node_1)
+        node_2 = doa_datalayer.create_node(config_node_2)
+        node_1 >> node_2
+
+    with doa_datalayer(uri):
+        process_ids = [doa_datalayer.add_process({'i': i}) for i in range(10)]
+        assert doa_datalayer.query_for_work_batch(config_node_2, 10) == []
+        processing_contexts = doa_datalayer.query_for_work_batch([config_node_1, config_node_2], 7)
+        assert len(processing_contexts) == 7
+        assert all(p.claimed and p.process_status == 'SRW' for p in processing_contexts)
+        assert all(p.previous_process_status == 'SWW' for p in processing_contexts)
+        assert all(p.context['i'] == process_ids.index(p.id_) for p in processing_contexts)
+        for processing_context in processing_contexts:
+            with doa_datalayer.process(processing_context):
+                pass
+        processing_contexts = doa_datalayer.query_for_work_batch([config_node_1, config_node_2], 20)
+        assert len(processing_contexts) == 10
+        assert sorted(p.config.name for p in processing_contexts) == ['1'] * 3 + ['2'] * 7
+        assert doa_datalayer.query_for_work_batch([config_node_1, config_node_2], 20) == []
+
+        process_ids = [doa_datalayer.add_process({'i': i}) for i in range(10)]
+        processing_contexts = doa_datalayer.query_for_work_batch(config_node_1, 4)
+        for processing_context in processing_contexts:
+            with doa_datalayer.process(processing_context):
+                pass
+        processing_contexts = doa_datalayer.query_for_work_batch([config_node_1, config_node_2], 6, prefer_order=True)
+        assert [p.config.name for p in processing_contexts] == ['1'] * 6
+        processing_contexts = doa_datalayer.query_for_work_batch([config_node_2, config_node_1], 4, claim=False,
+                                                                 prefer_order=True)
+        assert [p.config.name for p in processing_contexts] == ['2'] * 4
+
+
+def test_claim_strategies(uri='sqlite:///:memory:'):
+    with pytest.raises(ValueError):
+        DOADataLayer('TestClaim', claim_strategy='unknown')
+    assert isinstance(DOADataLayer('TestClaim', claim_strategy='skip_locked').claim_strategy, SkipLockedClaim)
+    doa_datalayer = DOADataLayer('TestClaim')
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        assert type(doa_datalayer.claim_strategy) is CompareAndSwapClaim
+        doa_datalayer.add_process()
+        assert doa_datalayer.query_for_work(config_node) is not None
+    table = doa_datalayer.table
+    q = SkipLockedClaim().prepare_candidates_query(sa.select([table.c.id]).limit(1))
+    assert str(q.compile(dialect=postgresql.dialect())).endswith('FOR UPDATE SKIP LOCKED')
+
+
+@pytest.mark.parametrize('ready_queue', [False, True])
+@pytest.mark.parametrize('policy', ['lifo', 'fifo', 'priority', 'oldest_started'])
+def test_scheduling_policies(policy, ready_queue, uri='sqlite:///:memory:'):
+    with pytest.raises(ValueError):
+        DOADataLayer('TestScheduling', scheduling_policy='unknown')
+    doa_datalayer = DOADataLayer('TestScheduling', scheduling_policy=policy, ready_queue=ready_queue)
+    if policy == 'fifo':
+        assert isinstance(doa_datalayer.scheduling_policy, FIFOScheduling)
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        table = doa_datalayer.table
+        ids = [doa_datalayer.add_process({'i': i}, priority=i % 3) for i in range(6)]
+        assert doa_datalayer.add_processes([{}, ({}, {'priority': 5})]) == [7, 8]
+        # Distinct times so the order of the time based policies is defined.
+        for id_ in [*ids, 7, 8]:
+            doa_datalayer._active_session.execute(
+                table.update().values(updated_time=sa.func.datetime('2020-01-01', f'+{id_} seconds'))
+                .where(table.c.id == id_))
+            if ready_queue:
+                doa_datalayer._active_session.execute(
+                    doa_datalayer._ready_table.update().values(enqueued=sa.func.datetime('2020-01-01', f'+{id_} seconds'))
+                    .where(doa_datalayer._ready_table.c.id == id_))
+        doa_datalayer._active_session.commit()
+        claimed = [c.id_ for c in doa_datalayer.query_for_work_batch(config_node, 8)]
+    expected = {'lifo': [8, 7, 6, 5, 4, 3, 2, 1],
+                'fifo': [1, 2, 3, 4, 5, 6, 7, 8],
+                'priority': [8, 3, 6, 2, 5, 1, 4, 7],
+                'oldest_started': [1, 2, 3, 4, 5, 6, 7, 8]}
+    assert claimed == expected[policy]
+    if policy in ['lifo', 'fifo']:
+        assert 'ix_TestScheduling_waiting' in {i.name for i in table.indexes}
+    else:
+        assert f'ix_TestScheduling_waiting_{policy}' in {i.name for i in table.indexes}
+
+
+def test_weighted_fair_scheduling(uri='sqlite:///:memory:'):
+    policy = WeightedFairScheduling('tenant', weights={'a': 3})
+    doa_datalayer = DOADataLayer('TestFair', initial_columns=[sa.Column('tenant', sa.String)],
+                                 scheduling_policy=policy)
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        doa_datalayer.add_processes([{}] * 20, tenant='a')
+        doa_datalayer.add_processes([{}] * 20, tenant='b')
+        doa_datalayer.add_processes([{}] * 2, tenant='c')
+        tenants = []
+        for _ in range(5):
+            claimed = [c.id_ for c in doa_datalayer.query_for_work_batch(config_node, 5)]
+            tenants.extend(t for t, in doa_datalayer._active_session.execute(
+                sa.select([doa_datalayer.table.c.tenant]).where(doa_datalayer.table.c.id.in_(claimed))))
+        assert len(tenants) == 25
+        assert tenants.count('c') == 2
+        assert tenants.count('a') > 2 * tenants.count('b')
+        assert 'ix_TestFair_waiting_weighted_fair' in {i.name for i in doa_datalayer.table.indexes}
+
+
+@pytest.mark.parametrize('ready_queue', [False, True])
+@pytest.mark.parametrize('result_buffer_size', [None, 2])
+def test_leases(tmp_path, ready_queue, result_buffer_size):
+    uri = f'sqlite:///{tmp_path / "leases.sqlite"}'
+    doa_datalayer = DOADataLayer('TestLeases', lease_duration=60, max_attempts=2, ready_queue=ready_queue,
+                                 result_buffer_size=result_buffer_size)
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0', result_columns=[sa.Column('value', sa.Integer)])
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node_1) >> doa_datalayer.create_node(config_node_2)
+    later = datetime.datetime.now() + datetime.timedelta(seconds=120)
+    with doa_datalayer(uri):
+        table = doa_datalayer.table
+        ids = doa_datalayer.add_processes([{}, {}])
+        stalled = doa_datalayer.query_for_work_batch(config_node_1, 2)
+        assert len(stalled) == 2 and stalled[0].lease_token == stalled[1].lease_token
+        assert doa_datalayer.heartbeat() == 2
+        assert doa_datalayer.reap_expired() == (0, 0)
+        assert doa_datalayer.reap_expired(now=later) == (2, 0)
+        assert doa_datalayer.heartbeat() == 0
+        # The outcome of an expired claim is dropped once the process was claimed again.
+        reclaimed = doa_datalayer.query_for_work_batch(config_node_1, 2)
+        assert sorted(c.id_ for c in reclaimed) == ids
+        with doa_datalayer.process(stalled[0]) as result_container:
+            result_container.value = -1
+        doa_datalayer.flush_results()
+        assert doa_datalayer.query_for_work(config_node_2, claim=False) is None
+        with doa_datalayer.process(reclaimed[0]) as result_container:
+            result_container.value = 1
+        doa_datalayer.flush_results()
+        assert doa_datalayer.query_for_work(config_node_2, claim=False).id_ == reclaimed[0].id_
+        # The second expired claim of a node fails the process.
+        assert doa_datalayer.reap_expired(now=later) == (0, 1)
+        rows = {id_: tuple(row) for id_, *row in doa_datalayer._active_session.execute(
+            sa.select([table.c.id, table.c.status, table.c.node_status, table.c.attempts, table.c['1_value']]))}
+        assert rows[reclaimed[0].id_] == ('W', 'SSW', 0, 1)
+        assert rows[reclaimed[1].id_] == ('F', 'SFW', 2, None)
+        assert doa_datalayer.query_for_work(config_node_1, claim=False) is None
+        processing_context = doa_datalayer.query_for_work(config_node_2)
+        assert doa_datalayer.reap_expired(now=later) == (1, 0)
+        assert doa_datalayer.query_for_work(config_node_2).id_ == processing_context.id_
+
+
+@pytest.mark.parametrize('result_buffer_size', [None, 2])
+def test_lease_fusion(tmp_path, result_buffer_size):
+    uri = f'sqlite:///{tmp_path / "lease_fusion.sqlite"}'
+    cfgs = [DOANodeConfig(name=str(i), version='0.0.0') for i in range(1, 3)]
+
+    def build_datalayer():
+        doa_datalayer = DOADataLayer('TestLeaseFusion', lease_duration=60, fuse_nodes=cfgs,
+                                     result_buffer_size=result_buffer_size)
+        with doa_datalayer.dag:
+            doa_datalayer.create_node(cfgs[0]) >> doa_datalayer.create_node(cfgs[1])
+        return doa_datalayer(uri)
+
+    stalled_worker, worker = build_datalayer(), build_datalayer()
+    later = datetime.datetime.now() + datetime.timedelta(seconds=120)
+    with stalled_worker:
+        stalled_worker.add_process()
+        stalled = stalled_worker.query_for_work(cfgs[0])
+        with worker:
+            assert worker.reap_expired(now=later) == (1, 0)
+            reclaimed = worker.query_for_work(cfgs[0])
+            # Only the new owner extends the lease.
+            assert stalled_worker.heartbeat() == 0
+            assert worker.heartbeat() == 1
+        with stalled_worker.process(stalled):
+            pass
+        # The dropped outcome does not claim the downstream node.
+        assert stalled.fused_next is None
+        assert stalled_worker._claimed_leases == {}
+        stalled_worker.flush_results()
+        row = stalled_worker.get_process(stalled.id_)
+        assert (row.node_status, row.lease_token) == ('SRW', reclaimed.lease_token)
+
+
+def test_lease_fusion_buffered(tmp_path):
+    cfgs = [DOANodeConfig(name=str(i), version='0.0.0') for i in range(1, 4)]
+    doa_datalayer = DOADataLayer('TestLeaseFusionBuffered', lease_duration=30, fuse_nodes=True,
+                                 result_buffer_size=3)
+    with doa_datalayer.dag:
+        nodes = [doa_datalayer.create_node(cfg) for cfg in cfgs]
+        nodes[0] >> nodes[1]
+        nodes[1] >> nodes[2]
+    for cfg in cfgs:
+        doa_datalayer.register(cfg)(lambda processing_context, result_container: None)
+    with doa_datalayer(f'sqlite:///{tmp_path / "lease_fusion_buffered.sqlite"}'):
+        ids = doa_datalayer.add_processes({'i': i} for i in range(4))
+        for processing_context in doa_datalayer.query_for_work_batch(cfgs[0], 4):
+            while processing_context is not None:
+                with doa_datalayer.process(processing_context):
+                    pass
+                processing_context = processing_context.fused_next
+        doa_datalayer.flush_results()
+        # The leases of finished processes are not extended anymore.
+        assert doa_datalayer._claimed_leases == {}
+        assert doa_datalayer.heartbeat() == 0
+        assert [doa_datalayer.get_process(id_).node_status for id_ in ids] == ['SSSS'] * 4
+
+
+def test_archive(tmp_path):
+    uri = f'sqlite:///{tmp_path / "archive.sqlite"}'
+    blob_store = FileBlobStore(str(tmp_path / 'blobs'), threshold=100)
+    doa_datalayer = DOADataLayer('TestArchive', archive=True, ready_queue=True, node_timing=True,
+                                 blob_store=blob_store)
+    config_node = DOANodeConfig(name='1', version='0.0.0', result_columns=[sa.Column('value', sa.Text)])
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+    with doa_datalayer(uri):
+        table = doa_datalayer.table
+        ids = doa_datalayer.add_processes({'i': i} for i in range(10))
+        for i, processing_context in enumerate(doa_datalayer.query_for_work_batch(config_node, 7)):
+            with doa_datalayer.process(processing_context) as result_container:
+                if i == 6:
+                    raise ValueError()
+                result_container.value = str(i) * 1000
+        assert doa_datalayer.archive_processes(older_than=datetime.datetime(2000, 1, 1)) == 0
+        assert doa_datalayer.archive_processes(chunk_size=3) == 7
+        count = sa.select([sa.func.count()])
+        assert doa_datalayer._active_session.execute(count.select_from(table)).scalar() == 3
+        processes = doa_datalayer.processes()
+        statuses = dict(doa_datalayer._active_session.execute(sa.select([processes.c.id, processes.c.status])).fetchall())
+        assert sorted(statuses.keys()) == ids
+        assert sorted(statuses.values()) == ['F'] + ['S'] * 6 + ['W'] * 3
+        archived_id = next(id_ for id_, status in statuses.items() if status == 'S')
+        row = doa_datalayer.get_process(archived_id)
+        assert row.status == 'S' and row.finished is not None
+        assert len(doa_datalayer.resolve(row['1_value'])) == 1000
+        assert doa_datalayer.get_process(1000) is None
+        assert doa_datalayer.collect_blobs(grace=0) == 0
+        assert len(node_times(doa_datalayer)) == 7
+        doa_datalayer.delete_processes([archived_id], grace=0)
+        assert doa_datalayer.get_process(archived_id) is None
+        assert len(list(blob_store.digests())) == 5
+        for processing_context in doa_datalayer.query_for_work_batch(config_node, 10):
+            with doa_datalayer.process(processing_context):
+                pass
+        assert doa_datalayer.archive_processes() == 3
+        # The ids of archived processes are not given away again.
+        assert doa_datalayer.add_process() == ids[-1] + 1
+        assert doa_datalayer.add_processes([{}, {}]) == [ids[-1] + 2, ids[-1] + 3]
+    ddl = str(sa.schema.CreateTable(doa_datalayer._archive_table).compile(dialect=postgresql.dialect()))
+    assert ddl.rstrip().endswith('PARTITION BY RANGE (finished)')
+    with pytest.raises(ValueError):
+        DOADataLayer('TestNoArchive').archive_processes()
+
+
+def test_claim_plans(uri='sqlite:///:memory:'):
+    doa_datalayer = DOADataLayer('TestPlans')
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0')
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        node_1 = doa_datalayer.create_node(config_node_1)
+        node_2 = doa_datalayer.create_node(config_node_2)
+
+    with doa_datalayer(uri):
+        doa_datalayer.add_process()
+        plan = doa_datalayer.claim_plan(config_node_2)
+        assert doa_datalayer.claim_plan([config_node_2]) is plan
+        assert doa_datalayer.claim_plan([config_node_1, config_node_2]) is not plan
+        assert doa_datalayer.query_for_work(config_node_2, claim=False) is not None
+        node_1 >> node_2
+        assert doa_datalayer.claim_plan(config_node_2) is not plan
+        assert doa_datalayer.query_for_work(config_node_2) is None
+        with doa_datalayer.process(doa_datalayer.query_for_work(config_node_1)):
+            pass
+        assert doa_datalayer.query_for_work(config_node_2) is not None
+    with pytest.raises(ValueError):
+        doa_datalayer.claim_plan(DOANodeConfig(name='3', version='0.0.0'))
+
+
+def test_result_containers(uri='sqlite:///:memory:'):
+    doa_datalayer = DOADataLayer('TestContainer')
+    config_node = DOANodeConfig(name='1', version='0.0.0',
+                                result_columns=[sa.Column('a', sa.Integer), sa.Column('b', sa.Text)])
+    config_node_empty = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+        doa_datalayer.create_node(config_node_empty)
+    container_cls = doa_datalayer.result_container_class(config_node)
+    assert doa_datalayer.result_container_class(config_node) is container_cls
+    assert issubclass(container_cls, ResultContainer)
+    result_container = container_cls(a=1)
+    assert (result_container.a, result_container.b, result_container.traceback) == (1, None, None)
+    with pytest.raises(AttributeError):
+        result_container.c = 1
+    assert container_cls().a is None
+
+    with doa_datalayer(uri):
+        doa_datalayer.add_processes([{}, {}])
+        for processing_context in doa_datalayer.query_for_work_batch([config_node, config_node_empty], 2):
+            with doa_datalayer.process(processing_context) as result_container:
+                assert type(result_container) is doa_datalayer.result_container_class(processing_context.config)
+                result_container.a = processing_context.id_
+        table = doa_datalayer.table
+        q = sa.select([table.c.id, config_node.col('a', doa_datalayer), config_node.col('b', doa_datalayer)])
+        assert all(id_ == a and b is None for id_, a, b in doa_datalayer._active_session.execute(q))
+
+
+@pytest.mark.parametrize('ready_queue', [False, True])
+def test_node_fusion(ready_queue, uri='sqlite:///:memory:'):
+    cfgs = [DOANodeConfig(name=str(i), version='0.0.0') for i in range(1, 6)]
+    doa_datalayer = DOADataLayer('TestFusion', ready_queue=ready_queue, fuse_nodes=cfgs[1:4])
+    with doa_datalayer.dag:
+        node_1, node_2, node_3, node_4, node_5 = [doa_datalayer.create_node(c) for c in cfgs]
+        node_1 >> node_2
+        node_2 >> node_3
+        node_3 >> node_4
+        node_4 >> node_5
+
+    with doa_datalayer(uri):
+        process_id = doa_datalayer.add_process({'i': 1})
+        processing_context = doa_datalayer.query_for_work(cfgs[0])
+        processed = []
+        while processing_context is not None:
+            with doa_datalayer.process(processing_context):
+                processed.append(processing_context.config.name)
+                # Changes to the context are not stored, so fused nodes do not see them either.
+                assert processing_context.context['i'] == 1
+                processing_context.context['i'] = 2
+                assert doa_datalayer.query_for_work(cfgs, claim=False) is None
+            processing_context = processing_context.fused_next
+        assert processed == ['1', '2', '3', '4']
+        processing_context = doa_datalayer.query_for_work(cfgs)
+        assert (processing_context.config.name, processing_context.process_status) == ('5', 'SSSSSR')
+        with doa_datalayer.process(processing_context):
+            pass
+        assert processing_context.fused_next is None
+        table = doa_datalayer.table
+        q = sa.select([table.c.status, table.c.node_status]).where(table.c.id == process_id)
+        assert doa_datalayer._active_session.execute(q).fetchone() == ('S', 'SSSSSS')
+
+
+def test_add_processes(uri='sqlite:///:memory:'):
+    initial_columns = [sa.Column('tenant', sa.String),
+                       sa.Column('weight', sa.Integer, default=1)]
+    doa_datalayer = DOADataLayer('TestBulk', initial_columns=initial_columns)
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node)
+
+    with doa_datalayer(uri):
+        first_id = doa_datalayer.add_process({'i': -1}, tenant='a')
+        with pytest.raises(ValueError):
+            doa_datalayer.add_processes([{'i': 0}])
+        contexts = ({'i': i} for i in range(10))
+        ids = doa_datalayer.add_processes(contexts, chunk_size=3, tenant='b')
+        assert ids == list(range(first_id + 1, first_id + 11))
+        ids += doa_datalayer.add_processes([({'i': 10}, {'weight': 5}), ({'i': 11}, {'tenant': 'c'})],
+                                           tenant='b')
+        table = doa_datalayer.table
+        rows = doa_datalayer._active_session.execute(
+            sa.select([table.c.id, table.c.context, table.c.tenant, table.c.weight])
+            .where(table.c.id.in_(ids)).order_by(table.c.id)).fetchall()
+        assert [r.id for r in rows] == ids
+        assert [DOADataLayer.context_load(r.context)['i'] for r in rows] == list(range(12))
+        assert [r.tenant for r in rows] == ['b'] * 11 + ['c']
+        assert [r.weight for r in rows] == [1] * 10 + [5, 1]
+        # COPY would store the missing weight as NULL instead of its default.
+        assert not doa_datalayer._copy_processes([{'context': '', 'weight': 5}, {'context': ''}])
+        assert not doa_datalayer._copy_processes([{'context': '', 'priority': 5}, {'context': ''}])
+
+
+def test_buffered_results(tmp_path):
+    uri = f'sqlite:///{tmp_path / "buffered.sqlite"}'
+    doa_datalayer = DOADataLayer('TestBuffer', result_buffer_size=3)
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0',
+                                  result_columns=[sa.Column('value', sa.Integer)])
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        node_1 = doa_datalayer.create_node(config_node_1)
+        node_2 = doa_datalayer.create_node(config_node_2)
+        node_1 >> node_2
+
+    def statuses(doa_datalayer):
+        table = doa_datalayer._table
+        q = sa.select([table.c.status, table.c.awaited_events])
+        return sorted(tuple(r) for r in doa_datalayer._active_session.execute(q))
+
+    with doa_datalayer(uri):
+        doa_datalayer.add_processes([{}] * 4)
+        for i in range(2):
+            with doa_datalayer.process(doa_datalayer.query_for_work(config_node_1)) as result_container:
+                result_container.value = i
+        assert statuses(doa_datalayer) == [('R', '')] * 2 + [('W', '')] * 2
+        with doa_datalayer.process(doa_datalayer.query_for_work(config_node_1)) as result_container:
+            raise Paused('event')
+        assert statuses(doa_datalayer) == [('P', '<event>')] + [('W', '')] * 3
+        with doa_datalayer.process(doa_datalayer.query_for_work(config_node_1)) as result_container:
+            raise ValueError()
+    with doa_datalayer(uri):
+        assert statuses(doa_datalayer) == [('F', ''), ('P', '<event>')] + [('W', '')] * 2
+        doa_datalayer.call_out_event('event')
+        assert statuses(doa_datalayer) == [('F', '')] + [('W', '')] * 3
+
+
+def test_indexes(tmp_path):
+    uri = f'sqlite:///{tmp_path / "indexes.sqlite"}'
+    engine = sa.create_engine(uri)
+
+    def build_datalayer():
+        doa_datalayer = DOADataLayer('TestIndex')
+        with doa_datalayer.dag:
+            doa_datalayer.create_node(DOANodeConfig(name='1', version='0.0.0'))
+        return doa_datalayer(engine)
+
+    def index_sql():
+        q = "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'TestIndex'"
+        return dict(engine.execute(q).fetchall())
+
+    build_datalayer()
+    indexes = index_sql()
+    assert set(indexes.keys()) == {'ix_TestIndex_status_updated_time', 'ix_TestIndex_waiting', 'ix_TestIndex_paused'}
+    for name in indexes.keys():
+        engine.execute(f'DROP INDEX "{name}"')
+    doa_datalayer = build_datalayer()
+    assert index_sql() == {}
+    doa_datalayer.create_indexes()
+    assert index_sql() == indexes
+    assert indexes['ix_TestIndex_waiting'].endswith("WHERE status = 'W'")
+    doa_datalayer.create_indexes()
+    index = [i for i in doa_datalayer.table.indexes if i.name == 'ix_TestIndex_paused'][0]
+    ddl = str(sa.schema.CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert ddl.endswith("WHERE status = 'P'")
+
+
+@pytest.mark.parametrize('result_buffer_size', [None, 2])
+def test_ready_queue(tmp_path, result_buffer_size):
+    uri = f'sqlite:///{tmp_path / "ready.sqlite"}'
+    doa_datalayer = DOADataLayer('TestReady', ready_queue=True, result_buffer_size=result_buffer_size)
+    cfgs = [DOANodeConfig(name=name, version='0.0.0') for name in 'abcd']
+    with doa_datalayer.dag:
+        node_a, node_b, node_c, node_d = [doa_datalayer.create_node(c) for c in cfgs]
+        node_a >> node_b
+        node_a >> node_c
+        node_b >> node_d
+        node_c >> node_d
+
+    def ready_rows(doa_datalayer):
+        ready_table = doa_datalayer._ready_table
+        q = sa.select([ready_table.c.id, ready_table.c.node])
+        return sorted((id_, doa_datalayer.update_enum(node).name) for id_, node in doa_datalayer._active_session.execute(q))
+
+    with doa_datalayer(uri):
+        id_1 = doa_datalayer.add_process()
+        id_2, id_3 = doa_datalayer.add_processes([{}, {}])
+        assert ready_rows(doa_datalayer) == [(id_1, 'A'), (id_2, 'A'), (id_3, 'A')]
+        assert doa_datalayer.query_for_work(cfgs[1:]) is None
+        processing_contexts = doa_datalayer.query_for_work_batch(cfgs, 3)
+        assert ready_rows(doa_datalayer) == []
+        for processing_context, interrupt in zip(processing_contexts, [None, Paused('e', retry=True), ValueError()]):
+            with doa_datalayer.process(processing_context):
+                if interrupt is not None:
+                    raise interrupt
+        doa_datalayer.flush_results()
+        ids = [p.id_ for p in processing_contexts]
+        assert ready_rows(doa_datalayer) == sorted([(ids[0], 'B'), (ids[0], 'C'), (ids[1], 'A')])
+        # Processes added while the ready queue was disabled are backfilled.
+        doa_datalayer._active_session.execute(sa.delete(doa_datalayer._ready_table))
+        doa_datalayer.sync_ready_queue()
+        assert ready_rows(doa_datalayer) == sorted([(ids[0], 'B'), (ids[0], 'C'), (ids[1], 'A')])
+        doa_datalayer.call_out_event('e')
+        while True:
+            processing_context = doa_datalayer.query_for_work(cfgs)
+            if processing_context is None:
+                break
+            with doa_datalayer.process(processing_context):
+                pass
+        doa_datalayer.flush_results()
+        assert ready_rows(doa_datalayer) == []
+        table = doa_datalayer._table
+        q = sa.select([table.c.id, table.c.status, table.c.node_status]).order_by(table.c.id)
+        statuses = {id_: (status, node_status) for id_, status, node_status in doa_datalayer._active_session.execute(q)}
+        assert statuses == {ids[0]: ('S', 'SSSSS'), ids[1]: ('S', 'SSSSS'), ids[2]: ('F', 'SFWWW')}
+
+
 if __name__ == '__main__':
     #test_doa_dag_build('sqlite:///test.sqlite')
     test_await_events('sqlite:///test.sqlite')
\ No newline at end of file
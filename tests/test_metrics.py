@@ -0,0 +1,66 @@
+import json
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, Paused, CompareAndSwapClaim
+from doa_pipeline.metrics import Histogram, MetricsCollector
+
+
+class RacingClaim(CompareAndSwapClaim):
+    """Claims the first candidate before the others, so its second claim is lost like against a different worker."""
+
+    def claim(self, datalayer, candidates):
+        super().claim(datalayer, candidates[:1])
+        return super().claim(datalayer, candidates)
+
+
+def test_histogram():
+    histogram = Histogram([1., 2., float('inf')])
+    for value in [0.5, 1., 1.5, 3.]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.sum == 6.
+    assert histogram.quantile(0.5) == 1.
+    assert histogram.quantile(0.75) == 2.
+
+
+def test_metrics_collector(uri='sqlite:///:memory:'):
+    metrics = MetricsCollector()
+    doa_datalayer = DOADataLayer('TestMetrics', observers=[metrics], claim_strategy=RacingClaim())
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0')
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node_1) >> doa_datalayer.create_node(config_node_2)
+    with doa_datalayer(uri):
+        doa_datalayer.add_processes([{}] * 4)
+        processing_contexts = doa_datalayer.query_for_work_batch(config_node_1, 4)
+        assert len(processing_contexts) == 3
+        for i, processing_context in enumerate(processing_contexts):
+            with doa_datalayer.process(processing_context):
+                if i == 1:
+                    raise Paused(awaited_event='go')
+                if i == 2:
+                    raise ValueError()
+        doa_datalayer.call_out_events(['go', 'other'])
+        assert doa_datalayer.query_for_work([config_node_2, config_node_1], claim=False) is not None
+
+    counters = {name: {dict(labels).get('node'): value for labels, value in values.items()}
+                for name, values in metrics.counters.items()}
+    assert counters['polls_total'] == {'1': 1, '2,1': 1}
+    assert counters['claims_total'] == {'1': 3}
+    assert counters['claim_conflicts_total'] == {'1': 1}
+    assert counters['stored_total'] == {'1': 1}
+    assert counters['pauses_total'] == {'1': 1}
+    assert counters['crashes_total'] == {'1': 1}
+    assert counters['events_total'] == {None: 2}
+    assert counters['resumed_total'] == {None: 1}
+    outcomes = {dict(labels)['outcome']: h.count for labels, h in metrics.histograms['node_duration_seconds'].items()}
+    assert outcomes == {'success': 1, 'pause': 1, 'crash': 1}
+
+    text = metrics.to_prometheus()
+    assert '# TYPE doa_claims_total counter' in text
+    assert 'doa_claims_total{node="1"} 3' in text
+    assert 'doa_node_duration_seconds_bucket{node="1",outcome="crash",le="+Inf"} 1' in text
+    assert 'doa_poll_duration_seconds_count{node="2,1"} 1' in text
+    snapshot = json.loads(metrics.to_json())
+    assert snapshot['counters']['claims_total'] == [{'labels': {'node': '1'}, 'value': 3}]
+    metrics.reset()
+    assert metrics.snapshot()['counters']['claims_total'] == []
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+from doa_pipeline.notify import ConditionChannel, LocalSocketChannel
+
+
+@pytest.mark.parametrize('channel_type', ['condition', 'socket'])
+def test_channels(tmp_path, channel_type):
+    if channel_type == 'condition':
+        channel = ConditionChannel()
+    else:
+        channel = LocalSocketChannel(str(tmp_path / 'channel'))
+    subscriptions = [channel.subscribe() for _ in range(2)]
+    assert not subscriptions[0].wait(0.01)
+    channel.publish(['add'])
+    channel.publish(['store'])
+    assert all(s.wait(1) for s in subscriptions)
+    assert not any(s.wait(0.01) for s in subscriptions)
+    threading.Timer(0.05, channel.publish, args=(['event'], )).start()
+    start = time.monotonic()
+    assert subscriptions[0].wait(5)
+    assert time.monotonic() - start < 1
+    assert subscriptions[1].wait(1)
+    threading.Timer(0.05, subscriptions[1].interrupt).start()
+    start = time.monotonic()
+    assert not subscriptions[1].wait(5)
+    assert time.monotonic() - start < 1
+    channel.publish(['add'])
+    assert not subscriptions[1].wait(5)
+    for s in subscriptions:
+        s.close()
+
+
+def test_wait_for_work(tmp_path):
+    uri = f'sqlite:///{tmp_path / "notify.sqlite"}'
+    channel = ConditionChannel()
+    config_node = DOANodeConfig(name='1', version='0.0.0')
+
+    def build_datalayer():
+        doa_datalayer = DOADataLayer('TestNotify', notifier=channel)
+        with doa_datalayer.dag:
+            doa_datalayer.create_node(DOANodeConfig(name='1', version='0.0.0'))
+        return doa_datalayer(uri)
+
+    producer, consumer = build_datalayer(), build_datalayer()
+    with consumer:
+        assert consumer.wait_for_work(config_node, timeout=0.01) == []
+
+        def produce():
+            with producer:
+                producer.add_process({'i': 1})
+
+        threading.Timer(0.05, produce).start()
+        start = time.monotonic()
+        results = consumer.wait_for_work(config_node, timeout=5)
+        assert time.monotonic() - start < 1
+        assert [p.context for p in results] == [{'i': 1}]
+    producer.notifier = None
+    with producer:
+        with pytest.raises(ValueError):
+            producer.wait_for_work(config_node, timeout=0.01)
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig, Paused
+from doa_pipeline.timing import critical_path, node_time_stats, node_times
+
+
+@pytest.mark.parametrize('result_buffer_size', [None, 3])
+def test_node_timing(tmp_path, result_buffer_size):
+    uri = f'sqlite:///{tmp_path / "timing.sqlite"}'
+    doa_datalayer = DOADataLayer('TestTiming', node_timing=True, result_buffer_size=result_buffer_size)
+    config_nodes = {name: DOANodeConfig(name=name, version='0.0.0') for name in ['a', 'b', 'c', 'd']}
+    sleep = {'a': 0.01, 'b': 0.05, 'c': 0.001, 'd': 0.001}
+    with doa_datalayer.dag:
+        a, b, c, d = [doa_datalayer.create_node(c) for c in config_nodes.values()]
+        a >> b
+        a >> c
+        b >> d
+        c >> d
+    with doa_datalayer(uri):
+        ids = doa_datalayer.add_processes([{}] * 3)
+        paused = False
+        for name in ['a', 'c', 'b', 'd']:
+            for processing_context in doa_datalayer.query_for_work_batch(config_nodes[name], 3):
+                with doa_datalayer.process(processing_context):
+                    time.sleep(sleep[name])
+                    if name == 'b' and not paused:
+                        paused = True
+                        raise Paused(retry=True)
+            doa_datalayer.flush_results()
+        doa_datalayer.resume()
+        for processing_context in doa_datalayer.query_for_work_batch(config_nodes['b'], 3):
+            with doa_datalayer.process(processing_context):
+                pass
+        doa_datalayer.flush_results()
+        for processing_context in doa_datalayer.query_for_work_batch(config_nodes['d'], 3):
+            with doa_datalayer.process(processing_context):
+                pass
+        doa_datalayer.flush_results()
+
+        timings = node_times(doa_datalayer)
+        assert sorted(timings.keys()) == ids
+        for process_timings in timings.values():
+            assert sorted(process_timings.keys()) == ['a', 'b', 'c', 'd']
+            assert process_timings['d']['ready'] == max(process_timings['b']['finished'],
+                                                        process_timings['c']['finished'])
+            assert process_timings['a']['duration'] >= 0.01
+        assert sum(timings[id_]['b']['queue_wait'] > timings[id_]['c']['queue_wait'] for id_ in ids) >= 1
+
+        stats = node_time_stats(doa_datalayer)
+        assert stats['a']['count'] == 3
+        assert stats['b']['duration']['p50'] >= 0.
+        assert stats['a']['duration']['mean'] >= 0.01
+
+        path = critical_path(doa_datalayer)
+        assert path['nodes'][0] == 'a' and path['nodes'][-1] == 'd'
+        assert path['length'] == pytest.approx(sum(s['queue_wait'] + s['duration'] for s in path['steps']))
+        assert critical_path(doa_datalayer, ids[0])['nodes'][0] == 'a'
+        with pytest.raises(ValueError):
+            critical_path(doa_datalayer, 1000)
+        doa_datalayer.delete_processes(ids[:1])
+        assert sorted(node_times(doa_datalayer).keys()) == ids[1:]
+    with pytest.raises(ValueError):
+        node_times(DOADataLayer('TestNoTiming'))
+
+
+@pytest.mark.parametrize('tz', ['UTC0', 'EST+05', 'JST-09'])
+def test_root_queue_wait(tmp_path, monkeypatch, tz):
+    monkeypatch.setenv('TZ', tz)
+    time.tzset()
+    try:
+        doa_datalayer = DOADataLayer('TestRootQueueWait', node_timing=True)
+        config_node = DOANodeConfig(name='a', version='0.0.0')
+        with doa_datalayer.dag:
+            doa_datalayer.create_node(config_node)
+        with doa_datalayer(f'sqlite:///{tmp_path / "root_queue_wait.sqlite"}'):
+            id_1 = doa_datalayer.add_process()
+            id_2, = doa_datalayer.add_processes([{}])
+            time.sleep(0.05)
+            for processing_context in doa_datalayer.query_for_work_batch(config_node, 2):
+                with doa_datalayer.process(processing_context):
+                    pass
+            timings = node_times(doa_datalayer)
+        for id_ in [id_1, id_2]:
+            assert 0.05 <= timings[id_]['a']['queue_wait'] < 5
+    finally:
+        monkeypatch.undo()
+        time.tzset()
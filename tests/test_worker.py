@@ -0,0 +1,128 @@
+import inspect
+import multiprocessing
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+import sqlalchemy as sa
+
+from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig
+from doa_pipeline.metrics import Observer
+from doa_pipeline.notify import ConditionChannel
+from doa_pipeline import worker
+
+
+def build_datalayer(fuse_nodes=False, lease_duration=None):
+    doa_datalayer = DOADataLayer('TestWorker', fuse_nodes=fuse_nodes, lease_duration=lease_duration)
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0', result_columns=[sa.Column('value', sa.Integer)])
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0', result_columns=[sa.Column('value', sa.Integer)])
+    with doa_datalayer.dag:
+        node_1 = doa_datalayer.create_node(config_node_1)
+        node_2 = doa_datalayer.create_node(config_node_2)
+        node_1 >> node_2
+
+    @doa_datalayer.register(config_node_1, concurrency=1)
+    def square(processing_context, result_container):
+        result_container.value = processing_context.context['i'] ** 2
+
+    @doa_datalayer.register(config_node_2)
+    def fail_odd(processing_context, result_container):
+        if processing_context.context['i'] % 2:
+            raise ValueError()
+        result_container.value = -processing_context.context['i']
+
+    return doa_datalayer
+
+
+def check_results(uri, n):
+    engine = sa.create_engine(uri)
+    q = 'SELECT id, status, "1_value", "2_value" FROM "TestWorker" ORDER BY id'
+    rows = engine.execute(q).fetchall()
+    assert len(rows) == n
+    for i, (_, status, value_1, value_2) in enumerate(rows):
+        assert value_1 == i ** 2
+        if i % 2:
+            assert (status, value_2) == ('F', None)
+        else:
+            assert (status, value_2) == ('S', -i)
+
+
+@pytest.mark.parametrize('fuse_nodes, lease_duration', [(False, None), (True, None), (False, 0.5)])
+def test_worker(tmp_path, fuse_nodes, lease_duration):
+    uri = f'sqlite:///{tmp_path / "worker.sqlite"}'
+    doa_datalayer = build_datalayer(fuse_nodes, lease_duration)
+    with doa_datalayer(uri):
+        doa_datalayer.add_processes({'i': i} for i in range(20))
+    with pytest.raises(ValueError):
+        doa_datalayer.register(DOANodeConfig(name='3', version='0.0.0'))
+    exitcodes = worker.Worker(doa_datalayer, processes=2, batch_size=4, poll_interval=0.01,
+                              stop_when_idle=True, engine_kwargs={'connect_args': {'timeout': 30}}).run()
+    assert exitcodes == [0, 0]
+    check_results(uri, 20)
+
+
+def test_fused_node_checks(tmp_path):
+    config_node_1 = DOANodeConfig(name='1', version='0.0.0')
+    config_node_2 = DOANodeConfig(name='2', version='0.0.0')
+    doa_datalayer = DOADataLayer('TestFusedChecks', fuse_nodes=[config_node_2])
+    with doa_datalayer.dag:
+        doa_datalayer.create_node(config_node_1) >> doa_datalayer.create_node(config_node_2)
+    doa_datalayer.register(config_node_1, lambda *_: None, concurrency=1)
+    with pytest.raises(ValueError):
+        doa_datalayer.register(config_node_2, lambda *_: None, concurrency=1)
+    with pytest.raises(ValueError):
+        worker.Worker(doa_datalayer, engine=f'sqlite:///{tmp_path / "fused_checks.sqlite"}')
+    doa_datalayer.register(config_node_2, lambda *_: None)
+    worker.Worker(doa_datalayer, engine=f'sqlite:///{tmp_path / "fused_checks.sqlite"}')
+
+
+def test_idle_worker(tmp_path):
+    class PollCounter(Observer):
+        polls = 0
+
+        def on_poll(self, node_names, n, returned, duration):
+            PollCounter.polls += 1
+
+    doa_datalayer = build_datalayer()
+    doa_datalayer.notifier = ConditionChannel()
+    doa_datalayer.observers.append(PollCounter())
+    doa_datalayer(f'sqlite:///{tmp_path / "idle_worker.sqlite"}')
+    stop_event = threading.Event()
+    node_functions = doa_datalayer.node_functions
+    threading.Thread(target=worker._interrupt_on_stop, args=(doa_datalayer._subscription(), stop_event),
+                     daemon=True).start()
+    semaphores = {'1': multiprocessing.BoundedSemaphore(1)}
+    thread = threading.Thread(target=worker._work, args=(doa_datalayer, node_functions, semaphores, stop_event,
+                                                         1, 0.01, False, 60.))
+    thread.start()
+    time.sleep(0.3)
+    # Waiting for notifications instead of querying every poll_interval.
+    assert PollCounter.polls == 1
+    # No concurrency slots are held while waiting.
+    assert semaphores['1'].acquire(block=False)
+    semaphores['1'].release()
+    start = time.monotonic()
+    stop_event.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 1
+
+
+def test_worker_cli(tmp_path, monkeypatch):
+    uri = f'sqlite:///{tmp_path / "worker_cli.sqlite"}'
+    source = 'import sqlalchemy as sa\n' \
+        'from doa_pipeline.doa_pipeline import DOADataLayer, DOANodeConfig\n\n\n' \
+        + inspect.getsource(build_datalayer) + textwrap.dedent(f'''
+
+        doa_datalayer = build_datalayer()
+        with doa_datalayer({uri!r}):
+            doa_datalayer.add_processes({{'i': i}} for i in range(6))
+    ''')
+    (tmp_path / 'worker_cli_pipeline.py').write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    assert worker.main(['worker_cli_pipeline:doa_datalayer', '--processes', '1',
+                        '--poll-interval', '0.01', '--stop-when-idle']) == 0
+    check_results(uri, 6)
+    sys.modules.pop('worker_cli_pipeline')